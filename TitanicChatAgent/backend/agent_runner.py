@@ -0,0 +1,85 @@
+"""
+Shared, bounded execution of agent calls off the event loop.
+
+One runner is created for the whole app. It caps how many agent calls run
+at once and how many may wait for a slot; anything beyond that is rejected
+immediately so the caller can return 503 instead of piling up requests.
+Timeouts cancel the awaiting coroutine, so the event loop is freed even if
+the provider is slow.
+"""
+import asyncio
+import concurrent.futures
+from functools import partial
+
+
+class AgentQueueFullError(Exception):
+    """Raised when the runner is at max concurrency and its queue is full."""
+
+
+class AgentRunner:
+    """Runs agent invocations with bounded concurrency, queue depth and timeout."""
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 16,
+                 timeout: float = 30, mode: str = "async"):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.mode = mode
+        self.running = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Only used in "thread" mode, for agents without a working ainvoke
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="agent"
+        )
+
+    def has_capacity(self) -> bool:
+        return self.running + self.queued < self.max_concurrency + self.max_queue
+
+    async def run(self, agent, question: str, config: dict = None):
+        """
+        Invoke the agent, waiting for a free slot if needed.
+        Raises AgentQueueFullError when over capacity and asyncio.TimeoutError
+        when the call exceeds the timeout.
+        """
+        if not self.has_capacity():
+            self.rejected += 1
+            raise AgentQueueFullError("Agent queue is full")
+
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            return await asyncio.wait_for(self._invoke(agent, question, config), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    async def _invoke(self, agent, question: str, config: dict = None):
+        if self.mode == "async":
+            return await agent.ainvoke(question, config=config)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(agent.invoke, question, config=config))
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,372 @@
+"""
+Answer cache keyed on a normalized form of the question.
+
+"Male percentage?" and "How many men?" normalize to the same key, so a
+paraphrase of an earlier question is served without another agent run.
+The cache is bounded (LRU), entries expire after a TTL, and it can
+optionally persist to a JSON-lines file so it survives restarts: each set()
+appends one line, and the file is compacted once it holds twice as many
+lines as the cache has room for. SharedAnswerCache
+keeps the entries in SQLite instead, so several worker processes share them.
+"""
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Optional
+
+
+# Phrases mapped onto dataset column names (and column=value pairs).
+# Checked as one alternation, so earlier entries win at the same position.
+SYNONYMS = [
+    (r"how many|number of|counts?|percentages?|percent|proportion|share|distribution|breakdown|split", "count"),
+    (r"average|mean|avg", "mean"),
+    (r"ticket prices?|ticket fares?|tickets?|prices?|costs?|fares?|paid|pay", "fare"),
+    (r"non survivors?|died|perished|did not survive|didn't survive", "survived=0"),
+    (r"surviv\w*|alive|made it", "survived"),
+    (r"genders?|sex(?:es)?", "sex"),
+    (r"females?|women|woman|girls?|ladies", "sex=female"),
+    (r"males?|men|man|boys?|gentlemen", "sex=male"),
+    (r"first class|1st class|upper class", "pclass=1"),
+    (r"second class|2nd class|middle class", "pclass=2"),
+    (r"third class|3rd class|lower class", "pclass=3"),
+    (r"passenger class(?:es)?|ticket class(?:es)?|class(?:es)?|pclass", "pclass"),
+    (r"embarkation ports?|ports?|embark\w*", "embarked"),
+    (r"ages?|old", "age"),
+    (r"child(?:ren)?|kids?", "who=child"),
+    (r"siblings?|spouses?", "sibsp"),
+    (r"parents?", "parch"),
+]
+
+SYNONYM_PATTERN = re.compile(
+    "|".join(rf"(?P<g{i}>\b(?:{pattern})\b)" for i, (pattern, _) in enumerate(SYNONYMS))
+)
+
+STOPWORDS = {
+    "a", "an", "the", "of", "on", "in", "at", "to", "for", "from", "and", "or",
+    "with", "what", "was", "were", "is", "are", "be", "been", "did", "do",
+    "does", "how", "me", "show", "give", "tell", "please", "can", "could",
+    "you", "i", "want", "know", "passengers", "passenger", "people",
+    "titanic", "dataset", "data", "board", "aboard", "onboard", "overall",
+    "there", "it", "s", "about", "this", "that", "these", "those", "their",
+    "all", "whole", "entire", "by", "per", "each", "total", "rate", "rates",
+    "much", "many", "had", "has", "have", "some", "let", "see", "get",
+    "vs", "versus", "compare", "between", "which", "who",
+}
+
+
+def normalize_question(question: str) -> str:
+    """
+    Reduce a question to a canonical key: lowercase, strip punctuation,
+    map synonyms onto column names, drop stopwords, sort unique tokens.
+    """
+    text = re.sub(r"[^\w\s']", " ", question.lower())
+    text = SYNONYM_PATTERN.sub(lambda m: f" {SYNONYMS[int(m.lastgroup[1:])][1]} ", text)
+    tokens = {token for token in text.replace("'", " ").split() if token not in STOPWORDS}
+    return " ".join(sorted(tokens))
+
+
+def _trigrams(text: str) -> Counter:
+    padded = f"  {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    dot = sum(count * b.get(gram, 0) for gram, count in a.items())
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def _value_tokens(key: str) -> set:
+    """column=value tokens; these must match exactly for a similarity hit."""
+    return {token for token in key.split() if "=" in token}
+
+
+class AnswerCache:
+    """Bounded LRU + TTL cache of answers keyed on normalized questions."""
+
+    def __init__(self, max_size: int = 512, ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.0, path: Optional[str] = None,
+                 clock: Callable = time.time):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._log_lines = 0  # Lines in the on-disk store, including superseded ones
+        if path:
+            self._load()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    @staticmethod
+    def _key(question: str, namespace: str) -> str:
+        """Cache key; the namespace keeps answers for different datasets apart."""
+        normalized = normalize_question(question)
+        if not normalized:
+            return ""
+        return f"{namespace}|{normalized}" if namespace else normalized
+
+    def _find_similar(self, key: str, namespace: str, now: float, threshold: Optional[float] = None,
+                      include_expired: bool = False) -> Optional[str]:
+        """Closest cached key in the namespace by character trigram cosine, above the threshold."""
+        threshold = self.similarity_threshold if threshold is None else threshold
+        if not threshold or not key:
+            return None
+        prefix = f"{namespace}|" if namespace else ""
+        body = key[len(prefix):]
+        grams = _trigrams(body)
+        values = _value_tokens(body)
+        best_key, best_score = None, threshold
+        for candidate, created_at in self._candidates(prefix):
+            if prefix and not candidate.startswith(prefix):
+                continue
+            if not prefix and "|" in candidate:
+                continue
+            candidate_body = candidate[len(prefix):]
+            if (self._expired(created_at, now) and not include_expired) or _value_tokens(candidate_body) != values:
+                continue
+            score = _cosine(grams, _trigrams(candidate_body))
+            if score >= best_score:
+                best_key, best_score = candidate, score
+        return best_key
+
+    def _candidates(self, prefix: str):
+        """(key, created_at) of the entries a similarity lookup may match."""
+        return ((key, created_at) for key, (created_at, _) in self._entries.items())
+
+    def get(self, question: str, namespace: str = "") -> Optional[dict]:
+        """Return the cached value for a question (or a close paraphrase)."""
+        key = self._key(question, namespace)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0], now):
+                entry = None  # Kept for get_stale() until evicted or replaced
+            if entry is None:
+                similar = self._find_similar(key, namespace, now)
+                if similar is not None:
+                    key, entry = similar, self._entries[similar]
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_stale(self, question: str, namespace: str = "", similarity_threshold: float = 0.6) -> Optional[dict]:
+        """
+        Fallback lookup when the LLM cannot be used: accepts expired entries
+        and close paraphrases. Not counted as a hit or miss.
+        """
+        key = self._key(question, namespace)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                similar = self._find_similar(key, namespace, self._clock(), similarity_threshold, include_expired=True)
+                entry = self._entries[similar] if similar is not None else None
+            return entry[1] if entry is not None else None
+
+    def set(self, question: str, value: dict, namespace: str = ""):
+        """Store a value, evicting the least recently used entries if full."""
+        key = self._key(question, namespace)
+        if not key:
+            return
+        with self._lock:
+            created_at = self._clock()
+            self._entries[key] = (created_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if self.path:
+                self._append([key, created_at, value])
+
+    def clear(self, namespace: str = None):
+        """Drop every entry, or only those of one namespace."""
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+            else:
+                prefix = f"{namespace}|" if namespace else None
+                for key in [k for k in self._entries if (k.startswith(prefix) if prefix else "|" not in k)]:
+                    del self._entries[key]
+            if self.path:
+                self._compact()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _load(self):
+        """Replay the on-disk store, if present, keeping unexpired entries."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        now = self._clock()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash mid-append
+            # Files written before the JSON-lines format hold one {"entries": [...]} object
+            records = record.get("entries", []) if isinstance(record, dict) else [record]
+            for key, created_at, value in records:
+                self._entries[key] = (created_at, value)
+                self._entries.move_to_end(key)
+        for key in [k for k, (created_at, _) in self._entries.items() if self._expired(created_at, now)]:
+            del self._entries[key]
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self._log_lines = len(lines)
+
+    def _append(self, record: list):
+        """Append one entry to the on-disk store, compacting it once it has grown."""
+        if self._log_lines >= 2 * max(self.max_size, 1):
+            self._compact()
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            self._log_lines += 1
+        except OSError as e:
+            print(f"⚠️ Could not persist answer cache: {e}")
+
+    def _compact(self):
+        """Atomically rewrite the on-disk store with only the current entries."""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for key, (created_at, value) in self._entries.items():
+                    f.write(json.dumps([key, created_at, value]) + "\n")
+            os.replace(tmp_path, self.path)
+            self._log_lines = len(self._entries)
+        except OSError as e:
+            print(f"⚠️ Could not persist answer cache: {e}")
+
+
+class SharedAnswerCache(AnswerCache):
+    """
+    AnswerCache kept in a SQLite file that several worker processes open at
+    once. WAL mode lets readers run while another process writes, so one
+    worker's agent answer is a cache hit for all the others.
+    """
+
+    def __init__(self, path: str, max_size: int = 512, ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.0, clock: Callable = time.time):
+        super().__init__(max_size, ttl_seconds, similarity_threshold, clock=clock)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY, created_at REAL NOT NULL, last_used REAL NOT NULL, value TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+    def _candidates(self, prefix: str):
+        return self._db.execute("SELECT key, created_at FROM answers WHERE substr(key, 1, ?) = ?",
+                                (len(prefix), prefix)).fetchall()
+
+    def _row(self, key: str) -> Optional[tuple]:
+        row = self._db.execute("SELECT created_at, value FROM answers WHERE key = ?", (key,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def get(self, question: str, namespace: str = "") -> Optional[dict]:
+        key = self._key(question, namespace)
+        now = self._clock()
+        with self._lock:
+            entry = self._row(key) if key else None
+            if entry is not None and self._expired(entry[0], now):
+                entry = None
+            if entry is None:
+                similar = self._find_similar(key, namespace, now)
+                if similar is not None:
+                    key, entry = similar, self._row(similar)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+            return entry[1]
+
+    def get_stale(self, question: str, namespace: str = "", similarity_threshold: float = 0.6) -> Optional[dict]:
+        key = self._key(question, namespace)
+        with self._lock:
+            entry = self._row(key) if key else None
+            if entry is None:
+                similar = self._find_similar(key, namespace, self._clock(), similarity_threshold, include_expired=True)
+                entry = self._row(similar) if similar is not None else None
+            return entry[1] if entry is not None else None
+
+    def set(self, question: str, value: dict, namespace: str = ""):
+        key = self._key(question, namespace)
+        if not key:
+            return
+        now = self._clock()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO answers (key, created_at, last_used, value) VALUES (?, ?, ?, ?)",
+                             (key, now, now, json.dumps(value)))
+            size = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if size > self.max_size:
+                self.evictions += self._db.execute(
+                    "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used LIMIT ?)",
+                    (size - self.max_size,)
+                ).rowcount
+            self._db.commit()
+
+    def clear(self, namespace: str = None):
+        with self._lock:
+            if namespace is None:
+                self._db.execute("DELETE FROM answers")
+            elif namespace:
+                prefix = f"{namespace}|"
+                self._db.execute("DELETE FROM answers WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            else:
+                self._db.execute("DELETE FROM answers WHERE instr(key, '|') = 0")
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,  # This worker's lookups
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "shared_path": self.path,
+        }
+
+
+def open_answer_cache(path: Optional[str] = None, **options) -> AnswerCache:
+    """A SharedAnswerCache for .sqlite/.db paths, otherwise an in-memory cache (persisted to JSON if path is set)."""
+    if path and path.endswith((".sqlite", ".db")):
+        return SharedAnswerCache(path, **options)
+    return AnswerCache(path=path, **options)
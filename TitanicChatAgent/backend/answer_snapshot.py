@@ -0,0 +1,156 @@
+"""
+Precomputed answers for the questions most first visits start with.
+
+At deploy time, answer the sidebar's example questions and the overview
+questions once through the normal query path, and write the answers with
+their charts to a JSON snapshot stamped with a format version and the
+checksum of the dataset they were computed on:
+
+    python answer_snapshot.py
+    python answer_snapshot.py --questions questions.txt --output ../data/answer_snapshot.json
+
+main.py loads the snapshot at startup (a few milliseconds) and serves those
+questions, and anything that normalizes to the same key, from it before the
+fast path, the caches or the agent. A snapshot written by another format
+version or for another dataset is ignored. Agent answers are only kept if
+the answer cache accepted them, so failures and refusals are never stored.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from answer_cache import normalize_question
+
+
+SNAPSHOT_VERSION = 1
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.path.join(BACKEND_DIR, "..", "data", "answer_snapshot.json")
+# The sidebar's example questions (frontend/app.py) and the overview and
+# survival comparisons the system prompt describes
+DEFAULT_QUESTIONS = [
+    "What was the overall survival rate?",
+    "Show me a histogram of passenger ages",
+    "What was the average ticket fare?",
+    "Compare survival rates by gender",
+    "How many passengers were in each class?",
+    "Show me the distribution of embarkation ports",
+    "What percentage of passengers were male?",
+    "Who paid the most expensive ticket?",
+    "Give me a dataset overview",
+    "What was the average age of survivors vs non-survivors?",
+    "Give me a summary of the dataset",
+    "What was the survival rate by gender?",
+    "What was the survival rate by class?",
+]
+# Paths whose answers may be replayed; guard refusals and budget fallbacks may not
+SNAPSHOT_SOURCES = {"fast_path", "cache", "code_cache", "agent"}
+
+
+class AnswerSnapshot:
+    """Answers and their visualizations keyed by normalized question, for one dataset checksum."""
+
+    def __init__(self, checksum: str, answers: Optional[dict] = None, created_at: Optional[str] = None):
+        self.checksum = checksum
+        self.answers = answers or {}
+        self.created_at = created_at or datetime.now(timezone.utc).isoformat()
+        self.load_seconds = None
+        self.hits = 0
+
+    def get(self, question: str) -> Optional[dict]:
+        entry = self.answers.get(normalize_question(question))
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+    def add(self, question: str, answer: str, visualization: Optional[dict], source: str):
+        self.answers[normalize_question(question)] = {
+            "question": question, "answer": answer, "visualization": visualization, "source": source
+        }
+
+    def save(self, path: str):
+        data = {"version": SNAPSHOT_VERSION, "dataset_checksum": self.checksum,
+                "created_at": self.created_at, "answers": self.answers}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, checksum: str) -> Optional["AnswerSnapshot"]:
+        """The snapshot at `path` if it matches this format version and dataset checksum."""
+        start = time.perf_counter()
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring answer snapshot {path}: {e}")
+            return None
+        if data.get("version") != SNAPSHOT_VERSION:
+            print(f"⚠️ Ignoring answer snapshot {path}: format version {data.get('version')}, expected {SNAPSHOT_VERSION}")
+            return None
+        if data.get("dataset_checksum") != checksum:
+            print(f"⚠️ Ignoring answer snapshot {path}: computed on a different dataset")
+            return None
+        snapshot = cls(checksum, data.get("answers", {}), data.get("created_at"))
+        snapshot.load_seconds = time.perf_counter() - start
+        return snapshot
+
+    def stats(self) -> dict:
+        return {
+            "questions": len(self.answers),
+            "hits": self.hits,
+            "created_at": self.created_at,
+            "load_ms": round(self.load_seconds * 1000, 3) if self.load_seconds is not None else None,
+        }
+
+
+async def build_snapshot(questions: list) -> AnswerSnapshot:
+    """Answer each question through main.run_query and keep the answers worth replaying."""
+    import main
+
+    entry = main.default_dataset()
+    snapshot = AnswerSnapshot(entry.content_checksum())
+    for question in questions:
+        start = time.perf_counter()
+        response = await main.run_query(question, entry, main.RequestTrace("warmup"))
+        cached = main.answer_cache.get(question, namespace=main.cache_namespace(entry))
+        kept = response.source in SNAPSHOT_SOURCES and (
+            response.source != "agent" or (cached is not None and cached["answer"] == response.answer))
+        if kept:
+            snapshot.add(question, response.answer, response.visualization, response.source)
+        print(f"{'✅' if kept else '⏭️'} {response.source:<10} {(time.perf_counter() - start) * 1000:8.1f} ms  {question}")
+    return snapshot
+
+
+def read_questions(path: Optional[str]) -> list:
+    """Questions from a text file (one per line) or a JSON list; DEFAULT_QUESTIONS without one."""
+    if not path:
+        return DEFAULT_QUESTIONS
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute answers to the example questions")
+    parser.add_argument("--questions", default=None, help="Text file with one question per line, or a JSON list")
+    parser.add_argument("--output", default=os.getenv("ANSWER_SNAPSHOT_PATH") or DEFAULT_PATH)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Answer from the live paths, not from the snapshot being replaced
+    os.environ["ANSWER_SNAPSHOT_PATH"] = ""
+    os.environ.setdefault("AGENT_STARTUP", "lazy")
+    result = asyncio.run(build_snapshot(read_questions(args.questions)))
+    result.save(args.output)
+    print(f"📸 Snapshot of {len(result.answers)} answers written to {args.output}")
@@ -0,0 +1,248 @@
+"""
+Offline benchmark for the backend.
+
+Drives the FastAPI app in-process (no server, no network) with the agent's
+LLM replaced by ReplayLLM, which replays the recorded ReAct traces in
+benchmarks/react_traces.json. Pandas tool calls still run for real.
+
+For each scenario and concurrency level it measures throughput, latency
+percentiles, errors and memory, and writes the results as JSON so runs can
+be compared over time:
+
+    python benchmark.py
+    python benchmark.py --scenarios agent,viz --concurrency 1,8,32 --requests 400
+    python benchmark.py --llm-latency 0.2 --output benchmarks/results/latest.json
+
+Scenarios: info (GET /dataset/info), fast_path and viz (POST /query answered
+with pandas) and agent (POST /query through the replayed agent). The answer
+and code caches and the answer snapshot are disabled unless --with-cache is
+given, so agent requests really reach the agent.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+DEFAULT_TRACES = os.path.join(BENCH_DIR, "react_traces.json")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "latest.json")
+
+FAST_PATH_QUESTIONS = [
+    "What was the overall survival rate?",
+    "What was the survival rate by gender?",
+    "What was the average fare paid by survivors in each class?",
+    "What is the median age of passengers who embarked at Southampton?",
+]
+VIZ_QUESTIONS = [
+    "Show me a histogram of passenger ages",
+    "Show me a bar chart of passengers by class",
+    "Plot the distribution of ticket fares",
+    "Show me the gender distribution of passengers",
+]
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def max_rss_bytes() -> int:
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def expected_answer(trace: dict) -> str:
+    """The final answer a replayed trace should produce."""
+    return trace["steps"][-1].split("Final Answer:", 1)[-1].strip()
+
+
+def scenario_requests(name: str, traces: list) -> list:
+    """(method, path, json body, expected answer or None) tuples cycled through by a scenario."""
+    if name == "info":
+        return [("GET", "/dataset/info", None, None)]
+    if name == "agent":
+        return [("POST", "/query", {"question": t["question"], "trace": True}, expected_answer(t)) for t in traces]
+    questions = {"fast_path": FAST_PATH_QUESTIONS, "viz": VIZ_QUESTIONS}[name]
+    return [("POST", "/query", {"question": q}, None) for q in questions]
+
+
+async def run_scenario(client, requests: list, total: int, concurrency: int,
+                       trace_memory: bool = False) -> dict:
+    """Send `total` requests with at most `concurrency` in flight."""
+    latencies, errors, sources = [], 0, {}
+    llm_calls, prompt_tokens = 0, 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors, llm_calls, prompt_tokens
+        while next_index < total:
+            method, path, body, expected = requests[next_index % len(requests)]
+            next_index += 1
+            start = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+            elif body is not None:
+                payload = response.json()
+                source = payload.get("source", "unknown")
+                sources[source] = sources.get(source, 0) + 1
+                # A replayed agent run that does not reach the recorded answer is a failure
+                if expected is not None and payload.get("answer") != expected:
+                    errors += 1
+                trace = payload.get("trace") or {}
+                llm_calls += trace.get("llm_calls", 0)
+                prompt_tokens += trace.get("prompt_tokens", 0)
+
+    rss_before = max_rss_bytes()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+    traced_peak = None
+    if trace_memory:
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latencies.sort()
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "sources": sources,
+        "duration_s": round(duration, 4),
+        "throughput_rps": round(total / duration, 2) if duration else None,
+        "latency_ms": {
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else 0,
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "max": ms(latencies[-1]) if latencies else 0,
+        },
+        "prompt_tokens": {
+            "total": prompt_tokens,
+            "per_request": round(prompt_tokens / total, 1) if total else 0,
+            "per_call": round(prompt_tokens / llm_calls, 1) if llm_calls else 0,
+        },
+        "memory": {
+            "python_peak_bytes": traced_peak,
+            "max_rss_bytes": max_rss_bytes(),
+            "max_rss_growth_bytes": max_rss_bytes() - rss_before,
+        },
+    }
+
+
+def load_app(traces: list, llm_latency: float, with_cache: bool):
+    """Import main with the agent wired to the replay LLM."""
+    os.environ.setdefault("AGENT_STARTUP", "lazy")
+    os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+    # The replayed LLM has no provider quota to budget against
+    os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "0")
+    os.environ.setdefault("LLM_TOKENS_PER_DAY", "0")
+    if not with_cache:
+        os.environ["ANSWER_CACHE_SIZE"] = "0"
+        os.environ["CODE_CACHE_ENABLED"] = "false"
+        os.environ["ANSWER_SNAPSHOT_PATH"] = ""
+    import main
+    from fake_llm import ReplayLLM
+
+    main.llm = ReplayLLM(traces=traces, latency=llm_latency)
+    main.agent_type = "zero-shot-react-description"
+    return main
+
+
+async def run_benchmark(args) -> dict:
+    import httpx
+    from fake_llm import load_traces
+
+    traces = load_traces(args.traces)
+    main = load_app(traces, args.llm_latency, args.with_cache)
+    transport = httpx.ASGITransport(app=main.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        for name in args.scenarios:
+            requests = scenario_requests(name, traces)
+            # Warm-up builds the agent and fills lazily computed state
+            await run_scenario(client, requests, min(len(requests), args.requests), 1)
+            for concurrency in args.concurrency:
+                result = await run_scenario(client, requests, args.requests, concurrency, args.trace_memory)
+                result["scenario"] = name
+                results.append(result)
+                print(f"{name:<10} c={concurrency:<4} {result['throughput_rps']:>9} rps  "
+                      f"p50 {result['latency_ms']['p50']:>9} ms  p95 {result['latency_ms']['p95']:>9} ms  "
+                      f"p99 {result['latency_ms']['p99']:>9} ms  errors {result['errors']}", file=sys.__stdout__)
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "requests": args.requests,
+            "llm_latency_s": args.llm_latency,
+            "with_cache": args.with_cache,
+            "trace_memory": args.trace_memory,
+            "agent_invoke_mode": main.agent_runner.mode,
+            "agent_max_concurrency": main.agent_runner.max_concurrency,
+            "agent_queue_depth": main.agent_runner.max_queue,
+            "agent_prompt": main.AGENT_PROMPT,
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark with a replayed LLM")
+    parser.add_argument("--scenarios", default="info,fast_path,viz,agent",
+                        type=lambda value: [s.strip() for s in value.split(",") if s.strip()])
+    parser.add_argument("--concurrency", default="1,8,32",
+                        type=lambda value: [int(c) for c in value.split(",")])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Simulated seconds per LLM call")
+    parser.add_argument("--traces", default=DEFAULT_TRACES)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--with-cache", action="store_true", help="Keep the answer and code caches and the answer snapshot enabled")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record peak Python allocations with tracemalloc (slows requests down)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # The agent runs with verbose=True; keep its chain logs out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = asyncio.run(run_benchmark(args))
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Results written to {args.output}")
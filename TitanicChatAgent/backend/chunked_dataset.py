@@ -0,0 +1,691 @@
+"""
+Out-of-core execution over Parquet for passenger tables too large for RAM.
+
+A ChunkedDataset never holds the table in memory. Every question is answered
+by streaming record batches of at most `chunk_rows` rows through pyarrow's
+dataset scanner. The scanner reads only the columns the operation needs and
+applies filters as pyarrow expressions, so non-matching rows never reach
+pandas. Each operation is built from accumulators whose per-chunk partial
+results merge exactly:
+
+- GroupMoments: count, sum, mean, std (Chan's parallel update), min and max
+- ValueCounts: counts of value combinations, for value counts, crosstabs and
+  exact quantiles of columns with few distinct values
+- Histogram: bin counts over fixed edges, for histograms and approximate
+  quantiles of columns with many distinct values
+- TopN and PairwiseMoments: top rows and Pearson correlations
+
+Memory is bounded by a chunk plus the accumulators, whose size depends on
+the number of groups, not rows. Quantiles (medians, describe percentiles,
+the stats index) are exact while a column has at most EXACT_QUANTILE_VALUES
+distinct values; otherwise they are interpolated from a QUANTILE_BINS-bin
+histogram, which takes an extra pass.
+
+The dataset offers what the rest of the backend uses from a DataFrame
+(columns, len, shape, head), plus the typed agent tools (CHUNKED_TOOLS, used
+by pandas_tools.run_tool) and the aggregates query_engine.execute_query asks
+for (query_source). dataset_loader.load_dataset returns one for large Parquet
+files; see DATASET_OUT_OF_CORE in main.py.
+"""
+import hashlib
+import math
+import os
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from pandas_tools import (Condition, CorrelationArgs, CrosstabArgs, DescribeColumnArgs, FilterCountArgs,
+                          GroupByAggregateArgs, TopNArgs, ToolInputError, _check_columns, _format)
+from stats_index import QUANTILES, bin_edges_from_summary
+
+
+DEFAULT_CHUNK_ROWS = 250_000
+EXACT_QUANTILE_VALUES = 250_000  # Distinct values kept per column before quantiles become approximate
+QUANTILE_BINS = 4096
+MOMENT_AGGREGATIONS = ("count", "sum", "mean", "std", "min", "max", "size")
+ARROW_ERRORS = (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError)
+
+
+def _key_levels(keys: list):
+    """Index levels of the group keys (a single level keeps group labels scalar)."""
+    return list(range(len(keys))) if len(keys) > 1 else 0
+
+
+class _Counts:
+    """
+    Count Series summed by label. Per-chunk parts are buffered and merged with
+    one concat once they hold more than compact_at labels, which is much
+    cheaper than aligning a large index on every chunk.
+    """
+
+    def __init__(self, compact_at: int):
+        self.compact_at = compact_at
+        self._parts = []
+        self._buffered = 0
+
+    def add(self, part: pd.Series) -> bool:
+        """Add a part; True when the parts were merged (so len() is exact)."""
+        self._parts.append(part)
+        self._buffered += len(part)
+        if self._buffered <= self.compact_at:
+            return False
+        self.compact()
+        return True
+
+    def compact(self):
+        if len(self._parts) > 1:
+            merged = pd.concat(self._parts)
+            self._parts = [merged.groupby(level=list(range(merged.index.nlevels)), dropna=False, sort=False).sum()]
+        self._buffered = len(self._parts[0]) if self._parts else 0
+
+    def __len__(self) -> int:
+        return self._buffered
+
+    def total(self) -> Optional[pd.Series]:
+        self.compact()
+        return self._parts[0] if self._parts else None
+
+
+class GroupMoments:
+    """
+    Per-group rows, non-null count, sum, mean, variance, min and max of one
+    column. With dropna=False missing keys form groups of their own.
+    """
+
+    def __init__(self, keys: list, column: Optional[str] = None, numeric: bool = True, dropna: bool = True):
+        self.keys = list(keys)
+        self.dropna = dropna
+        self.column = column
+        self.numeric = numeric and column is not None
+        self.columns = self.keys + ([column] if column else [])
+        self._acc = None
+
+    def add(self, frame: pd.DataFrame):
+        part = self._partial(frame) if self.keys else self._total(frame)
+        self._acc = part if self._acc is None else self._merge(self._acc, part)
+
+    def _total(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """The partial for a single group, straight from numpy."""
+        part = {"size": len(frame)}
+        if self.column is not None:
+            values = frame[self.column]
+            part["count"] = int(values.notna().sum())
+        if self.numeric:
+            values = values.to_numpy(dtype="float64", na_value=np.nan)
+            values = values[~np.isnan(values)]
+            empty = not len(values)
+            part.update({
+                "sum": values.sum(),
+                "min": np.nan if empty else values.min(),
+                "max": np.nan if empty else values.max(),
+                "mean": np.nan if empty else values.mean(),
+                "m2": 0.0 if empty else float(((values - values.mean()) ** 2).sum()),
+            })
+        return pd.DataFrame(part, index=[0])
+
+    def _partial(self, frame: pd.DataFrame) -> pd.DataFrame:
+        data = frame[self.keys].copy()
+        if self.column is not None:
+            data["_n"] = frame[self.column].notna()
+        if self.numeric:
+            data["_v"] = frame[self.column].astype("float64")
+        group = data.groupby(self.keys, observed=True, dropna=self.dropna, sort=False)
+        part = pd.DataFrame({"size": group.size()})
+        if self.column is not None:
+            part["count"] = group["_n"].sum()
+        if self.numeric:
+            values = group["_v"]
+            part["sum"] = values.sum()
+            part["min"] = values.min()
+            part["max"] = values.max()
+            part["mean"] = part["sum"] / part["count"].where(part["count"] > 0)
+            part["m2"] = (values.var(ddof=0) * part["count"]).fillna(0.0)
+        return part
+
+    def _merge(self, a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+        a, b = a.align(b, join="outer")
+        merged = pd.DataFrame({"size": a["size"].fillna(0) + b["size"].fillna(0)})
+        if self.column is None:
+            return merged
+        na, nb = a["count"].fillna(0), b["count"].fillna(0)
+        merged["count"] = na + nb
+        if self.numeric:
+            n = merged["count"].where(merged["count"] > 0)
+            ma, mb = a["mean"].fillna(0.0), b["mean"].fillna(0.0)
+            delta = mb - ma
+            merged["sum"] = a["sum"].fillna(0.0) + b["sum"].fillna(0.0)
+            merged["min"] = pd.concat([a["min"], b["min"]], axis=1).min(axis=1)
+            merged["max"] = pd.concat([a["max"], b["max"]], axis=1).max(axis=1)
+            merged["mean"] = ma + delta * nb / n
+            merged["m2"] = (a["m2"].fillna(0.0) + b["m2"].fillna(0.0) + delta ** 2 * na * nb / n).fillna(0.0)
+        return merged
+
+    def result(self) -> pd.DataFrame:
+        """count, sum, mean, std (ddof=1), min, max and size per group, sorted by group."""
+        if self._acc is None:
+            return pd.DataFrame(columns=list(MOMENT_AGGREGATIONS))
+        result = self._acc.sort_index()
+        result["size"] = result["size"].astype("int64")
+        if "count" in result:
+            result["count"] = result["count"].astype("int64")
+        if "m2" in result:
+            result["std"] = np.sqrt(result["m2"] / (result["count"] - 1).where(result["count"] > 1))
+        return result
+
+
+class ValueCounts:
+    """Counts of each combination of values in columns; gives up past max_values combinations."""
+
+    def __init__(self, columns: list, dropna: bool = True, max_values: Optional[int] = None):
+        self.columns = list(columns)
+        self.dropna = dropna
+        self.max_values = max_values
+        self.overflowed = False
+        self._counts = _Counts(compact_at=2 * (max_values or 500_000))
+
+    def add(self, frame: pd.DataFrame):
+        if self.overflowed:
+            return
+        if len(self.columns) == 1:
+            part = frame[self.columns[0]].value_counts(dropna=self.dropna, sort=False)
+        else:
+            part = frame.groupby(self.columns, observed=True, dropna=self.dropna, sort=False).size()
+        if self._counts.add(part) and self.max_values is not None and len(self._counts) > self.max_values:
+            self.overflowed, self._counts = True, None
+
+    def result(self) -> pd.Series:
+        """Counts sorted by value (None if the column had too many distinct values)."""
+        if self.overflowed:
+            return None
+        counts = self._counts.total()
+        if self.max_values is not None and counts is not None and len(counts) > self.max_values:
+            self.overflowed, self._counts = True, None
+            return None
+        if counts is None:
+            return pd.Series(dtype="int64", name="count")
+        return counts.astype("int64").sort_index().rename("count")
+
+
+class Histogram:
+    """Counts per bin of fixed edges, per group; the last bin includes its right edge like numpy."""
+
+    def __init__(self, keys: list, column: str, edges: np.ndarray):
+        self.keys = list(keys)
+        self.column = column
+        self.columns = self.keys + [column]
+        self.edges = np.asarray(edges, dtype=float)
+        self._counts = None if not self.keys else _Counts(compact_at=1_000_000)
+
+    def add(self, frame: pd.DataFrame):
+        values = frame[self.column].to_numpy(dtype=float, na_value=np.nan)
+        present = ~np.isnan(values)
+        bins = np.clip(np.searchsorted(self.edges, values[present], side="right") - 1, 0, len(self.edges) - 2)
+        if not self.keys:
+            part = np.bincount(bins, minlength=len(self.edges) - 1)
+            self._counts = part if self._counts is None else self._counts + part
+            return
+        data = frame.loc[present, self.keys].assign(_bin=bins)
+        self._counts.add(data.groupby(self.keys + ["_bin"], observed=True, sort=False).size())
+
+    def result(self):
+        """Counts array, or a Series indexed by the keys and bin number when grouped."""
+        if not self.keys:
+            return self._counts if self._counts is not None else np.zeros(len(self.edges) - 1, dtype="int64")
+        counts = self._counts.total()
+        return counts.astype("int64").sort_index() if counts is not None else pd.Series(dtype="int64")
+
+
+class TopN:
+    """The n rows with the largest (or smallest) values of a column."""
+
+    def __init__(self, column: str, n: int, ascending: bool = False, show: list = ()):
+        self.column = column
+        self.n = n
+        self.ascending = ascending
+        self.columns = [column] + [c for c in dict.fromkeys(show) if c != column]
+        self._rows = None
+
+    def _pick(self, frame: pd.DataFrame) -> pd.DataFrame:
+        return frame.nsmallest(self.n, self.column) if self.ascending else frame.nlargest(self.n, self.column)
+
+    def add(self, frame: pd.DataFrame):
+        part = self._pick(frame[self.columns])
+        self._rows = part if self._rows is None else self._pick(pd.concat([self._rows, part], ignore_index=True))
+
+    def result(self) -> pd.DataFrame:
+        return (self._rows if self._rows is not None else pd.DataFrame(columns=self.columns)).reset_index(drop=True)
+
+
+class PairwiseMoments:
+    """Sums over pairwise-complete rows for the Pearson correlation of every pair of columns."""
+
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self._n, self._sx, self._sxx, self._sxy = (np.zeros((k, k)) for _ in range(4))
+
+    def add(self, frame: pd.DataFrame):
+        values = np.column_stack([
+            pd.to_numeric(frame[c], errors="coerce").to_numpy(dtype=float, na_value=np.nan) for c in self.columns
+        ])
+        present = (~np.isnan(values)).astype(float)
+        values = np.nan_to_num(values)
+        self._n += present.T @ present
+        self._sx += values.T @ present  # [i, j]: sum of column i where i and j are both present
+        self._sxx += (values ** 2).T @ present
+        self._sxy += values.T @ values
+
+    def result(self) -> pd.DataFrame:
+        n, sx, sxx = self._n, self._sx, self._sxx
+        with np.errstate(invalid="ignore", divide="ignore"):
+            covariance = n * self._sxy - sx * sx.T
+            spread = np.sqrt(np.clip(n * sxx - sx ** 2, 0, None) * np.clip(n * sxx.T - sx.T ** 2, 0, None))
+            matrix = np.clip(covariance / spread, -1.0, 1.0)
+        return pd.DataFrame(matrix, index=self.columns, columns=self.columns)
+
+
+def weighted_quantiles(values: np.ndarray, weights: np.ndarray, quantiles: list) -> list:
+    """Quantiles (numpy's linear method) of sorted distinct values with their counts."""
+    cumulative = np.cumsum(weights)
+    total = cumulative[-1] if len(cumulative) else 0
+    if total == 0:
+        return [np.nan] * len(quantiles)
+    result = []
+    for q in quantiles:
+        position = q * (total - 1)
+        low = values[np.searchsorted(cumulative, math.floor(position), side="right")]
+        high = values[np.searchsorted(cumulative, math.ceil(position), side="right")]
+        result.append(float(low + (high - low) * (position - math.floor(position))))
+    return result
+
+
+def histogram_quantiles(edges: np.ndarray, counts: np.ndarray, quantiles: list) -> list:
+    """Quantiles interpolated linearly within the histogram bin they fall in."""
+    cumulative = np.cumsum(counts)
+    total = cumulative[-1] if len(cumulative) else 0
+    if total == 0:
+        return [np.nan] * len(quantiles)
+    result = []
+    for q in quantiles:
+        rank = q * total
+        i = min(int(np.searchsorted(cumulative, rank, side="left")), len(counts) - 1)
+        before = cumulative[i - 1] if i else 0
+        share = (rank - before) / counts[i] if counts[i] else 0.0
+        result.append(float(edges[i] + share * (edges[i + 1] - edges[i])))
+    return result
+
+
+def _fine_edges(low: float, high: float) -> np.ndarray:
+    return np.linspace(low, high, QUANTILE_BINS + 1) if high > low else np.array([low - 0.5, low + 0.5])
+
+
+class ChunkedDataset:
+    """A Parquet file (or directory) scanned chunk by chunk; never loaded as a whole."""
+
+    def __init__(self, path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self._dataset = ds.dataset(path, format="parquet")
+        self.schema = self._dataset.schema
+        self.columns = pd.Index(self.schema.names)
+        self._rows = None
+        self._sample = None
+
+    # --- The parts of the DataFrame interface the backend uses ---
+
+    def __len__(self) -> int:
+        if self._rows is None:
+            self._rows = self._dataset.count_rows()
+        return self._rows
+
+    @property
+    def shape(self) -> tuple:
+        return len(self), len(self.columns)
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        if self._sample is None or len(self._sample) < n:
+            # From the first file's first pages; Dataset.head reads ahead whole row groups
+            batches = pq.ParquetFile(self._dataset.files[0]).iter_batches(batch_size=max(n, 5))
+            self._sample = next(batches, self.schema.empty_table()).to_pandas()
+        return self._sample.head(n)
+
+    @property
+    def dtypes(self) -> pd.Series:
+        return self.head().dtypes
+
+    def is_numeric(self, column: str, allow_bool: bool = False) -> bool:
+        kind = self.schema.field(column).type
+        return pa.types.is_integer(kind) or pa.types.is_floating(kind) or (allow_bool and pa.types.is_boolean(kind))
+
+    def numeric_columns(self) -> list:
+        """Integer and float columns (not booleans), like select_dtypes(include="number")."""
+        return [c for c in self.columns if self.is_numeric(c)]
+
+    def fingerprint(self) -> str:
+        """Hash of the files' sizes, modification times and the schema."""
+        digest = hashlib.sha1(self.schema.to_string().encode())
+        for path in sorted(self._dataset.files):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
+
+    def chunk_bytes(self) -> int:
+        """Uncompressed size of one chunk, estimated from the Parquet metadata."""
+        total_bytes = total_rows = 0
+        for fragment in self._dataset.get_fragments():
+            metadata = fragment.metadata
+            total_bytes += sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+            total_rows += metadata.num_rows
+        return int(total_bytes / total_rows * min(self.chunk_rows, total_rows)) if total_rows else 0
+
+    # --- Scanning ---
+
+    def expression(self, filters: list) -> Optional[pc.Expression]:
+        """
+        pyarrow filter for query_engine (column, value, label) tuples or
+        pandas_tools Conditions, with the same semantics as their pandas filters.
+        """
+        if not filters:
+            return None
+        conditions = [f if isinstance(f, Condition) else Condition(column=f[0], value=f[1]) for f in filters]
+        _check_columns(self, [c.column for c in conditions])
+        expression = None
+        for condition in conditions:
+            term = self._condition(condition)
+            expression = term if expression is None else expression & term
+        return expression
+
+    def _condition(self, condition: Condition) -> pc.Expression:
+        field, op, value = pc.field(condition.column), condition.op, condition.value
+        if op == "isnull":
+            return field.is_null(nan_is_null=True)
+        if op == "notnull":
+            return field.is_valid() & ~field.is_null(nan_is_null=True)
+        if op in ("in", "not in"):
+            term = field.isin(value if isinstance(value, list) else [value])
+            return ~term if op == "not in" else term
+        if op == "==":
+            return field == value
+        if op == "!=":
+            return (field != value) | field.is_null()  # pandas keeps missing values for !=
+        if not self.is_numeric(condition.column, allow_bool=True):
+            raise ToolInputError(f"'{op}' needs a numeric column, '{condition.column}' is {self.dtypes[condition.column]}")
+        return {"<": field < value, "<=": field <= value, ">": field > value, ">=": field >= value}[op]
+
+    def scan(self, columns: list, expression: Optional[pc.Expression] = None) -> Iterator[pd.DataFrame]:
+        """Matching rows of the given columns, one DataFrame of at most chunk_rows rows at a time."""
+        try:
+            batches = self._dataset.to_batches(columns=list(dict.fromkeys(columns)), filter=expression,
+                                               batch_size=self.chunk_rows, batch_readahead=2, fragment_readahead=1)
+            for batch in batches:
+                if batch.num_rows:
+                    yield batch.to_pandas()
+        except ARROW_ERRORS as e:
+            raise ToolInputError(f"Could not apply the filters: {e}") from e
+
+    def run(self, accumulators: list, expression: Optional[pc.Expression] = None) -> list:
+        """Feed every chunk to each accumulator in one pass; returns the accumulators."""
+        columns = [c for accumulator in accumulators for c in accumulator.columns]
+        _check_columns(self, columns)
+        for frame in self.scan(columns or self.columns[:1].tolist(), expression):
+            for accumulator in accumulators:
+                accumulator.add(frame)
+        return accumulators
+
+    def count(self, expression: Optional[pc.Expression] = None) -> int:
+        if expression is None:
+            return len(self)
+        try:
+            return self._dataset.count_rows(filter=expression)
+        except ARROW_ERRORS as e:
+            raise ToolInputError(f"Could not apply the filters: {e}") from e
+
+    # --- Aggregations ---
+
+    def value_counts(self, column: str, expression: Optional[pc.Expression] = None, dropna: bool = True) -> pd.Series:
+        counts, = self.run([ValueCounts([column], dropna=dropna)], expression)
+        return counts.result().sort_values(ascending=False, kind="stable")
+
+    def group_aggregate(self, keys: list, column: Optional[str], aggs: list,
+                        expression: Optional[pc.Expression] = None) -> pd.DataFrame:
+        """One column per aggregation in aggs (plus "size" for rows), one row per group."""
+        numeric = column is not None and self.is_numeric(column, allow_bool=True)
+        for agg in aggs:
+            if agg not in ("count", "size", "nunique") and not numeric:
+                raise ToolInputError(f"'{agg}' needs a numeric column, '{column}' is {self.dtypes[column]}")
+        moments = GroupMoments(keys, column, numeric)
+        distinct = ValueCounts(keys + [column]) if "nunique" in aggs else None
+        self.run([moments] + ([distinct] if distinct else []), expression)
+        stats = moments.result()
+        result = pd.DataFrame(index=stats.index)
+        for agg in aggs:
+            if agg == "median":
+                result[agg] = self.group_quantiles(keys, column, [0.5], expression)[0.5]
+            elif agg == "nunique":
+                counts = distinct.result()
+                result[agg] = counts.groupby(level=_key_levels(keys)).size() if keys else len(counts)
+            else:
+                result[agg] = stats[agg]
+        return result
+
+    def group_quantiles(self, keys: list, column: str, quantiles: list,
+                        expression: Optional[pc.Expression] = None) -> pd.DataFrame:
+        """Quantiles of column per group: exact for few distinct values, else from a fine histogram."""
+        counts = ValueCounts(keys + [column], max_values=EXACT_QUANTILE_VALUES)
+        moments = GroupMoments([], column)
+        self.run([counts, moments], expression)
+        rows = {}
+        if not counts.overflowed:
+            series = counts.result()
+            groups = series.groupby(level=_key_levels(keys)) if keys else [(0, series)]
+            for key, group in groups:
+                values = group.index.get_level_values(column).to_numpy(dtype=float)
+                rows[key] = weighted_quantiles(values, group.to_numpy(), quantiles)
+        else:
+            total = moments.result().iloc[0]
+            edges = _fine_edges(total["min"], total["max"])
+            histogram, = self.run([Histogram(keys, column, edges)], expression)
+            binned = histogram.result()
+            groups = binned.groupby(level=_key_levels(keys)) if keys else [(0, binned)]
+            for key, group in groups:
+                bin_counts = np.zeros(len(edges) - 1)
+                bin_counts[group.index.get_level_values(-1) if keys else np.arange(len(group))] = group
+                rows[key] = histogram_quantiles(edges, bin_counts, quantiles)
+        result = pd.DataFrame.from_dict(rows, orient="index", columns=quantiles)
+        if keys:
+            result.index = pd.MultiIndex.from_tuples(result.index, names=keys) if len(keys) > 1 else result.index.rename(keys[0])
+        return result.sort_index()
+
+    def numeric_summary(self, columns: list, bins=None, quantiles: list = QUANTILES,
+                        expression: Optional[pc.Expression] = None) -> dict:
+        """
+        count, mean, std, min, max, unique, quantiles and (when bins is given)
+        a histogram payload per numeric column. One pass, or three when a
+        column has too many distinct values for exact quantiles.
+        """
+        needed = sorted(set(quantiles) | {0.25, 0.75})
+        moments = {c: GroupMoments([], c) for c in columns}
+        counts = {c: ValueCounts([c], max_values=EXACT_QUANTILE_VALUES) for c in columns}
+        self.run(list(moments.values()) + list(counts.values()), expression)
+
+        summaries, approximate = {}, []
+        for column in columns:
+            stats = moments[column].result()
+            if stats.empty or stats["count"].iloc[0] == 0:
+                continue
+            row = stats.iloc[0]
+            summary = {"count": int(row["count"]), "mean": float(row["mean"]), "std": float(row["std"]),
+                       "min": float(row["min"]), "max": float(row["max"]), "unique": None}
+            value_counts = counts[column].result()
+            if value_counts is None:
+                approximate.append(column)
+            else:
+                values, weights = value_counts.index.to_numpy(dtype=float), value_counts.to_numpy()
+                summary["unique"] = len(values)
+                summary["quantiles"] = dict(zip(needed, weighted_quantiles(values, weights, needed)))
+                if bins is not None:
+                    edges = self._edges(summary, bins)
+                    summary["histogram"] = self._payload(edges, np.histogram(values, edges, weights=weights)[0])
+            summaries[column] = summary
+
+        if approximate:
+            fine = self.run([Histogram([], c, _fine_edges(summaries[c]["min"], summaries[c]["max"])) for c in approximate],
+                            expression)
+            for histogram in fine:
+                summaries[histogram.column]["quantiles"] = dict(zip(needed, histogram_quantiles(histogram.edges, histogram.result(), needed)))
+            if bins is not None:
+                final = self.run([Histogram([], c, self._edges(summaries[c], bins)) for c in approximate], expression)
+                for histogram in final:
+                    summaries[histogram.column]["histogram"] = self._payload(histogram.edges, histogram.result())
+        for summary in summaries.values():
+            summary["quantiles"] = {q: summary["quantiles"][q] for q in quantiles}
+        return summaries
+
+    @staticmethod
+    def _edges(summary: dict, bins) -> np.ndarray:
+        iqr = summary["quantiles"][0.75] - summary["quantiles"][0.25]
+        return bin_edges_from_summary(summary["count"], summary["min"], summary["max"], bins,
+                                      iqr=iqr, std=summary["std"] if summary["count"] > 1 else 0.0)
+
+    @staticmethod
+    def _payload(edges: np.ndarray, counts: np.ndarray) -> dict:
+        return {"edges": np.round(edges, 4).tolist(), "counts": np.asarray(counts).astype(int).tolist()}
+
+    def histogram(self, column: str, bins, expression: Optional[pc.Expression] = None) -> dict:
+        """{"edges", "counts"} like stats_index.histogram_payload, computed chunk by chunk."""
+        summary = self.numeric_summary([column], bins, quantiles=[0.5], expression=expression).get(column)
+        return summary["histogram"] if summary else {"edges": [], "counts": []}
+
+    def query_source(self, filters: list) -> "ChunkedQuery":
+        return ChunkedQuery(self, filters)
+
+
+class ChunkedQuery:
+    """The aggregates query_engine.execute_query needs (see FrameSource), over matching rows."""
+
+    def __init__(self, data: ChunkedDataset, filters: list):
+        self.data = data
+        self.expression = data.expression(filters)
+        self._rows = None
+
+    def __len__(self) -> int:
+        if self._rows is None:
+            self._rows = self.data.count(self.expression)
+        return self._rows
+
+    def group_stats(self, group_by: str, column: str, aggs: list) -> pd.DataFrame:
+        return self.data.group_aggregate([group_by], column, aggs, self.expression)
+
+    def value_counts(self, column: str) -> pd.Series:
+        return self.data.value_counts(column, self.expression)
+
+    def stats(self, column: str, aggs: list) -> pd.Series:
+        result = self.data.group_aggregate([], column, aggs, self.expression)
+        if result.empty:
+            return pd.Series({agg: 0 if agg == "count" else np.nan for agg in aggs})
+        return result.iloc[0]
+
+    def rows_where(self, column: str, value, n: int) -> tuple:
+        """(first n matching rows, number of matching rows) where column equals value."""
+        expression = pc.field(column) == value
+        if self.expression is not None:
+            expression = self.expression & expression
+        rows = []
+        for frame in self.data.scan(self.data.columns.tolist(), expression):
+            rows.append(frame.head(n - sum(len(r) for r in rows)))
+            if sum(len(r) for r in rows) >= n:
+                break
+        matches = pd.concat(rows, ignore_index=True) if rows else self.data.head(0)
+        return matches, self.data.count(expression)
+
+
+# --- The typed agent tools (pandas_tools.TOOLS), streamed over chunks ---
+
+def group_by_aggregate(data: ChunkedDataset, args: GroupByAggregateArgs) -> str:
+    _check_columns(data, args.group_by + ([args.column] if args.column else []))
+    expression = data.expression(args.filters)
+    if args.column is None:
+        result = data.group_aggregate(args.group_by, None, ["size"], expression)["size"].rename("count")
+    else:
+        result = data.group_aggregate(args.group_by, args.column, [args.agg], expression)[args.agg]
+        result = result.dropna().rename(f"{args.agg}_{args.column}")
+    if args.sort:
+        result = result.sort_values(ascending=args.sort == "asc")
+    return _format(result)
+
+
+def filter_count(data: ChunkedDataset, args: FilterCountArgs) -> str:
+    matched = data.count(data.expression(args.filters))
+    share = matched / len(data) * 100 if len(data) else 0.0
+    return f"{matched} of {len(data)} rows match ({share:.2f}%)"
+
+
+def describe_column(data: ChunkedDataset, args: DescribeColumnArgs) -> str:
+    _check_columns(data, [args.column])
+    expression = data.expression(args.filters)
+    if data.is_numeric(args.column):
+        summary = data.numeric_summary([args.column], quantiles=[0.25, 0.5, 0.75], expression=expression).get(args.column)
+        matched = data.count(expression)
+        if summary is None:
+            return _format(pd.Series({"count": 0, "missing": matched}, name=args.column))
+        quantiles = summary["quantiles"]
+        return _format(pd.Series({
+            "count": summary["count"], "mean": summary["mean"], "std": summary["std"], "min": summary["min"],
+            "25%": quantiles[0.25], "50%": quantiles[0.5], "75%": quantiles[0.75], "max": summary["max"],
+            "missing": matched - summary["count"],
+        }, name=args.column))
+    counts = data.value_counts(args.column, expression, dropna=False)
+    return _format(pd.DataFrame({"count": counts, "percent": counts / counts.sum() * 100}))
+
+
+def crosstab(data: ChunkedDataset, args: CrosstabArgs) -> str:
+    _check_columns(data, [args.index, args.columns])
+    counts, = data.run([ValueCounts([args.index, args.columns])], data.expression(args.filters))
+    table = counts.result().unstack(fill_value=0).sort_index().sort_index(axis=1)
+    if args.normalize == "index":
+        table = table.div(table.sum(axis=1), axis=0)
+    elif args.normalize == "columns":
+        table = table / table.sum(axis=0)
+    elif args.normalize == "all":
+        table = table / table.to_numpy().sum()
+    return _format(table)
+
+
+def top_n(data: ChunkedDataset, args: TopNArgs) -> str:
+    _check_columns(data, [args.column] + args.show)
+    expression = data.expression(args.filters)
+    if not data.is_numeric(args.column, allow_bool=True):
+        return _format(data.value_counts(args.column, expression).head(args.n))
+    top, = data.run([TopN(args.column, args.n, args.ascending, args.show)], expression)
+    return _format(top.result())
+
+
+def correlation(data: ChunkedDataset, args: CorrelationArgs) -> str:
+    if args.method != "pearson":
+        raise ToolInputError(f"'{args.method}' correlation is not available on out-of-core datasets; use pearson")
+    columns = args.columns or data.numeric_columns()
+    if args.target and args.target not in columns:
+        columns = columns + [args.target]
+    _check_columns(data, columns)
+    moments, = data.run([PairwiseMoments(columns)], data.expression(args.filters))
+    matrix = moments.result()
+    if args.target:
+        return _format(matrix[args.target].drop(args.target).sort_values(key=abs, ascending=False))
+    return _format(matrix)
+
+
+# Same names and argument schemas as pandas_tools.TOOLS
+CHUNKED_TOOLS = {
+    "group_by_aggregate": group_by_aggregate,
+    "filter_count": filter_count,
+    "describe_column": describe_column,
+    "crosstab": crosstab,
+    "top_n": top_n,
+    "correlation": correlation,
+}
+
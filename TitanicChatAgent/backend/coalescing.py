@@ -0,0 +1,44 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+When several users ask the same (normalized) question at the same moment,
+only the first request starts an agent run; the others attach to it and
+receive the same result or exception.
+"""
+import asyncio
+from typing import Awaitable, Callable
+
+
+class SingleFlight:
+    """Deduplicates concurrent async calls that share a key."""
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._in_flight = {}  # key -> asyncio.Task
+
+    async def do(self, key: str, call: Callable[[], Awaitable]):
+        """
+        Await call() for the first caller of a key; later callers with the
+        same key wait for that result instead of starting their own call.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shield so a disconnecting caller does not cancel the shared run
+        return await asyncio.shield(task)
+
+    def is_in_flight(self, key: str) -> bool:
+        return key in self._in_flight
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
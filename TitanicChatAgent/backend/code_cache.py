@@ -0,0 +1,213 @@
+"""
+Code-level memoization of agent answers in SQLite.
+
+When the agent answers a question, the pandas operations it ran (typed tool
+calls, SQL queries, or REPL expressions that pass the sandbox check) are stored with the
+answer, a digest of their outputs and the checksum of the dataset they ran
+on (dataset_loader.dataset_checksum). A later request for the same normalized question re-executes the
+stored operations directly against the DataFrame. If they reproduce the
+same outputs, the stored answer is returned and the LLM is skipped. Entries
+recorded against a different dataset checksum are deleted on sight.
+"""
+import ast
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from pandas_tools import TOOLS, run_tool
+from sql_engine import SQL_TOOLS, database_for, run_sql_tool
+
+
+REPL_TOOL = "python_repl_ast"
+
+# Only side-effect-free expressions over df/pd/np may be stored and replayed
+ALLOWED_NAMES = {"df", "pd", "np", "True", "False", "None"}
+ALLOWED_NODES = (
+    ast.Expression, ast.Attribute, ast.Subscript, ast.Slice, ast.Name, ast.Load,
+    ast.Call, ast.keyword, ast.Constant, ast.List, ast.Tuple, ast.Dict,
+    ast.Compare, ast.BinOp, ast.UnaryOp, ast.BoolOp,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.BitAnd, ast.BitOr, ast.BitXor, ast.Invert, ast.Not, ast.USub, ast.UAdd, ast.And, ast.Or,
+)
+# Read-only DataFrame/Series/GroupBy methods and properties, accessors, and
+# pandas/numpy functions that compute in memory. Anything not listed (file and
+# network I/O, eval/query, callbacks such as apply or pipe) is never replayed
+ALLOWED_ATTRIBUTES = {
+    # Selection and shape
+    "loc", "iloc", "at", "iat", "head", "tail", "columns", "index", "shape", "size", "ndim", "empty",
+    "dtype", "dtypes", "name", "values", "T", "transpose", "keys", "get", "filter", "drop", "dropna",
+    "fillna", "isin", "between", "where", "mask", "isna", "isnull", "notna", "notnull", "duplicated",
+    "drop_duplicates", "sort_values", "sort_index", "nlargest", "nsmallest", "reset_index", "set_index",
+    "rename", "astype", "copy", "clip", "round", "abs",
+    # Aggregation
+    "describe", "count", "sum", "mean", "median", "mode", "min", "max", "std", "var", "sem", "prod",
+    "skew", "kurt", "quantile", "nunique", "unique", "value_counts", "idxmax", "idxmin", "any", "all",
+    "corr", "cov", "cumsum", "cumcount", "cummax", "cummin", "diff", "pct_change", "rank",
+    "groupby", "first", "last", "nth", "get_group", "groups", "ngroups",
+    "pivot_table", "pivot", "crosstab", "melt", "stack", "unstack", "cut", "qcut", "concat",
+    # Conversion to in-memory Python values
+    "to_dict", "to_list", "tolist", "to_frame", "to_numpy", "item",
+    # String, datetime and categorical accessors
+    "str", "dt", "cat", "contains", "startswith", "endswith", "lower", "upper", "strip", "len",
+    "split", "year", "month", "day", "hour", "categories", "codes",
+    # pandas and numpy constructors and functions
+    "DataFrame", "Series", "to_numeric", "to_datetime", "nan", "inf", "array", "arange",
+    "average", "percentile", "sqrt", "log", "exp", "isnan", "count_nonzero", "argmax", "argmin",
+    "corrcoef", "histogram", "sort",
+}
+
+
+def validate_expression(code: str, columns=()) -> Optional[ast.Expression]:
+    """
+    Parse REPL code and return it only if it is a single expression using
+    allowlisted attributes. `columns` also admits attribute access to those
+    columns (df.age), unless the name shadows a DataFrame or Series attribute.
+    """
+    try:
+        tree = ast.parse(code.strip().strip("`"), mode="eval")
+    except SyntaxError:
+        return None
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            return None
+        if isinstance(node, ast.Name) and node.id not in ALLOWED_NAMES:
+            return None
+        if isinstance(node, ast.Attribute) and node.attr not in ALLOWED_ATTRIBUTES:
+            shadows = hasattr(pd.DataFrame, node.attr) or hasattr(pd.Series, node.attr)
+            if node.attr.startswith("_") or node.attr not in columns or shadows:
+                return None
+    return tree
+
+
+def run_step(df: pd.DataFrame, tool: str, tool_input: str) -> Optional[str]:
+    """Re-execute one recorded step; None if it can no longer be run safely."""
+    if tool in TOOLS:
+        output = run_tool(df, tool, tool_input)
+        return None if output.startswith("Error:") else output
+    if tool in SQL_TOOLS and isinstance(df, pd.DataFrame):
+        output = run_sql_tool(database_for(df), tool, tool_input)
+        return None if output.startswith("Error:") else output
+    if tool == REPL_TOOL:
+        tree = validate_expression(tool_input, columns=getattr(df, "columns", ()))
+        if tree is None:
+            return None
+        try:
+            result = eval(compile(tree, "<code_cache>", "eval"), {"__builtins__": {}}, {"df": df, "pd": pd, "np": np})
+        except Exception:
+            return None
+        return str(result)
+    return None
+
+
+def _digest(outputs: list) -> str:
+    return hashlib.sha1("\x00".join(outputs).encode()).hexdigest()
+
+
+class CodeCache:
+    """SQLite store of replayable agent steps per (namespace, question)."""
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        # Worker processes share the file; WAL lets them read while one writes
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS plans ("
+            " namespace TEXT NOT NULL, question TEXT NOT NULL, checksum TEXT NOT NULL,"
+            " steps TEXT NOT NULL, output_digest TEXT NOT NULL, answer TEXT NOT NULL,"
+            " created_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (namespace, question))"
+        )
+        self._db.commit()
+
+    def get(self, question_key: str, df: pd.DataFrame, checksum: str, namespace: str = "") -> Optional[str]:
+        """Replay the stored steps for a question; returns the stored answer if they still hold."""
+        if not question_key:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT checksum, steps, output_digest, answer FROM plans WHERE namespace = ? AND question = ?",
+                (namespace, question_key),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        stored_checksum, steps, output_digest, answer = row
+        outputs = None
+        if stored_checksum == checksum:
+            outputs = [run_step(df, tool, tool_input) for tool, tool_input in json.loads(steps)]
+        if outputs is None or None in outputs or _digest(outputs) != output_digest:
+            self._delete(namespace, question_key)
+            self.invalidations += 1
+            self.misses += 1
+            return None
+        with self._lock:
+            self._db.execute("UPDATE plans SET hits = hits + 1 WHERE namespace = ? AND question = ?",
+                             (namespace, question_key))
+            self._db.commit()
+        self.hits += 1
+        return answer
+
+    def set(self, question_key: str, steps: list, answer: str, df: pd.DataFrame, checksum: str,
+            namespace: str = "") -> bool:
+        """
+        Store the (tool, input) steps of a successful agent run with its answer.
+        Nothing is stored unless every step replays cleanly against df.
+        """
+        if not question_key or not steps:
+            return False
+        outputs = [run_step(df, tool, tool_input) for tool, tool_input in steps]
+        if None in outputs:
+            return False
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO plans (namespace, question, checksum, steps, output_digest, answer, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, question_key, checksum, json.dumps([list(step) for step in steps]),
+                 _digest(outputs), answer, time.time()),
+            )
+            self._db.commit()
+        return True
+
+    def invalidate(self, namespace: str, checksum: str) -> int:
+        """Drop a namespace's entries recorded against any other dataset checksum."""
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM plans WHERE namespace = ? AND checksum != ?",
+                                       (namespace, checksum)).rowcount
+            self._db.commit()
+        self.invalidations += deleted
+        return deleted
+
+    def _delete(self, namespace: str, question_key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM plans WHERE namespace = ? AND question = ?", (namespace, question_key))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "path": self.path,
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,266 @@
+"""
+Dataset loading layer with compact dtypes and a columnar cache.
+
+Loads CSV, Parquet or Arrow IPC files into a DataFrame, shrinks dtypes
+(category, int8, bool, and float32 where that loses nothing) and, for CSV
+sources, writes a converted Arrow file next to the CSV so later startups
+read it instead of parsing text. The file is read through a memory map,
+but converting it to pandas still copies the table into each process.
+pyarrow is optional; without it only CSV is supported and no cache is
+written.
+
+Parquet files with many rows can instead be opened out-of-core
+(chunked_dataset.ChunkedDataset): nothing is loaded up front and every
+question streams over the file in chunks.
+
+Run directly to compare load time and memory per format:
+
+    python dataset_loader.py ../data/titanic.csv
+"""
+import hashlib
+import os
+import sys
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+# Object columns with at most this share of distinct values become categories
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+BOOL_STRINGS = {"true": True, "false": False}
+SOURCE_METADATA_KEY = b"titanic_source"
+
+
+@dataclass
+class LoadReport:
+    """How a dataset was loaded and what it costs to keep in memory."""
+    format: str
+    path: str
+    rows: int
+    seconds: float
+    memory_bytes: int
+    rss_delta_bytes: Optional[int]
+    from_cache: bool = False
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _rss_bytes() -> Optional[int]:
+    """Current resident set size, if the platform lets us read it."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def detect_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    if ext in (".arrow", ".feather", ".ipc"):
+        return "arrow"
+    return "csv"
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Downcast columns to the smallest dtype that holds their values."""
+    df = df.copy()
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            df[column] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series):
+            # Only if every value survives the round trip: 71.2833 would read back as 71.2833023...
+            narrowed = series.astype("float32")
+            if (narrowed.astype(series.dtype) == series)[series.notna()].all():
+                df[column] = narrowed
+        elif series.dtype == object or pd.api.types.is_string_dtype(series):
+            lowered = series.dropna().astype(str).str.lower()
+            if len(lowered) and lowered.isin(BOOL_STRINGS).all() and not series.isna().any():
+                df[column] = lowered.map(BOOL_STRINGS).astype(bool)
+            elif series.nunique(dropna=True) <= max(1, len(series) * CATEGORY_MAX_UNIQUE_RATIO):
+                df[column] = series.astype("category")
+    return df
+
+
+def _source_signature(path: str) -> str:
+    """Size and nanosecond mtime, so an edit that keeps the size within the same second still counts."""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def dataset_checksum(df: pd.DataFrame) -> str:
+    """Content hash of a DataFrame (values, index and column names)."""
+    if not isinstance(df, pd.DataFrame):
+        return df.fingerprint()  # Out-of-core: files and schema, not values
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    digest.update("|".join(map(str, df.columns)).encode())
+    return digest.hexdigest()
+
+
+def cache_path_for(csv_path: str) -> str:
+    """Converted columnar file stored next to the CSV."""
+    return os.path.splitext(csv_path)[0] + ".arrow"
+
+
+def _read_arrow(path: str) -> tuple:
+    """
+    Read an Arrow IPC file through a memory map; returns (DataFrame, source
+    signature). to_pandas copies the columns, so the DataFrame is not backed
+    by the map.
+    """
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    metadata = table.schema.metadata or {}
+    signature = metadata.get(SOURCE_METADATA_KEY, b"").decode() or None
+    return table.to_pandas(split_blocks=True), signature
+
+
+def _write_arrow_cache(df: pd.DataFrame, csv_path: str, path: str):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SOURCE_METADATA_KEY] = _source_signature(csv_path).encode()
+    table = table.replace_schema_metadata(metadata)
+    # Per-process temporary name: several workers may write the cache at once
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # Uncompressed so the file can be read through a memory map without decoding
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def _read_csv(path: str, compact: bool) -> pd.DataFrame:
+    df = pd.read_csv(path)
+    return compact_dtypes(df) if compact else df
+
+
+def use_out_of_core(path: str, out_of_core: str, min_rows: int) -> bool:
+    """"true", "false", or "auto": files with at least min_rows rows (counted from the Parquet footer)."""
+    if out_of_core == "auto":
+        return pq.ParquetFile(path).metadata.num_rows >= min_rows
+    return out_of_core == "true"
+
+
+def load_dataset(path: str, fmt: str = "auto", compact: bool = True,
+                 use_cache: bool = True, out_of_core: str = "false",
+                 out_of_core_rows: int = 2_000_000, chunk_rows: int = 250_000) -> tuple:
+    """
+    Load a dataset and return (DataFrame, LoadReport).
+
+    CSV sources are served from the converted Arrow cache when it exists and
+    matches the CSV's size and modification time; otherwise the CSV is parsed
+    and the cache is (re)written. Parquet sources selected by out_of_core
+    return a chunked_dataset.ChunkedDataset instead of a DataFrame; its
+    memory_bytes is the size of one chunk.
+    """
+    fmt = detect_format(path) if fmt == "auto" else fmt
+    if fmt in ("parquet", "arrow") and pa is None:
+        raise ImportError(f"pyarrow is required to load {fmt} files")
+
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    from_cache = False
+
+    if fmt == "parquet" and use_out_of_core(path, out_of_core, out_of_core_rows):
+        from chunked_dataset import ChunkedDataset
+
+        data = ChunkedDataset(path, chunk_rows)
+        rss_after = _rss_bytes()
+        return data, LoadReport(
+            format="parquet-chunked",
+            path=path,
+            rows=len(data),
+            seconds=round(time.perf_counter() - start, 6),
+            memory_bytes=data.chunk_bytes(),
+            rss_delta_bytes=(rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+        )
+
+    if fmt == "parquet":
+        df = pq.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+        if compact:
+            df = compact_dtypes(df)
+    elif fmt == "arrow":
+        df, _ = _read_arrow(path)
+        if compact:
+            df = compact_dtypes(df)
+    else:
+        df = None
+        cache_path = cache_path_for(path)
+        if use_cache and compact and pa is not None and os.path.exists(cache_path):
+            try:
+                cached, signature = _read_arrow(cache_path)
+                if signature == _source_signature(path):
+                    df, from_cache, fmt = cached, True, "arrow"
+            except (OSError, pa.ArrowInvalid):
+                df = None
+        if df is None:
+            df = _read_csv(path, compact)
+            if use_cache and compact and pa is not None:
+                try:
+                    _write_arrow_cache(df, path, cache_path)
+                except (OSError, pa.ArrowException) as e:
+                    print(f"⚠️ Could not write columnar cache: {e}")
+
+    seconds = time.perf_counter() - start
+    rss_after = _rss_bytes()
+    report = LoadReport(
+        format=fmt,
+        path=path,
+        rows=len(df),
+        seconds=round(seconds, 6),
+        memory_bytes=int(df.memory_usage(deep=True).sum()),
+        rss_delta_bytes=(rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+        from_cache=from_cache,
+    )
+    return df, report
+
+
+def compare_formats(csv_path: str) -> list:
+    """Write the CSV as Parquet and Arrow, then time loading each format."""
+    reports = []
+    _, report = load_dataset(csv_path, "csv", compact=False, use_cache=False)
+    reports.append(report)
+    df, report = load_dataset(csv_path, "csv", compact=True, use_cache=False)
+    report.format = "csv+compact"
+    reports.append(report)
+    if pa is None:
+        return reports
+
+    base = os.path.splitext(csv_path)[0]
+    parquet_path, arrow_path = f"{base}.bench.parquet", f"{base}.bench.arrow"
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, parquet_path)
+    feather.write_feather(table, arrow_path, compression="uncompressed")
+    try:
+        for path in (parquet_path, arrow_path):
+            _, report = load_dataset(path, compact=False)
+            reports.append(report)
+    finally:
+        for path in (parquet_path, arrow_path):
+            os.remove(path)
+    return reports
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "..", "data", "titanic.csv")
+    print(f"{'format':<12} {'load ms':>10} {'memory KB':>12} {'rss delta KB':>14}")
+    for r in compare_formats(target):
+        rss = f"{r.rss_delta_bytes / 1024:.1f}" if r.rss_delta_bytes is not None else "n/a"
+        print(f"{r.format:<12} {r.seconds * 1000:>10.2f} {r.memory_bytes / 1024:>12.1f} {rss:>14}")
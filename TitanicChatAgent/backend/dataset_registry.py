@@ -0,0 +1,202 @@
+"""
+Registry of datasets served by one backend process.
+
+Datasets are registered by id (the file name without extension) and only
+loaded, indexed and given a LangChain agent on first use. When the loaded
+datasets exceed the memory budget, the least recently used ones are
+evicted; pinned datasets (the default Titanic table) and datasets leased
+by requests still using them are never evicted.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import pandas as pd
+
+from dataset_loader import LoadReport, dataset_checksum, detect_format, load_dataset
+from stats_index import StatsIndex
+
+
+DATASET_EXTENSIONS = (".csv", ".parquet", ".pq", ".arrow", ".feather")
+
+
+@dataclass
+class DatasetEntry:
+    """One registered dataset and whatever has been loaded for it so far."""
+    id: str
+    path: str
+    pinned: bool = False
+    df: Optional[pd.DataFrame] = None  # Or a chunked_dataset.ChunkedDataset for out-of-core Parquet
+    report: Optional[LoadReport] = None
+    stats: Optional[StatsIndex] = None
+    agent: object = None
+    checksum: Optional[str] = None  # Content hash, computed on first use
+    last_used: float = field(default_factory=time.time)
+    leases: int = 0  # Requests using this dataset; it is not evicted while any hold one
+    # Held while this dataset is loaded or its agent built, instead of the registry lock
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def loaded(self) -> bool:
+        return self.df is not None
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.report.memory_bytes if self.report else 0
+
+    def content_checksum(self) -> str:
+        if self.checksum is None:
+            self.checksum = dataset_checksum(self.df)
+        return self.checksum
+
+    def describe(self) -> dict:
+        return {
+            "id": self.id,
+            "path": self.path,
+            "format": detect_format(self.path),
+            "loaded": self.loaded,
+            "agent_loaded": self.agent is not None,
+            "pinned": self.pinned,
+            "leases": self.leases,
+            "rows": len(self.df) if self.loaded else None,
+            "memory_bytes": self.memory_bytes if self.loaded else None,
+        }
+
+
+class DatasetRegistry:
+    """Lazily loads datasets and their agents within a memory budget."""
+
+    def __init__(self, agent_factory: Callable[[pd.DataFrame], object],
+                 memory_budget_bytes: int = 0, load_options: dict = None,
+                 stats_options: dict = None):
+        self.agent_factory = agent_factory
+        self.memory_budget_bytes = memory_budget_bytes  # 0 means unlimited
+        self.load_options = load_options or {}
+        self.stats_options = stats_options or {}
+        self.evictions = 0
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def register(self, dataset_id: str, path: str, pinned: bool = False) -> DatasetEntry:
+        """Register a dataset file without loading it."""
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+            if entry is None or entry.path != path:
+                entry = DatasetEntry(id=dataset_id, path=path, pinned=pinned)
+                self._entries[dataset_id] = entry
+            return entry
+
+    def add_loaded(self, dataset_id: str, path: str, df: pd.DataFrame, report: LoadReport,
+                   stats: StatsIndex, agent=None, pinned: bool = True) -> DatasetEntry:
+        """Register a dataset that has already been loaded elsewhere."""
+        with self._lock:
+            entry = DatasetEntry(id=dataset_id, path=path, pinned=pinned, df=df,
+                                 report=report, stats=stats, agent=agent)
+            self._entries[dataset_id] = entry
+            return entry
+
+    def discover(self, directory: str) -> list:
+        """Register every dataset file in a directory; returns the new ids."""
+        if not os.path.isdir(directory):
+            return []
+        added = []
+        files = sorted(os.listdir(directory), key=lambda name: (os.path.splitext(name)[0], name))
+        for name in files:
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in DATASET_EXTENSIONS or "." in stem:
+                continue
+            # foo.arrow next to foo.csv is the loader's columnar cache, not a dataset
+            if ext.lower() == ".arrow" and os.path.exists(os.path.join(directory, f"{stem}.csv")):
+                continue
+            with self._lock:
+                if stem in self._entries:
+                    continue
+                self.register(stem, os.path.join(directory, name))
+            added.append(stem)
+        return added
+
+    def ids(self) -> list:
+        return list(self._entries)
+
+    def list(self) -> list:
+        return [entry.describe() for entry in self._entries.values()]
+
+    def is_loaded(self, dataset_id: str) -> bool:
+        """Whether get() would return without loading. Raises KeyError if unknown."""
+        return self._entries[dataset_id].loaded
+
+    def get(self, dataset_id: str) -> DatasetEntry:
+        """
+        Return a loaded dataset, loading it on first use. Raises KeyError if unknown.
+        The load holds only the entry's lock, so other datasets stay available.
+        """
+        with self._lock:
+            entry = self._entries[dataset_id]
+            entry.last_used = time.time()
+            if entry.loaded:
+                return entry
+        with entry.lock:
+            if not entry.loaded:
+                df, report = load_dataset(entry.path, **self.load_options)
+                stats = StatsIndex(**self.stats_options)
+                stats.build(df)
+                with self._lock:
+                    entry.df, entry.report, entry.stats = df, report, stats
+                    entry.last_used = time.time()
+                    self._enforce_budget(keep=dataset_id)
+                print(f"📦 Loaded dataset '{dataset_id}' ({report.rows} rows, {report.seconds * 1000:.1f} ms)")
+        return entry
+
+    def acquire(self, dataset_id: str) -> DatasetEntry:
+        """get(), and keep the dataset from being evicted until release(entry)."""
+        while True:
+            entry = self.get(dataset_id)
+            with self._lock:
+                if entry.loaded:  # Not evicted since get() returned
+                    entry.leases += 1
+                    return entry
+
+    def release(self, entry: DatasetEntry):
+        with self._lock:
+            entry.leases = max(0, entry.leases - 1)
+
+    def get_agent(self, entry: DatasetEntry):
+        """
+        Build the dataset's agent on first use. Building takes seconds, so it
+        holds only the entry's lock; lookups of this and other datasets go on.
+        An entry evicted meanwhile is loaded again first.
+        """
+        while True:
+            if not entry.loaded:
+                entry = self.get(entry.id)
+            with entry.lock:
+                if entry.agent is not None:
+                    return entry.agent
+                df = entry.df
+                if df is None:  # Evicted again before the lock was taken
+                    continue
+                agent = self.agent_factory(df)
+                with self._lock:
+                    if entry.df is df:  # Not evicted or replaced meanwhile
+                        entry.agent = agent
+                return agent
+
+    def loaded_bytes(self) -> int:
+        return sum(entry.memory_bytes for entry in self._entries.values() if entry.loaded)
+
+    def _enforce_budget(self, keep: str):
+        """Unload least recently used datasets until under the memory budget."""
+        if not self.memory_budget_bytes:
+            return
+        candidates = sorted(
+            (e for e in self._entries.values() if e.loaded and not e.pinned and not e.leases and e.id != keep),
+            key=lambda e: e.last_used,
+        )
+        for entry in candidates:
+            if self.loaded_bytes() <= self.memory_budget_bytes:
+                break
+            entry.df = entry.report = entry.stats = entry.agent = entry.checksum = None
+            self.evictions += 1
+            print(f"♻️ Evicted dataset '{entry.id}' to stay within the memory budget")
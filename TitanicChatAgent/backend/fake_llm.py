@@ -0,0 +1,57 @@
+"""
+Deterministic stand-in LLM that replays recorded ReAct traces.
+
+Each trace is a question plus the LLM outputs the agent produced for it,
+one per step. The pandas tool calls in those outputs still run against
+the real DataFrame, so only the model is faked. Used by benchmark.py to
+exercise the full agent path without network access or API keys.
+"""
+import asyncio
+import json
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.llms import LLM
+
+
+QUESTION_MARKER = "\nQuestion: "
+OBSERVATION_MARKER = "Observation:"
+FALLBACK_STEP = "Thought: I now know the final answer.\nFinal Answer: I could not find that in the Titanic dataset."
+
+
+def load_traces(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ReplayLLM(LLM):
+    """Answers agent prompts by replaying the recorded step for the current question."""
+
+    traces: List[dict]
+    latency: float = 0.0  # Simulated seconds per LLM call
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def next_step(self, prompt: str) -> str:
+        # The question and the scratchpad so far follow the last "Question:" line
+        tail = prompt[prompt.rfind(QUESTION_MARKER):].lower()
+        for trace in self.traces:
+            if trace["question"].lower() in tail:
+                step = tail.count(OBSERVATION_MARKER.lower())
+                return trace["steps"][min(step, len(trace["steps"]) - 1)]
+        return FALLBACK_STEP
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.next_step(prompt)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.next_step(prompt)
@@ -0,0 +1,81 @@
+"""
+Synthetic passenger manifests for benchmarking the out-of-core mode.
+
+Resamples rows of the Titanic CSV (so survival still depends on sex, class
+and age the way it does in the real data) and jitters ages and fares. The
+output is written to Parquet one row group per chunk, so memory stays at one
+chunk whatever the row count:
+
+    python generate_dataset.py --rows 10000000 --output ../data/passengers_10m.parquet
+
+Files with at least DATASET_OUT_OF_CORE_ROWS rows are then scanned in chunks
+(see chunked_dataset). Point the offline benchmark at one to measure it:
+
+    DATASET_PATH=../data/passengers_10m.parquet python benchmark.py --scenarios info,fast_path,viz
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE = os.path.join(BACKEND_DIR, "..", "data", "titanic.csv")
+DEFAULT_OUTPUT = os.path.join(BACKEND_DIR, "..", "data", "passengers.parquet")
+# Compact Parquet types; text columns stay plain strings so chunks share one schema
+SCHEMA = pa.schema([
+    ("survived", pa.int8()), ("pclass", pa.int8()), ("sex", pa.string()), ("age", pa.float32()),
+    ("sibsp", pa.int8()), ("parch", pa.int8()), ("fare", pa.float32()), ("embarked", pa.string()),
+    ("class", pa.string()), ("who", pa.string()), ("adult_male", pa.bool_()), ("deck", pa.string()),
+    ("embark_town", pa.string()), ("alive", pa.string()), ("alone", pa.bool_()),
+])
+
+
+def synthetic_chunks(source: pd.DataFrame, rows: int, chunk_rows: int, seed: int = 0, jitter: bool = True):
+    """DataFrames of resampled passengers, chunk_rows at a time."""
+    rng = np.random.default_rng(seed)
+    remaining = rows
+    while remaining > 0:
+        size = min(chunk_rows, remaining)
+        chunk = source.iloc[rng.integers(0, len(source), size)].reset_index(drop=True)
+        if jitter:
+            # Ages move by about a year (one decimal), fares by about 10% (cents)
+            chunk["age"] = (chunk["age"] + rng.normal(0, 1, size)).clip(0.17, 90).round(1)
+            chunk["fare"] = (chunk["fare"] * rng.lognormal(0, 0.1, size)).round(2)
+        remaining -= size
+        yield chunk
+
+
+def generate(output: str, rows: int, chunk_rows: int = 1_000_000, seed: int = 0,
+             jitter: bool = True, source_path: str = DEFAULT_SOURCE) -> int:
+    """Write `rows` synthetic passengers to a Parquet file; returns its size in bytes."""
+    source = pd.read_csv(source_path)[SCHEMA.names]
+    tmp_path = f"{output}.{os.getpid()}.tmp"
+    with pq.ParquetWriter(tmp_path, SCHEMA) as writer:
+        for chunk in synthetic_chunks(source, rows, chunk_rows, seed, jitter):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=SCHEMA, preserve_index=False))
+    os.replace(tmp_path, output)
+    return os.path.getsize(output)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic passenger manifest as Parquet")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000, help="Rows per chunk and Parquet row group")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-jitter", action="store_true", help="Copy ages and fares unchanged")
+    parser.add_argument("--source", default=DEFAULT_SOURCE)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    start = time.perf_counter()
+    size = generate(args.output, args.rows, args.chunk_rows, args.seed, not args.no_jitter, args.source)
+    print(f"📄 Wrote {args.rows:,} passengers to {args.output} "
+          f"({size / 1024 / 1024:.1f} MB in {time.perf_counter() - start:.1f} s)")
@@ -0,0 +1,219 @@
+"""
+Compiled intent router for incoming questions.
+
+The guard and visualization vocabularies are compiled once into a single
+regex automaton: every phrase goes into a character trie that is emitted
+as one factored, word-bounded alternation, so the regex engine scans a
+question once and each match is mapped back to its tags with a dict
+lookup. One pass answers: is the question about the Titanic data, is it
+off-topic, does it ask for a chart (and which kind), and which columns it
+targets. Matching whole words avoids the substring false positives of
+the old keyword lists ("age" in "message", "car" in "scarce", "travel" in
+"travelling").
+
+Run directly to score the router against the labeled question set:
+
+    python intent_router.py
+"""
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+# Titanic vocabulary per target column (None = on topic, no specific column).
+# Comma-separated phrases; a trailing * matches any word with that stem.
+TITANIC_TERMS = {
+    None: "titanic, dataset, datasets, ship, voyage, aboard, on board, onboard, passenger, passengers, family, families",
+    "survived": "surviv*, died, death, deaths, perish*, alive, lived, rescued, lifeboat, lifeboats",
+    "age": "age, ages, aged, old, older, oldest, young, younger, youngest, elderly, child, children, "
+           "kid, kids, infant, infants, baby, babies, adult, adults, teenager, teenagers",
+    "fare": "fare, fares, ticket, tickets, ticket price, ticket prices, paid",
+    "pclass": "class, classes, pclass, first class, second class, third class",
+    "embarked": "embark*, port, ports, southampton, cherbourg, queenstown",
+    "sex": "sex, gender, genders, male, males, female, females, man, men, woman, women",
+    "sibsp": "sibling, siblings, spouse, spouses, sibsp, brother, brothers, sister, sisters, husband, husbands, wife, wives",
+    "parch": "parent, parents, parch, mother, mothers, father, fathers",
+    "deck": "deck, decks, cabin, cabins",
+    "alone": "alone, solo",
+}
+
+# Topics the assistant refuses unless the question is also about the Titanic
+OFF_TOPIC_TERMS = (
+    "weather, news, joke, jokes, recipe, recipes, movie, movies, song, songs, game, games, "
+    "sport, sports, politics, celebrity, celebrities, stock, stocks, crypto*, bitcoin, programming, "
+    "hello, hi, hey, who are you, what is your name, how are you, president, country, capital, "
+    "football, basketball, restaurant, restaurants, food, travel, hotel, hotels, car, cars, "
+    "phone, phones, computer, computers"
+)
+
+# Visualization vocabulary per chart type (None = any chart)
+VIZ_TERMS = {
+    "histogram": "histogram, histograms",
+    "bar": "bar chart, bar charts, bar graph, bar graphs, bars",
+    "pie": "pie chart, pie charts, pie",
+    None: "chart, charts, graph, graphs, plot, plots, plotting, show me, visualize, visualise, "
+          "visualization, visualisation, distribution, distributions, breakdown",
+}
+
+# Questions this short are rejected unless they name Titanic vocabulary
+MIN_UNRELATED_WORDS = 3
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _parse_terms(entries: list) -> tuple:
+    """
+    Split (kind, value, comma-separated terms) entries into the phrase table
+    {"phrase": (kind, value)} and the stem list [(stem, kind, value)].
+    """
+    phrases, stems = {}, []
+    for kind, value, terms in entries:
+        for term in terms.split(","):
+            term = term.strip().lower()
+            if term.endswith("*"):
+                stems.append((term[:-1], kind, value))
+            else:
+                phrases[" ".join(WORD_PATTERN.findall(term))] = (kind, value)
+    return phrases, stems
+
+
+def _trie_pattern(phrases: list) -> str:
+    """Factor phrases into a trie-shaped alternation, e.g. ["man", "male"] -> "ma(?:le|n)"."""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        branches = [(r"[\s-]+" if char == " " else re.escape(char)) + emit(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Optional continuation: greedy, so the longest phrase wins
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(trie)
+
+
+def _compile(entries: list) -> tuple:
+    phrases, stems = _parse_terms(entries)
+    alternatives = [_trie_pattern(list(phrases))]
+    if stems:
+        alternatives.append("(?:" + "|".join(re.escape(stem) for stem, _, _ in stems) + r")\w*")
+    pattern = re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+    return pattern, phrases, tuple(stems)
+
+
+ROUTER_PATTERN, ROUTER_PHRASES, ROUTER_STEMS = _compile(
+    [("titanic", column, terms) for column, terms in TITANIC_TERMS.items()]
+    + [("off_topic", None, OFF_TOPIC_TERMS)]
+    + [("viz", chart, terms) for chart, terms in VIZ_TERMS.items()]
+)
+
+
+@dataclass
+class Intent:
+    """What a question is about, from one pass of the router."""
+    titanic_related: bool = False
+    off_topic: bool = False  # The relevance guard should reject the question
+    unrelated_subject: bool = False  # Names an off-topic subject (not just too short to judge)
+    wants_visualization: bool = False
+    chart: Optional[str] = None  # "histogram", "bar" or "pie" when asked for explicitly
+    columns: list = field(default_factory=list)  # Target columns in order of mention
+    terms: list = field(default_factory=list)
+
+
+def _tag(term: str) -> Optional[tuple]:
+    tag = ROUTER_PHRASES.get(term)
+    if tag is None:
+        for stem, kind, value in ROUTER_STEMS:
+            if term.startswith(stem):
+                return kind, value
+    return tag
+
+
+def route(question: str) -> Intent:
+    """Classify a question in a single scan of the compiled automaton."""
+    intent = Intent()
+    off_topic_hit = False
+    for match in ROUTER_PATTERN.finditer(question.lower()):
+        term = " ".join(WORD_PATTERN.findall(match.group(0)))
+        kind, value = _tag(term)
+        intent.terms.append(term)
+        if kind == "titanic":
+            intent.titanic_related = True
+            if value and value not in intent.columns:
+                intent.columns.append(value)
+        elif kind == "off_topic":
+            off_topic_hit = True
+        else:
+            intent.wants_visualization = True
+            intent.chart = intent.chart or value
+    too_short = len(question.split()) < MIN_UNRELATED_WORDS
+    intent.unrelated_subject = off_topic_hit
+    intent.off_topic = not intent.titanic_related and (off_topic_hit or too_short)
+    return intent
+
+
+def _precision_recall(true_positives: int, predicted: int, actual: int) -> dict:
+    return {
+        "precision": round(true_positives / predicted, 4) if predicted else 1.0,
+        "recall": round(true_positives / actual, 4) if actual else 1.0,
+        "support": actual,
+    }
+
+
+def evaluate(examples: list) -> dict:
+    """
+    Precision and recall of the router on labeled examples, each a dict with
+    "question", "off_topic", "visualization" and "columns".
+    Columns are scored micro-averaged over all (question, column) pairs.
+    """
+    counts = {label: [0, 0, 0] for label in ("off_topic", "visualization", "columns")}
+    mistakes = []
+    for example in examples:
+        intent = route(example["question"])
+        predicted = {
+            "off_topic": intent.off_topic,
+            "visualization": intent.wants_visualization,
+            "columns": set(intent.columns),
+        }
+        for label in ("off_topic", "visualization"):
+            tp, pred, act = counts[label]
+            counts[label] = [tp + (predicted[label] and example[label]),
+                             pred + predicted[label], act + example[label]]
+        expected_columns = set(example.get("columns", []))
+        tp, pred, act = counts["columns"]
+        counts["columns"] = [tp + len(predicted["columns"] & expected_columns),
+                             pred + len(predicted["columns"]), act + len(expected_columns)]
+        if (predicted["off_topic"] != example["off_topic"]
+                or predicted["visualization"] != example["visualization"]
+                or predicted["columns"] != expected_columns):
+            mistakes.append({"question": example["question"],
+                             "expected": {k: example.get(k) for k in ("off_topic", "visualization", "columns")},
+                             "predicted": {**predicted, "columns": sorted(predicted["columns"])}})
+    report = {label: _precision_recall(*values) for label, values in counts.items()}
+    report["examples"] = len(examples)
+    report["mistakes"] = mistakes
+    return report
+
+
+DEFAULT_TEST_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "intent_test_set.json")
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TEST_SET
+    with open(path, "r", encoding="utf-8") as f:
+        report = evaluate(json.load(f))
+    print(f"{'label':<15} {'precision':>10} {'recall':>8} {'support':>8}")
+    for label in ("off_topic", "visualization", "columns"):
+        scores = report[label]
+        print(f"{label:<15} {scores['precision']:>10.2%} {scores['recall']:>8.2%} {scores['support']:>8}")
+    for mistake in report["mistakes"]:
+        print(f"\n❌ {mistake['question']}\n   expected  {mistake['expected']}\n   predicted {mistake['predicted']}")
@@ -0,0 +1,240 @@
+"""
+LLM provider selection and a batching client for local models.
+
+LLM_PROVIDER picks the model explicitly instead of relying on which SDK
+happens to be importable:
+
+- groq: ChatGroq (hosted, the default)
+- openai: ChatOpenAI (hosted)
+- local: any OpenAI-compatible completion server, e.g. llama.cpp's
+  llama-server, vLLM or a local stand-in; no API key or daily quota
+- llamacpp: a GGUF model loaded in-process with llama-cpp-python
+- replay: ReplayLLM over recorded traces, for air-gapped demos and tests
+
+Local providers go through BatchingLLM. Agent calls that arrive within a
+short window of each other are sent to the backend as one batched
+completion request. A server running with continuous batching
+(llama-server --cont-batching, vLLM) then decodes them in shared forward
+passes instead of queueing them one request at a time.
+"""
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+from langchain_core.language_models.llms import LLM
+
+
+PROVIDERS = ("groq", "openai", "local", "llamacpp", "replay")
+DEFAULT_MODELS = {"groq": "llama-3.3-70b-versatile", "openai": "gpt-3.5-turbo", "local": "local"}
+# Every provider, OpenAI included, drives the ReAct (zero-shot) agent: the typed
+# tools need it, and the pinned langchain_experimental rejects "openai-tools"
+AGENT_TYPE = "zero-shot-react-description"
+
+
+class OpenAICompatibleBackend:
+    """Batched text completions from an OpenAI-compatible /v1/completions endpoint."""
+
+    def __init__(self, base_url: str, model: str, api_key: Optional[str] = None,
+                 max_tokens: int = 512, temperature: float = 0.0, timeout: float = 120.0,
+                 cache_prompt: bool = True):
+        self.url = base_url.rstrip("/") + "/completions"
+        self.model = model
+        self.api_key = api_key
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.timeout = timeout
+        self.cache_prompt = cache_prompt
+
+    def complete(self, prompts: list, stop: Optional[list] = None) -> list:
+        payload = {"model": self.model, "prompt": prompts, "max_tokens": self.max_tokens,
+                   "temperature": self.temperature}
+        if stop:
+            payload["stop"] = stop
+        if self.cache_prompt:
+            # llama-server keeps the KV cache of the shared prompt prefix between requests
+            payload["cache_prompt"] = True
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode(), headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.load(response)
+        except urllib.error.URLError as e:
+            raise ConnectionError(f"Local LLM server at {self.url} is unreachable: {e}") from e
+        texts = [""] * len(prompts)
+        for position, choice in enumerate(body.get("choices", [])):
+            texts[choice.get("index", position)] = choice.get("text", "")
+        return texts
+
+
+class LlamaCppBackend:
+    """A GGUF model run in-process. llama-cpp-python decodes one sequence at a time."""
+
+    def __init__(self, model_path: str, max_tokens: int = 512, temperature: float = 0.0,
+                 n_ctx: int = 4096, n_threads: Optional[int] = None, cache_prompt: bool = True):
+        try:
+            from llama_cpp import Llama, LlamaRAMCache
+        except ImportError:
+            raise ImportError("LLM_PROVIDER=llamacpp needs llama-cpp-python: pip install llama-cpp-python")
+        if not model_path:
+            raise ValueError("LLM_PROVIDER=llamacpp needs LOCAL_LLM_MODEL_PATH to point at a GGUF file")
+        self.model = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
+        if cache_prompt:
+            # Reuse the evaluated system prompt and tool list across agent calls
+            self.model.set_cache(LlamaRAMCache())
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self._lock = threading.Lock()
+
+    def complete(self, prompts: list, stop: Optional[list] = None) -> list:
+        with self._lock:
+            return [self.model(prompt, max_tokens=self.max_tokens, temperature=self.temperature,
+                               stop=stop or [])["choices"][0]["text"] for prompt in prompts]
+
+
+def truncate_at_stop(text: str, stop: Optional[list]) -> str:
+    """Cut a completion at the first stop sequence, for servers that ignore "stop"."""
+    cut = min((text.find(s) for s in stop or () if s in text), default=-1)
+    return text[:cut] if cut >= 0 else text
+
+
+@dataclass
+class _Pending:
+    prompt: str
+    stop: Optional[list]
+    future: Future = field(default_factory=Future)
+
+
+class PromptBatcher:
+    """
+    Collects completion requests from concurrent agent runs and sends them to
+    the backend in batches of up to max_batch, waiting at most `window`
+    seconds for a batch to fill. Up to max_inflight batches run at once.
+    """
+
+    def __init__(self, backend, max_batch: int = 8, window: float = 0.01, max_inflight: int = 2):
+        self.backend = backend
+        self.max_batch = max(1, max_batch)
+        self.window = window
+        self.batches = 0
+        self.prompts = 0
+        self.largest_batch = 0
+        self._queue = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_inflight), thread_name_prefix="llm-batch")
+        self._lock = threading.Lock()
+        threading.Thread(target=self._collect, name="llm-batcher", daemon=True).start()
+
+    def submit(self, prompt: str, stop: Optional[list] = None) -> Future:
+        pending = _Pending(prompt, list(stop) if stop else None)
+        self._queue.put(pending)
+        return pending.future
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Only prompts with the same stop sequences can share a request
+            groups = {}
+            for pending in batch:
+                groups.setdefault(tuple(pending.stop or ()), []).append(pending)
+            for stop, items in groups.items():
+                self._pool.submit(self._run, items, list(stop) or None)
+
+    def _run(self, items: list, stop: Optional[list]):
+        with self._lock:
+            self.batches += 1
+            self.prompts += len(items)
+            self.largest_batch = max(self.largest_batch, len(items))
+        try:
+            texts = self.backend.complete([item.prompt for item in items], stop)
+        except Exception as e:
+            for item in items:
+                item.future.set_exception(e)
+            return
+        for item, text in zip(items, texts):
+            item.future.set_result(truncate_at_stop(text, stop))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "prompts": self.prompts,
+                "largest_batch": self.largest_batch,
+                "mean_batch_size": round(self.prompts / self.batches, 2) if self.batches else 0.0,
+                "max_batch": self.max_batch,
+                "window_ms": round(self.window * 1000, 3),
+            }
+
+
+class BatchingLLM(LLM):
+    """LangChain LLM whose calls are grouped into batched backend requests."""
+
+    batcher: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "batching-local"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return self.batcher.submit(prompt, stop).result()
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return await asyncio.wrap_future(self.batcher.submit(prompt, stop))
+
+
+def create_llm(provider: str, model: Optional[str] = None, groq_api_key: Optional[str] = None,
+               openai_api_key: Optional[str] = None, local_base_url: str = "http://localhost:8080/v1",
+               local_api_key: Optional[str] = None, local_model_path: Optional[str] = None,
+               max_tokens: int = 512, max_batch: int = 8, batch_window: float = 0.01,
+               max_inflight: int = 2, cache_prompt: bool = True, replay_traces: Optional[str] = None) -> tuple:
+    """Build the configured model; returns (llm, agent_type)."""
+    provider = provider.lower()
+    model = model or DEFAULT_MODELS.get(provider)
+    if provider == "groq":
+        from langchain_groq import ChatGroq
+        llm = ChatGroq(temperature=0, model=model, groq_api_key=groq_api_key,
+                       streaming=True)  # Emit tokens to callbacks for /query/stream
+        print("✅ Using Groq LLM (FREE)")
+    elif provider == "openai":
+        from langchain_openai import ChatOpenAI
+        llm = ChatOpenAI(temperature=0, model=model, openai_api_key=openai_api_key, streaming=True)
+        print("⚠️ Using OpenAI (may have quota issues)")
+    elif provider in ("local", "llamacpp"):
+        if provider == "local":
+            backend = OpenAICompatibleBackend(local_base_url, model, api_key=local_api_key, max_tokens=max_tokens,
+                                              cache_prompt=cache_prompt)
+        else:
+            backend = LlamaCppBackend(local_model_path, max_tokens=max_tokens, cache_prompt=cache_prompt)
+        llm = BatchingLLM(batcher=PromptBatcher(backend, max_batch=max_batch, window=batch_window,
+                                                max_inflight=max_inflight))
+        print(f"🖥️ Using local LLM ({provider}, batches of up to {max_batch})")
+    elif provider == "replay":
+        from fake_llm import ReplayLLM, load_traces
+        traces = replay_traces or os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "react_traces.json")
+        llm = ReplayLLM(traces=load_traces(traces))
+        print("📼 Using replayed LLM traces (offline)")
+    else:
+        raise ValueError(f"Unknown LLM_PROVIDER '{provider}', expected one of: {', '.join(PROVIDERS)}")
+    return llm, AGENT_TYPE
+
+
+def llm_stats(llm) -> dict:
+    """Batching counters for local providers (empty for hosted ones)."""
+    return llm.batcher.stats() if isinstance(llm, BatchingLLM) else {}
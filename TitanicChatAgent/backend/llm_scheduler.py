@@ -0,0 +1,254 @@
+"""
+Token budget and scheduling for LLM-backed agent runs.
+
+TokenBudget tracks the tokens spent in the last minute and the last 24
+hours against the provider quota. LLMScheduler sits in front of the agent
+runner. Each agent run reserves its estimated tokens and waits, interactive
+requests ahead of batch ones, until the per-minute window has room. Runs
+held back only by other runs' reservations wait for one of them to settle
+instead. When the run ends, the tokens it actually used are recorded. A 429 from the
+provider pauses every caller for a jittered, exponentially growing delay,
+and the run is retried.
+
+When the daily budget is nearly used up, or a request would wait longer
+than max_wait, BudgetExhaustedError tells the caller to fall back to
+answers that need no LLM.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections import deque
+from typing import Callable, Optional
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+POLL_INTERVAL = 0.05  # Seconds between checks while waiting for budget
+MINUTE = 60.0
+DAY = 86400.0
+
+
+class BudgetExhaustedError(Exception):
+    """Raised when an agent run cannot fit in the token budget soon enough."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBudget:
+    """Tokens spent in rolling one-minute and 24-hour windows. A limit of 0 means unlimited."""
+
+    def __init__(self, tokens_per_minute: int = 0, tokens_per_day: int = 0, clock: Callable = time.monotonic):
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens_per_day = tokens_per_day
+        self.reserved = 0  # Estimated tokens of runs in flight
+        self._clock = clock
+        self._minute = deque()  # (timestamp, tokens)
+        self._day = deque()
+
+    def _prune(self, now: float):
+        for window, span in ((self._minute, MINUTE), (self._day, DAY)):
+            while window and now - window[0][0] >= span:
+                window.popleft()
+
+    def used(self) -> tuple:
+        """Tokens recorded in the last minute and the last 24 hours."""
+        self._prune(self._clock())
+        return sum(t for _, t in self._minute), sum(t for _, t in self._day)
+
+    def day_fraction(self) -> float:
+        if not self.tokens_per_day:
+            return 0.0
+        return (self.used()[1] + self.reserved) / self.tokens_per_day
+
+    def fits_today(self, tokens: int) -> bool:
+        return not self.tokens_per_day or self.used()[1] + self.reserved + tokens <= self.tokens_per_day
+
+    def wait_time(self, tokens: int) -> Optional[float]:
+        """
+        Seconds until the minute window has room for `tokens` more (0 if it has now).
+        None when only runs in flight are in the way: room frees up as they settle.
+        """
+        if not self.tokens_per_minute:
+            return 0.0
+        now = self._clock()
+        self._prune(now)
+        excess = sum(t for _, t in self._minute) + self.reserved + tokens - self.tokens_per_minute
+        if excess <= 0:
+            return 0.0
+        # Wait until enough of the oldest entries have left the window
+        for timestamp, spent in self._minute:
+            excess -= spent
+            if excess <= 0:
+                return max(0.0, timestamp + MINUTE - now)
+        if self.reserved and tokens <= self.tokens_per_minute:
+            return None
+        return MINUTE  # More than a whole minute's budget; it never fits
+
+    def reserve(self, tokens: int):
+        self.reserved += tokens
+
+    def settle(self, reserved: int, actual: int):
+        """Replace a reservation with the tokens the run actually used."""
+        self.reserved = max(0, self.reserved - reserved)
+        if actual:
+            now = self._clock()
+            self._minute.append((now, actual))
+            self._day.append((now, actual))
+
+    def stats(self) -> dict:
+        minute, day = self.used()
+        return {
+            "tokens_per_minute": self.tokens_per_minute or None,
+            "tokens_per_day": self.tokens_per_day or None,
+            "minute_used": minute,
+            "day_used": day,
+            "reserved": self.reserved,
+            "minute_remaining": max(0, self.tokens_per_minute - minute - self.reserved) if self.tokens_per_minute else None,
+            "day_remaining": max(0, self.tokens_per_day - day - self.reserved) if self.tokens_per_day else None,
+        }
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """The provider's Retry-After header, when the error carries an HTTP response."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    """Admits agent runs within the token budget and retries rate-limited ones."""
+
+    def __init__(self, budget: TokenBudget, is_rate_limit: Callable[[Exception], bool],
+                 tokens_per_run: int = 3000, max_wait: float = 10.0, max_retries: int = 3,
+                 backoff_base: float = 1.0, backoff_max: float = 30.0, degrade_at: float = 0.9):
+        self.budget = budget
+        self.is_rate_limit = is_rate_limit
+        self.tokens_per_run = tokens_per_run  # Running estimate, updated from actual usage
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.degrade_at = degrade_at
+        self.admitted = 0
+        self.delayed = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.degraded = 0
+        self._blocked_until = 0.0
+        self._waiting = []  # Heap of (priority, sequence) tickets
+        self._sequence = itertools.count()
+        self._settle_waiters = []  # Futures resolved whenever a run settles its reservation
+
+    def should_degrade(self) -> bool:
+        """True once the daily budget is nearly used up: answer without the LLM instead."""
+        return self.budget.day_fraction() >= self.degrade_at
+
+    def blocked_for(self) -> float:
+        return max(0.0, self._blocked_until - time.monotonic())
+
+    def backoff_delay(self, attempt: int, error: Exception = None) -> float:
+        """Exponential backoff with jitter, never shorter than the provider's Retry-After."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        delay = random.uniform(delay / 2, delay)
+        return max(delay, retry_after_seconds(error) or 0.0)
+
+    async def _wait_for_settle(self):
+        waiter = asyncio.get_running_loop().create_future()
+        self._settle_waiters.append(waiter)
+        try:
+            await waiter
+        finally:
+            if waiter in self._settle_waiters:
+                self._settle_waiters.remove(waiter)
+
+    def _notify_settled(self):
+        waiters, self._settle_waiters = self._settle_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def _admit(self, tokens: int, priority: int):
+        ticket = (priority, next(self._sequence))
+        heapq.heappush(self._waiting, ticket)
+        deadline = time.monotonic() + self.max_wait
+        delayed = False
+        try:
+            while True:
+                if not self.budget.fits_today(tokens):
+                    raise BudgetExhaustedError("Daily token budget used up", retry_after=DAY)
+                window_wait = self.budget.wait_time(tokens)
+                delay = max(window_wait or 0.0, self.blocked_for())
+                if window_wait is not None and delay <= 0 and self._waiting[0] == ticket:
+                    self.budget.reserve(tokens)
+                    self.admitted += 1
+                    return
+                if delay > 0 and time.monotonic() + delay > deadline:
+                    raise BudgetExhaustedError("Token budget busy", retry_after=delay)
+                if not delayed:
+                    delayed = True
+                    self.delayed += 1
+                if window_wait is None:
+                    # Runs in flight hold the room; the agent timeout bounds how long they keep it
+                    await self._wait_for_settle()
+                else:
+                    await asyncio.sleep(min(max(delay, 0.005), POLL_INTERVAL))
+        finally:
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+
+    async def run(self, call: Callable, priority: int = PRIORITY_INTERACTIVE,
+                  usage: Optional[Callable[[], int]] = None):
+        """
+        Await call() once the budget allows, retrying on provider rate limits.
+        usage() returns the tokens the run actually spent; runs rejected, timed out or
+        cancelled before their first LLM call report 0 and are charged nothing.
+        Raises BudgetExhaustedError when the run cannot be admitted or keeps being rate limited.
+        """
+        if self.should_degrade():
+            raise BudgetExhaustedError("Daily token budget nearly used up", retry_after=DAY)
+        estimate = self.tokens_per_run
+        await self._admit(estimate, priority)
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return await call()
+                except Exception as e:
+                    if not self.is_rate_limit(e):
+                        raise
+                    self.rate_limited += 1
+                    attempt += 1
+                    delay = self.backoff_delay(attempt, e)
+                    # Everyone waits: the quota is shared by all requests
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+                    if attempt > self.max_retries or delay > self.max_wait:
+                        raise BudgetExhaustedError("Provider rate limit", retry_after=delay) from e
+                    self.retries += 1
+                    await asyncio.sleep(delay)
+        finally:
+            actual = usage() if usage else 0
+            self.budget.settle(estimate, actual)
+            self._notify_settled()
+            if actual:
+                self.tokens_per_run = round(0.8 * self.tokens_per_run + 0.2 * actual)
+
+    def stats(self) -> dict:
+        return {
+            **self.budget.stats(),
+            "tokens_per_run_estimate": self.tokens_per_run,
+            "degrade_at": self.degrade_at,
+            "degrading": self.should_degrade(),
+            "blocked_for_s": round(self.blocked_for(), 3),
+            "waiting": len(self._waiting),
+            "admitted": self.admitted,
+            "delayed": self.delayed,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "degraded": self.degraded,
+        }
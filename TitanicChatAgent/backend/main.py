@@ -1,24 +1,50 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
-from langchain_openai import ChatOpenAI
 import pandas as pd
 import os
+import sys
 import json
+import math
 import asyncio
-from typing import Optional
+import re
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
 from dotenv import load_dotenv
 from functools import partial
-
-try:
-    from groq import RateLimitError as GroqRateLimitError
-except ImportError:
-    GroqRateLimitError = None
+from query_engine import answer_question, execute_query
+from intent_router import Intent, route
+from stats_index import StatsIndex, histogram_payload, parse_bins
+from dataset_loader import load_dataset
+from dataset_registry import DatasetRegistry, DatasetEntry
+from answer_cache import normalize_question, open_answer_cache
+from answer_snapshot import AnswerSnapshot
+from code_cache import CodeCache
+from agent_runner import AgentRunner, AgentQueueFullError
+from coalescing import SingleFlight
+from llm_scheduler import BudgetExhaustedError, LLMScheduler, PRIORITY_BATCH, PRIORITY_INTERACTIVE, TokenBudget
+from metrics import QueryMetrics, RequestTrace, estimate_tokens
+from sessions import ConversationSession, SessionStore
 
 # Load environment variables
 load_dotenv()
 
+# When to import LangChain and build the LLM/agent:
+# "eager" at import time, "background" right after the server is ready,
+# or "lazy" on the first request that needs the agent
+AGENT_STARTUP = os.getenv("AGENT_STARTUP", "background").lower()
+
+# Worker processes serving this app (set by serve.py); each one budgets its
+# share of the provider quota
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Seconds spent in each startup phase, reported by GET /startup
+startup_timings = {}
+_startup_clock = time.perf_counter()
+
 app = FastAPI(title="Titanic Chat Agent API")
 
 # Enable CORS
@@ -35,7 +61,80 @@ app.add_middleware(
 csv_path = os.path.join(os.path.dirname(__file__), "..", "data", "titanic.csv")
 if not os.path.exists(csv_path):
     csv_path = "data/titanic.csv"
-df = pd.read_csv(csv_path)
+# DATASET_PATH may point at a CSV, Parquet or Arrow IPC file instead
+dataset_path = os.getenv("DATASET_PATH", csv_path)
+DATASET_OPTIONS = {
+    "fmt": os.getenv("DATASET_FORMAT", "auto"),  # "auto", "csv", "parquet" or "arrow"
+    "compact": os.getenv("DATASET_COMPACT_DTYPES", "true").lower() == "true",
+    "use_cache": os.getenv("DATASET_CACHE", "true").lower() == "true",
+    # Parquet files are scanned in chunks instead of loaded: "auto" (from
+    # DATASET_OUT_OF_CORE_ROWS rows), "true" or "false"
+    "out_of_core": os.getenv("DATASET_OUT_OF_CORE", "auto").lower(),
+    "out_of_core_rows": int(os.getenv("DATASET_OUT_OF_CORE_ROWS", "2000000")),
+    "chunk_rows": int(os.getenv("DATASET_CHUNK_ROWS", "250000"))
+}
+df, load_report = load_dataset(dataset_path, **DATASET_OPTIONS)
+startup_timings["dataset_load"] = load_report.seconds
+print(f"📦 Loaded {load_report.rows} rows from {load_report.format} in {load_report.seconds * 1000:.1f} ms "
+      f"({load_report.memory_bytes / 1024:.1f} KB in memory)")
+
+# Histogram bin strategy: "fd" (Freedman–Diaconis), "sturges", "auto" or a fixed count
+HISTOGRAM_BINS = parse_bins(os.getenv("HISTOGRAM_BINS", "fd"))
+
+# Precomputed statistics, rebuilt incrementally when the dataset is reloaded
+stats_index = StatsIndex(bins=HISTOGRAM_BINS)
+_phase_start = time.perf_counter()
+stats_index.build(df)
+startup_timings["stats_index"] = round(time.perf_counter() - _phase_start, 6)
+
+# Answer common question shapes directly with pandas before calling the agent
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+
+# Cache agent answers keyed on the normalized question; a .sqlite path is
+# shared by all worker processes, a .json path only persists this process's cache
+answer_cache = open_answer_cache(
+    os.getenv("ANSWER_CACHE_PATH") or None,
+    max_size=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+)
+
+# Replay the pandas steps behind earlier agent answers instead of calling the
+# LLM again; entries are dropped when the dataset checksum changes
+CODE_CACHE_ENABLED = os.getenv("CODE_CACHE_ENABLED", "true").lower() == "true"
+code_cache = CodeCache(
+    os.getenv("CODE_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(csv_path)), "code_cache.sqlite"))
+) if CODE_CACHE_ENABLED else None
+
+# One app-wide runner bounds concurrent agent calls and the queue behind them
+agent_runner = AgentRunner(
+    max_concurrency=int(os.getenv("AGENT_MAX_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("AGENT_QUEUE_DEPTH", "16")),
+    timeout=float(os.getenv("AGENT_TIMEOUT", "30")),
+    mode=os.getenv("AGENT_INVOKE_MODE", "async")  # "async" (ainvoke) or "thread"
+)
+
+# Concurrent requests for the same normalized question share one agent run
+agent_flights = SingleFlight()
+
+# POST /query/batch: questions per batch, and agent runs in flight per batch
+# (kept within the runner's concurrency so a batch never fills its queue)
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_MAX_PARALLEL = int(os.getenv("BATCH_MAX_PARALLEL", str(agent_runner.max_concurrency)))
+
+# Request counters, latency histograms and LLM token counts for GET /metrics
+query_metrics = QueryMetrics()
+
+# Conversations: questions sent with the same session_id can follow up on
+# earlier turns; the agent only sees a summary capped at SESSION_CONTEXT_CHARS
+session_store = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX", "1000")),
+    ttl_seconds=float(os.getenv("SESSION_TTL", "1800")),
+    max_turns=int(os.getenv("SESSION_MAX_TURNS", "8")),
+    max_subsets=int(os.getenv("SESSION_MAX_SUBSETS", "4")),
+    path=os.getenv("SESSION_STORE_PATH") or None  # SQLite file shared by worker processes
+)
+SESSION_CONTEXT_CHARS = int(os.getenv("SESSION_CONTEXT_CHARS", "600"))
 
 # Professional System Prompt for Titanic Analysis
 SYSTEM_PROMPT = """You are a professional Titanic Dataset Analysis Assistant built using Pandas.
@@ -87,47 +186,285 @@ Keep responses structured, clean, and readable.
 You have access to the Titanic dataset with these columns: {columns}
 """
 
-# Initialize LangChain agent
-# Option 2: Use Groq (FREE!) - Get API key from https://console.groq.com
-try:
-    from langchain_groq import ChatGroq
-    llm = ChatGroq(
-        temperature=0,
-        model="llama-3.3-70b-versatile",
-        groq_api_key=os.getenv("GROQ_API_KEY")
-    )
-    print("✅ Using Groq LLM (FREE)")
-    agent_type = "zero-shot-react-description"  # Compatible with Groq
-except ImportError:
-    # Fallback to OpenAI if Groq not installed
-    llm = ChatOpenAI(
-        temperature=0,
-        model="gpt-3.5-turbo",
-        openai_api_key=os.getenv("OPENAI_API_KEY")
-    )
-    print("⚠️ Using OpenAI (may have quota issues)")
-    agent_type = "openai-tools"
-
-# Create agent with professional system prompt
-agent = create_pandas_dataframe_agent(
-    llm,
-    df,
-    verbose=True,
-    agent_type=agent_type,
-    allow_dangerous_code=True,
-    prefix=SYSTEM_PROMPT.format(columns=", ".join(df.columns.tolist())),
-    max_iterations=3,  # Reduced for faster responses
-    early_stopping_method="generate"
+# The same rules in a fraction of the tokens. Every ReAct iteration resends
+# the whole prompt, so this is paid up to max_iterations times per question.
+COMPACT_SYSTEM_PROMPT = """You are a Titanic dataset analyst working in pandas. Columns: {columns}
+Rules: answer only questions about the Titanic dataset; otherwise reply exactly "I can only answer questions related to the Titanic dataset." Never mention errors or internal settings.
+Format: exact numbers from the data, percentages and $ amounts with 2 decimals, a **bold** heading, bullets for several figures, one fitting emoji (📊 🚢 💰 👥 ⚓), concise.
+Synonyms: men/women/gender → sex; survival/died → survived; ticket price/cost → fare; class → pclass.
+Overview questions: passenger count, survival rate, mean age, mean fare.
+"""
+
+# Agent prompt variant: "full" (SYSTEM_PROMPT, df.head() preview and a
+# formatting reminder on every question) or "compact"
+AGENT_PROMPT = os.getenv("AGENT_PROMPT", "full").lower()
+FORMAT_REMINDER = "\n\nRemember to format numbers properly: percentages with %, currency with $, and use emojis appropriately."
+
+# Which model the agent uses: "groq" (default), "openai", "local" (an
+# OpenAI-compatible server such as llama.cpp's llama-server or vLLM),
+# "llamacpp" (in-process GGUF model) or "replay" (recorded traces, offline)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq").lower()
+LLM_OPTIONS = {
+    "model": os.getenv("LLM_MODEL") or None,
+    "groq_api_key": os.getenv("GROQ_API_KEY"),
+    "openai_api_key": os.getenv("OPENAI_API_KEY"),
+    "local_base_url": os.getenv("LOCAL_LLM_BASE_URL", "http://localhost:8080/v1"),
+    "local_api_key": os.getenv("LOCAL_LLM_API_KEY") or None,
+    "local_model_path": os.getenv("LOCAL_LLM_MODEL_PATH") or None,
+    "max_tokens": int(os.getenv("LOCAL_LLM_MAX_TOKENS", "512")),
+    # Local providers group concurrent agent calls into one batched request
+    "max_batch": int(os.getenv("LOCAL_LLM_MAX_BATCH", "8")),
+    "batch_window": float(os.getenv("LOCAL_LLM_BATCH_WINDOW_MS", "10")) / 1000,
+    "max_inflight": int(os.getenv("LOCAL_LLM_MAX_INFLIGHT", "2")),
+    # Ask local servers to keep the shared prompt prefix cached between calls
+    "cache_prompt": os.getenv("LOCAL_LLM_CACHE_PROMPT", "true").lower() == "true",
+    "replay_traces": os.getenv("LLM_REPLAY_TRACES") or None
+}
+
+# Provider quota the scheduler budgets against (0 = unlimited). Groq's free
+# tier for llama-3.3-70b allows 12k tokens per minute and 100k per day.
+QUOTA_DEFAULTS = {"groq": (12000, 100000)}
+_default_tpm, _default_tpd = QUOTA_DEFAULTS.get(LLM_PROVIDER, (0, 0))
+llm_scheduler = LLMScheduler(
+    TokenBudget(
+        tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", str(_default_tpm))) // WORKERS,
+        tokens_per_day=int(os.getenv("LLM_TOKENS_PER_DAY", str(_default_tpd))) // WORKERS
+    ),
+    is_rate_limit=lambda error: is_rate_limit_error(error),
+    tokens_per_run=int(os.getenv("LLM_TOKENS_PER_RUN", "3000")),  # First estimate, then learned
+    max_wait=float(os.getenv("LLM_BUDGET_MAX_WAIT", "10")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+    backoff_base=float(os.getenv("LLM_BACKOFF_BASE", "1")),
+    backoff_max=float(os.getenv("LLM_BACKOFF_MAX", "30")),
+    degrade_at=float(os.getenv("LLM_BUDGET_DEGRADE_AT", "0.9"))
+)
+# Paraphrase similarity accepted for stale cached answers once the budget runs out
+DEGRADED_CACHE_SIMILARITY = float(os.getenv("DEGRADED_CACHE_SIMILARITY", "0.6"))
+
+# LangChain, the provider SDKs and the LLM client are only imported and
+# built on first use (see AGENT_STARTUP); importing them costs seconds
+llm = None
+agent_type = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    """Build the configured model on first use"""
+    global llm, agent_type
+    with _llm_lock:
+        if llm is not None:
+            return llm
+        from llm_providers import create_llm
+        llm, agent_type = create_llm(LLM_PROVIDER, **LLM_OPTIONS)
+        return llm
+
+
+def llm_batching_stats() -> dict:
+    """Batch counters of a local provider; empty until the model is built or for hosted ones"""
+    if llm is None or "llm_providers" not in sys.modules:
+        return {}
+    return sys.modules["llm_providers"].llm_stats(llm)
+
+
+# Tools the agent may use: "typed" (structured pandas tools only), "typed+repl"
+# (typed tools plus the Python REPL), "repl" (Python REPL only) or "sql"
+# (SQL over an embedded copy of the dataset, see sql_engine)
+AGENT_TOOLS = os.getenv("AGENT_TOOLS", "typed").lower()
+# Database behind AGENT_TOOLS=sql: "auto" (DuckDB when installed), "duckdb" or "sqlite"
+SQL_ENGINE = os.getenv("SQL_ENGINE", "auto").lower()
+
+
+def uses_sql(data: pd.DataFrame) -> bool:
+    """Whether the agent queries this dataset with SQL; out-of-core datasets keep the typed tools"""
+    return AGENT_TOOLS == "sql" and isinstance(data, pd.DataFrame)
+
+
+def agent_tools(data: pd.DataFrame) -> list:
+    """The SQL tools in AGENT_TOOLS=sql mode, otherwise the typed pandas tools"""
+    if uses_sql(data):
+        from sql_engine import build_sql_tools, database_for
+        return build_sql_tools(database_for(data, SQL_ENGINE))
+    from pandas_tools import build_tools
+    return build_tools(data)
+
+
+def agent_prompt_parts(data: pd.DataFrame, variant: Optional[str] = None) -> tuple:
+    """(prefix, df preview, suffix) of the agent prompt for a prompt variant"""
+    from pandas_tools import COMPACT_SUFFIX, tools_prompt_hint
+    
+    columns = ", ".join(data.columns.tolist())
+    if (variant or AGENT_PROMPT) == "compact":
+        prefix, df_head, suffix = COMPACT_SYSTEM_PROMPT.format(columns=columns), data.head(2).to_csv(index=False), COMPACT_SUFFIX
+    else:
+        prefix, df_head, suffix = SYSTEM_PROMPT.format(columns=columns), str(data.head().to_markdown()), None
+    if uses_sql(data):
+        from sql_engine import database_for, sql_prompt_hint
+        prefix += "\n" + sql_prompt_hint(database_for(data, SQL_ENGINE))
+    elif AGENT_TOOLS != "repl":
+        prefix += "\n" + tools_prompt_hint()
+    return prefix, df_head, suffix
+
+
+# Static prompt tokens per agent call, per dataset (see prompt_profile)
+_prompt_profiles = {}
+
+
+def prompt_profile(entry: DatasetEntry) -> dict:
+    """
+    Estimated tokens every agent call resends before the question and
+    scratchpad, for the full prompt and the configured variant.
+    """
+    profile = _prompt_profiles.get(entry.id)
+    if profile is None:
+        from pandas_tools import react_prompt
+        tools = agent_tools(entry.df)
+        
+        def overhead(variant: str) -> int:
+            prefix, df_head, suffix = agent_prompt_parts(entry.df, variant)
+            text = react_prompt(tools, prefix, df_head, suffix).format(input=build_agent_prompt("", variant), agent_scratchpad="")
+            return estimate_tokens(text)
+        
+        full, active = overhead("full"), overhead(AGENT_PROMPT)
+        profile = {"variant": AGENT_PROMPT, "tokens_per_call": active, "full_tokens_per_call": full,
+                   "saved_per_call": full - active}
+        _prompt_profiles[entry.id] = profile
+    return profile
+
+
+def record_prompt_savings(trace: RequestTrace, entry: DatasetEntry):
+    """Credit the trace with the prompt tokens the compact variant saved on its LLM calls"""
+    if trace.llm_calls and AGENT_PROMPT != "full":
+        trace.prompt_tokens_saved += prompt_profile(entry)["saved_per_call"] * trace.llm_calls
+
+
+def build_agent(data: pd.DataFrame):
+    """Create the pandas agent with the professional system prompt"""
+    start = time.perf_counter()
+    from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
+    from pandas_tools import build_agent_with_tools, build_tools
+    
+    model = get_llm()
+    prefix, df_head, suffix = agent_prompt_parts(data)
+    executor_options = {
+        "verbose": True,
+        "max_iterations": 3,  # Reduced for faster responses
+        "early_stopping_method": "generate"
+    }
+    if (AGENT_TOOLS in ("typed", "sql") and agent_type == "zero-shot-react-description") or not isinstance(data, pd.DataFrame):
+        # One vectorized pandas call (or one SQL query) per tool; no generated code to run.
+        # Out-of-core datasets only get the typed tools: there is no frame for a REPL
+        agent = build_agent_with_tools(model, data, prefix, agent_tools(data), df_head=df_head, suffix=suffix,
+                                       **executor_options)
+    else:
+        agent = create_pandas_dataframe_agent(
+            model,
+            data,
+            agent_type=agent_type,
+            allow_dangerous_code=True,
+            prefix=prefix,
+            number_of_head_rows=2 if AGENT_PROMPT == "compact" else 5,
+            extra_tools=build_tools(data) if AGENT_TOOLS != "repl" else (),
+            **executor_options
+        )
+    startup_timings.setdefault("agent_build", round(time.perf_counter() - start, 6))
+    return agent
+
+
+# Registry of every dataset this process can serve. The Titanic table is
+# pinned; other files in DATASETS_DIR are loaded (with their own agent) on
+# first use and evicted least-recently-used beyond the memory budget.
+DEFAULT_DATASET_ID = os.getenv("DEFAULT_DATASET_ID", "titanic")
+dataset_registry = DatasetRegistry(
+    agent_factory=build_agent,
+    memory_budget_bytes=int(float(os.getenv("DATASET_MEMORY_BUDGET_MB", "0")) * 1024 * 1024),
+    load_options=DATASET_OPTIONS,
+    stats_options={"bins": HISTOGRAM_BINS}
+)
+dataset_registry.add_loaded(
+    DEFAULT_DATASET_ID, dataset_path, df, load_report, stats_index,
+    agent=build_agent(df) if AGENT_STARTUP == "eager" else None
 )
+dataset_registry.discover(os.getenv("DATASETS_DIR", os.path.dirname(os.path.abspath(csv_path))))
+
+# Answers to the example questions precomputed at deploy time (see
+# answer_snapshot); only used if computed on this dataset. "" disables it
+ANSWER_SNAPSHOT_PATH = os.getenv("ANSWER_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(csv_path)), "answer_snapshot.json"))
+answer_snapshot = None
+if ANSWER_SNAPSHOT_PATH and os.path.exists(ANSWER_SNAPSHOT_PATH):
+    _phase_start = time.perf_counter()
+    answer_snapshot = AnswerSnapshot.load(ANSWER_SNAPSHOT_PATH, dataset_registry.get(DEFAULT_DATASET_ID).content_checksum())
+    startup_timings["answer_snapshot"] = round(time.perf_counter() - _phase_start, 6)
+    if answer_snapshot is not None:
+        print(f"📸 Loaded {len(answer_snapshot.answers)} precomputed answers in "
+              f"{startup_timings['answer_snapshot'] * 1000:.1f} ms")
+startup_timings["module_init"] = round(time.perf_counter() - _startup_clock, 6)
+
+
+def default_dataset() -> DatasetEntry:
+    """The pinned default dataset; it is loaded at startup and never evicted"""
+    return dataset_registry.get(DEFAULT_DATASET_ID)
+
+
+@asynccontextmanager
+async def leased_dataset_or_404(dataset_id: str):
+    """
+    Look up a registered dataset, loading and indexing it in a worker thread on first use.
+    The dataset is leased for the block, so the memory budget cannot evict it mid-request.
+    """
+    try:
+        if dataset_registry.is_loaded(dataset_id):
+            entry = dataset_registry.acquire(dataset_id)
+        else:
+            loop = asyncio.get_running_loop()
+            entry = await loop.run_in_executor(None, dataset_registry.acquire, dataset_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset: {dataset_id}")
+    try:
+        yield entry
+    finally:
+        dataset_registry.release(entry)
+
+
+async def ensure_agent(entry: DatasetEntry):
+    """Return the dataset's agent, building it in a worker thread if needed"""
+    if entry.agent is not None:
+        return entry.agent
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, dataset_registry.get_agent, entry)
+
+
+def schedule_agent_warmup():
+    """Build the default agent in the background so the first query does not pay for it"""
+    if AGENT_STARTUP != "background":
+        return None
+    return asyncio.create_task(ensure_agent(default_dataset()))
+
+
+def cache_namespace(entry: DatasetEntry) -> str:
+    """Answer cache namespace; the default dataset keeps un-prefixed keys"""
+    return "" if entry.id == DEFAULT_DATASET_ID else entry.id
 
 
 class QueryRequest(BaseModel):
     question: str
+    trace: bool = False  # Include per-stage timings and token counts in the response
+    session_id: Optional[str] = None  # Answer follow-ups in the context of earlier questions
+
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    stream: bool = False  # Answer as NDJSON, one line per question as it completes
+    trace: bool = False
+    max_parallel: Optional[int] = None  # Agent runs in flight, capped at BATCH_MAX_PARALLEL
 
 
 class QueryResponse(BaseModel):
     answer: str
     visualization: Optional[dict] = None
+    # Which path served the request: "snapshot", "fast_path", "cache", "code_cache", "session", "agent",
+    # "guard", or with the LLM budget used up "degraded_cache" or "budget"
+    source: str = "agent"
+    trace: Optional[dict] = None
 
 
 @app.get("/")
@@ -135,184 +472,833 @@ async def root():
     return {"message": "Titanic Chat Agent API is running"}
 
 
+def dataset_info(entry: DatasetEntry) -> dict:
+    data = entry.df
+    return {
+        "total_passengers": len(data),
+        "columns": data.columns.tolist(),
+        "shape": data.shape,
+        "sample": data.head().astype(object).where(data.head().notna(), "null").to_dict(orient="records"),
+        "storage": entry.report.to_dict()
+    }
+
+
 @app.get("/dataset/info")
 async def get_dataset_info():
     """Get basic information about the dataset"""
+    return dataset_info(default_dataset())
+
+
+@app.get("/datasets")
+async def list_datasets():
+    """Registered datasets and whether they are currently loaded"""
+    return {
+        "default": DEFAULT_DATASET_ID,
+        "loaded_bytes": dataset_registry.loaded_bytes(),
+        "memory_budget_bytes": dataset_registry.memory_budget_bytes,
+        "evictions": dataset_registry.evictions,
+        "datasets": dataset_registry.list()
+    }
+
+
+@app.get("/datasets/{dataset_id}/info")
+async def get_named_dataset_info(dataset_id: str):
+    """Get basic information about a registered dataset, loading it if needed"""
+    async with leased_dataset_or_404(dataset_id) as entry:
+        return dataset_info(entry)
+
+
+@app.post("/dataset/reload")
+async def reload_dataset():
+    """Re-read the dataset, refresh changed statistics and rebuild the agent"""
+    global df, load_report, answer_snapshot
+    df, load_report = load_dataset(dataset_path, **DATASET_OPTIONS)
+    changed = stats_index.build(df)
+    dataset_registry.add_loaded(
+        DEFAULT_DATASET_ID, dataset_path, df, load_report, stats_index,
+        agent=build_agent(df) if AGENT_STARTUP == "eager" else None
+    )
+    answer_cache.clear(cache_namespace(default_dataset()))
+    if code_cache is not None:
+        code_cache.invalidate(cache_namespace(default_dataset()), default_dataset().content_checksum())
+    if answer_snapshot is not None and answer_snapshot.checksum != default_dataset().content_checksum():
+        answer_snapshot = None  # Computed on the data before the reload
+    schedule_agent_warmup()
+    return {"total_passengers": len(df), "rebuilt_columns": changed}
+
+
+@app.get("/stats")
+async def get_stats():
+    """Precomputed per-column statistics and survival rates"""
+    return stats_index.to_dict()
+
+
+@app.get("/stats/{column}")
+async def get_column_stats(column: str):
+    """Precomputed statistics for a single column"""
+    stats = stats_index.column(column)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"Unknown column: {column}")
+    return stats
+
+
+@app.on_event("startup")
+async def warm_agent():
+    schedule_agent_warmup()
+
+
+@app.on_event("shutdown")
+async def shutdown_agent_runner():
+    agent_runner.shutdown()
+
+
+@app.get("/startup")
+async def get_startup_report():
+    """Startup mode, time spent per startup phase and whether the agent is built"""
+    return {
+        "mode": AGENT_STARTUP,
+        "agent_ready": default_dataset().agent is not None,
+        "pid": os.getpid(),
+        "workers": WORKERS,
+        "dataset_format": load_report.format,
+        "timings": startup_timings
+    }
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Answer cache, code cache, answer snapshot and SQL plan cache size and hit/miss counters"""
+    stats = answer_cache.stats()
+    stats["code_cache"] = code_cache.stats() if code_cache is not None else None
+    stats["sessions"] = session_store.stats()
+    stats["snapshot"] = answer_snapshot.stats() if answer_snapshot is not None else None
+    if AGENT_TOOLS == "sql":
+        from sql_engine import existing_database
+        database = existing_database(default_dataset().df)
+        stats["sql_plans"] = database.stats() if database is not None else None
+    return stats
+
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str, dataset_id: str = DEFAULT_DATASET_ID):
+    """The compact history a session keeps: questions, answer summaries and active filters"""
+    session = session_store.get(session_id, dataset_id, create=False)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown session '{session_id}'")
+    return session.describe()
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, dataset_id: str = DEFAULT_DATASET_ID):
+    """Forget a conversation (the frontend calls this when the chat is cleared)"""
+    return {"deleted": session_store.delete(session_id, dataset_id)}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics: request latency, stage timings, tokens and hit rates"""
+    cache = answer_cache.stats()
+    runner = agent_runner.stats()
+    replay = code_cache.stats() if code_cache is not None else {}
+    sessions = session_store.stats()
+    batching = llm_batching_stats()
+    budget = llm_scheduler.stats()
+    body = query_metrics.render({
+        "fast_path_hit_rate": query_metrics.source_share("fast_path"),
+        "answer_cache_hit_rate": cache["hit_rate"],
+        "answer_cache_size": cache["size"],
+        "answer_cache_evictions": cache["evictions"],
+        "code_cache_hit_rate": replay.get("hit_rate"),
+        "code_cache_size": replay.get("size"),
+        "code_cache_invalidations_total": replay.get("invalidations"),
+        "agent_running": runner["running"],
+        "agent_queued": runner["queued"],
+        "agent_rejected_total": runner["rejected"],
+        "agent_timed_out_total": runner["timed_out"],
+        "coalesced_requests_total": agent_flights.coalesced,
+        "sessions_active": sessions["active"],
+        "session_follow_ups_total": sessions["follow_ups"],
+        "session_subsets_refined_total": sessions["refined_from_cache"],
+        "llm_budget_minute_remaining": budget["minute_remaining"],
+        "llm_budget_day_remaining": budget["day_remaining"],
+        "llm_rate_limited_total": budget["rate_limited"],
+        "llm_retries_total": budget["retries"],
+        "llm_degraded_total": budget["degraded"],
+        "llm_batches_total": batching.get("batches"),
+        "llm_batched_prompts_total": batching.get("prompts"),
+        "dataset_loaded_bytes": dataset_registry.loaded_bytes()
+    })
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+@app.get("/query/stats")
+async def get_query_stats():
+    """Agent concurrency, queue, request coalescing and LLM batching counters"""
     return {
-        "total_passengers": len(df),
-        "columns": df.columns.tolist(),
-        "shape": df.shape,
-        "sample": df.head().fillna("null").to_dict(orient="records")
+        "runner": agent_runner.stats(),
+        "coalescing": agent_flights.stats(),
+        "llm": {"provider": LLM_PROVIDER, **llm_batching_stats()}
     }
 
 
+@app.get("/llm/budget")
+async def get_llm_budget():
+    """
+    Remaining token budget per minute and per day, the scheduler's retry and
+    degrade counters, and the prompt tokens each agent call costs
+    """
+    entry = default_dataset()
+    # The profile needs LangChain's prompt classes; only build it once they are loaded
+    prompt = prompt_profile(entry) if entry.agent is not None or entry.id in _prompt_profiles else None
+    return {"provider": LLM_PROVIDER, **llm_scheduler.stats(), "prompt": prompt}
+
+
+UNRELATED_ANSWER = "I can only answer questions related to the Titanic dataset."
+TIMEOUT_ANSWER = "⏱️ The query is taking too long. Please try asking a simpler question about the Titanic dataset."
+
+
+def is_groq_rate_limit(error: Exception) -> bool:
+    """Only check against groq's error class if the SDK has actually been imported"""
+    groq = sys.modules.get("groq")
+    return groq is not None and isinstance(error, groq.RateLimitError)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Provider 429s, recognised by type for Groq and by message for the others"""
+    message = str(error).lower()
+    return is_groq_rate_limit(error) or "rate_limit" in message or "rate limit" in message or "429" in message
+
+
+def answer_without_agent(question: str, entry: DatasetEntry, trace: Optional[RequestTrace] = None) -> Optional[QueryResponse]:
+    """
+    Relevance guard, answer snapshot, fast path, answer cache and code cache for one dataset.
+    Returns None when the question has to go to the agent.
+    """
+    trace = trace or RequestTrace("internal")
+    # Relevance guard: one pass of the compiled intent router also tells us
+    # whether a chart was requested and which columns it is about
+    with trace.stage("guard"):
+        intent = route(question)
+    if intent.off_topic:
+        return QueryResponse(answer=UNRELATED_ANSWER, visualization=None, source="guard")
+    
+    needs_viz = intent.wants_visualization
+    
+    # Snapshot: answers and charts precomputed at deploy time for this dataset
+    if answer_snapshot is not None and entry.id == DEFAULT_DATASET_ID:
+        with trace.stage("snapshot"):
+            snapshot = answer_snapshot.get(question)
+        if snapshot is not None:
+            return QueryResponse(answer=snapshot["answer"], visualization=snapshot["visualization"], source="snapshot")
+    
+    # Fast path: deterministic pandas answer for supported question shapes
+    if FAST_PATH_ENABLED:
+        with trace.stage("fast_path"):
+            fast_answer = answer_question(question, entry.df)
+        if fast_answer is not None:
+            with trace.stage("visualization"):
+                visualization = generate_visualization_config(question, entry.df, entry.stats, intent) if needs_viz else None
+            return QueryResponse(answer=fast_answer, visualization=visualization, source="fast_path")
+    
+    # Answer cache: paraphrases of earlier questions skip the agent run
+    with trace.stage("cache"):
+        cached = answer_cache.get(question, namespace=cache_namespace(entry))
+    if cached is not None:
+        with trace.stage("visualization"):
+            visualization = generate_visualization_config(question, entry.df, entry.stats, intent) if needs_viz else None
+        return QueryResponse(answer=cached["answer"], visualization=visualization, source="cache")
+    
+    # Code cache: re-run the pandas steps of an earlier agent answer and reuse
+    # that answer if the steps still produce the same output on this data
+    if code_cache is not None:
+        with trace.stage("code_cache"):
+            replayed = code_cache.get(normalize_question(question), entry.df, entry.content_checksum(),
+                                      namespace=cache_namespace(entry))
+        if replayed is not None:
+            answer_cache.set(question, {"answer": replayed}, namespace=cache_namespace(entry))
+            with trace.stage("visualization"):
+                visualization = generate_visualization_config(question, entry.df, entry.stats, intent) if needs_viz else None
+            return QueryResponse(answer=replayed, visualization=visualization, source="code_cache")
+    
+    return None
+
+
+def build_agent_prompt(question: str, variant: Optional[str] = None, context: str = "") -> str:
+    """Get the answer from the agent with enhanced prompt (the compact system prompt already has the rules)"""
+    if context:
+        question = f"{context}\n\nFollow-up question: {question}"
+    return question if (variant or AGENT_PROMPT) == "compact" else question + FORMAT_REMINDER
+
+
+def answer_follow_up(question: str, entry: DatasetEntry, session: ConversationSession,
+                     trace: RequestTrace) -> Optional[QueryResponse]:
+    """Apply a follow-up to the session's previous query and answer it from the cached subset"""
+    with trace.stage("session"):
+        parsed = session.refine(question)
+        if parsed is None:
+            return None
+        try:
+            # Out-of-core datasets stream every query; there are no subsets to keep
+            subset = session.subset_for(entry.df, parsed.filters, entry.content_checksum()) \
+                if isinstance(entry.df, pd.DataFrame) else None
+            answer = execute_query(parsed, entry.df, subset)
+        except (KeyError, TypeError, ValueError):
+            return None
+    if answer is None:
+        return None
+    # A bare follow-up ("and for women?") is charted like the question it follows,
+    # over the follow-up's rows: the filters narrow the data, the metric and
+    # grouping pick the columns
+    text = f"{session.turns[-1].question} {question}"
+    wanted = route(text)
+    visualization = None
+    if wanted.wants_visualization:
+        intent = Intent(titanic_related=True, wants_visualization=True, chart=wanted.chart, terms=wanted.terms,
+                        columns=[column for column in (parsed.metric, parsed.group_by) if column])
+        with trace.stage("visualization"):
+            if subset is not None:
+                visualization = generate_visualization_config(text, subset, None, intent)
+            else:
+                visualization = generate_visualization_config(text, entry.df, entry.stats, intent)
+    session.record(question, answer, parsed)
+    session_store.save(session)
+    return QueryResponse(answer=answer, visualization=visualization, source="session")
+
+
+def answer_in_session(question: str, entry: DatasetEntry, trace: RequestTrace,
+                      session: Optional[ConversationSession] = None) -> tuple:
+    """
+    answer_without_agent, but follow-ups in a session are resolved against its
+    earlier turns first. Returns (response or None, conversation context for the agent).
+    """
+    if session is None or not session.is_follow_up(question):
+        return answer_without_agent(question, entry, trace), ""
+    session.follow_ups += 1
+    # The follow-up is judged on its own: an unrelated subject stays off topic
+    # whatever it follows. Only the previous turn can give "and them?" a topic
+    with trace.stage("guard"):
+        intent = route(question)
+    if intent.off_topic and intent.unrelated_subject:
+        return QueryResponse(answer=UNRELATED_ANSWER, visualization=None, source="guard"), ""
+    response = answer_follow_up(question, entry, session, trace)
+    if response is not None:
+        return response, ""
+    return None, session.context(SESSION_CONTEXT_CHARS)
+
+
+def remember_turn(session: Optional[ConversationSession], question: str, response: QueryResponse):
+    """Add an answered question to its session (follow-ups answered by the session are already there)"""
+    if session is not None and response.source != "session":
+        session.record(question, response.answer)
+        session_store.save(session)
+
+
+def parse_agent_output(response) -> tuple:
+    """Extract the answer text from an agent response; returns (answer, cacheable)"""
+    # Handle different response formats
+    if isinstance(response, dict):
+        answer = response.get("output", response.get("result", str(response)))
+    else:
+        answer = str(response)
+    
+    # Check if answer is empty
+    if not answer or answer.strip() == "":
+        return "I apologize, but I couldn't generate a response. Please try rephrasing your question.", False
+    return answer, True
+
+
+def recover_answer(agent_error: Exception) -> Optional[str]:
+    """Salvage the answer from an LLM output the agent failed to parse"""
+    error_str = str(agent_error)
+    if "Could not parse LLM output:" in error_str:
+        # Extract the actual output between backticks
+        match = re.search(r'`([^`]+)`', error_str)
+        if match:
+            return match.group(1).strip()
+    return None
+
+
+def agent_error_response(agent_error: Exception) -> QueryResponse:
+    """Map an agent failure to a user-friendly response"""
+    # Check for Groq rate limit error
+    if is_groq_rate_limit(agent_error):
+        return QueryResponse(
+            answer="⚠️ **Daily Groq API limit reached!**\n\nThe free tier allows 100,000 tokens/day. You've used today's quota.\n\n**Options:**\n• Wait ~10 minutes for daily reset\n• Upgrade at https://console.groq.com/settings/billing",
+            visualization=None
+        )
+    
+    # Also check by error message
+    error_str = str(agent_error)
+    if "rate_limit" in error_str.lower() or "rate limit" in error_str.lower():
+        return QueryResponse(
+            answer="⚠️ **API Rate Limit Reached**\n\nYou've exceeded your daily API usage limit.\n\nPlease wait for the reset or check your API provider's dashboard.",
+            visualization=None
+        )
+    
+    if "Could not parse LLM output:" in error_str:
+        # Return user-friendly message instead of technical error
+        return QueryResponse(
+            answer="I apologize, but I'm having trouble processing that question. Please try rephrasing it or ask about specific Titanic dataset statistics.",
+            visualization=None
+        )
+    
+    # Return user-friendly message for any other error
+    return QueryResponse(
+        answer="I apologize, but I encountered an issue processing your question. Please try asking about Titanic passenger statistics, survival rates, or demographics.",
+        visualization=None
+    )
+
+
+# Technical phrases that might leak through into an agent answer, and jargon
+# that marks the whole answer as an error report
+TECHNICAL_PHRASES = [
+    "handle_parsing_errors=True",
+    "agent_type=",
+    "AgentExecutor",
+    "LLM output",
+    "parsing error",
+    "For troubleshooting"
+]
+TECHNICAL_JARGON = ["traceback", "error:", "exception", "failed to"]
+
+
+def clean_agent_answer(answer: str) -> Optional[str]:
+    """The answer without technical artifacts; None if it is an error report to replace"""
+    answer = answer.strip()
+    for phrase in TECHNICAL_PHRASES:
+        if phrase in answer:
+            answer = answer.replace(phrase, "")
+    if any(word in answer.lower() for word in TECHNICAL_JARGON):
+        return None
+    return answer
+
+
+def finish_agent_answer(question: str, answer: str, cacheable: bool, entry: DatasetEntry,
+                        trace: Optional[RequestTrace] = None, steps: Optional[list] = None) -> QueryResponse:
+    """Clean the agent answer, attach a visualization and cache it (with its tool steps, if any)"""
+    trace = trace or RequestTrace("internal")
+    cleanup_start = time.perf_counter()
+    # If answer contains technical jargon, provide generic response
+    cleaned = clean_agent_answer(answer)
+    if cleaned is None:
+        answer = UNRELATED_ANSWER
+        cacheable = False
+    else:
+        answer = cleaned
+    
+    trace.add_time("cleanup", time.perf_counter() - cleanup_start)
+    
+    # Prepare visualization data if needed
+    intent = route(question)
+    visualization = None
+    if intent.wants_visualization:
+        with trace.stage("visualization"):
+            visualization = generate_visualization_config(question, entry.df, entry.stats, intent)
+    
+    if cacheable:
+        answer_cache.set(question, {"answer": answer}, namespace=cache_namespace(entry))
+        if steps and code_cache is not None:
+            code_cache.set(normalize_question(question), steps, answer, entry.df, entry.content_checksum(),
+                           namespace=cache_namespace(entry))
+    
+    return QueryResponse(answer=answer, visualization=visualization)
+
+
+def degraded_response(question: str, entry: DatasetEntry, retry_after: float = 0.0) -> QueryResponse:
+    """
+    Answer without the LLM once its budget is used up: a stale or paraphrased
+    cached answer if there is one, otherwise say which questions still work.
+    Charts need no LLM, so they are still drawn.
+    """
+    llm_scheduler.degraded += 1
+    intent = route(question)
+    visualization = generate_visualization_config(question, entry.df, entry.stats, intent) if intent.wants_visualization else None
+    cached = answer_cache.get_stale(question, namespace=cache_namespace(entry),
+                                    similarity_threshold=DEGRADED_CACHE_SIMILARITY)
+    if cached is not None:
+        return QueryResponse(answer=cached["answer"], visualization=visualization, source="degraded_cache")
+    wait = f" (about {math.ceil(retry_after)} seconds)" if 0 < retry_after < 3600 else ""
+    return QueryResponse(
+        answer=f"⚠️ **LLM budget nearly used up**\n\nDetailed questions are paused until the token budget resets{wait}. "
+               "Quick statistics (survival rates, average fares and ages, counts by class, gender or port) and charts are still available.",
+        visualization=visualization,
+        source="budget"
+    )
+
+
+def unexpected_error_response(e: Exception) -> QueryResponse:
+    """Map an unexpected failure to a response that never exposes technical details"""
+    # Check if it's a Groq API rate limit error
+    if is_groq_rate_limit(e):
+        return QueryResponse(
+            answer="⚠️ **Daily Groq API limit reached!**\n\nFree tier: 100,000 tokens/day\n\n**Options:**\n• Wait for daily reset\n• Upgrade at https://console.groq.com/settings/billing",
+            visualization=None
+        )
+    
+    error_message = str(e)
+    if "rate_limit" in error_message.lower():
+        return QueryResponse(
+            answer="⚠️ **API Rate Limit Reached**\n\nDaily usage limit exceeded. Please wait for reset.",
+            visualization=None
+        )
+    
+    # Never expose technical errors to users
+    return QueryResponse(
+        answer="I apologize, but I'm currently unable to process that request. Please try asking a different question about the Titanic dataset.",
+        visualization=None
+    )
+
+
+def busy_error() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="The server is busy answering other questions. Please try again in a few seconds.",
+        headers={"Retry-After": "5"}
+    )
+
+
+def trace_callbacks(trace: RequestTrace) -> list:
+    """LangChain callbacks that record LLM tokens and tool calls into the trace"""
+    from trace_callbacks import TraceCallbackHandler
+    return [TraceCallbackHandler(trace)]
+
+
+def step_recorder():
+    """Callback that records the agent's tool calls for the code cache (None when disabled)"""
+    if code_cache is None:
+        return None
+    from trace_callbacks import StepRecorder
+    return StepRecorder()
+
+
+def agent_flight_key(question: str, entry: DatasetEntry, context: str = "") -> str:
+    """Key under which identical in-flight agent runs are shared"""
+    key = f"{entry.id}|{normalize_question(question) or question}"
+    return f"{key}|{hash(context)}" if context else key
+
+
+def run_usage(trace: RequestTrace):
+    """Tokens an agent run has spent so far, for the scheduler's budget"""
+    return lambda: trace.prompt_tokens + trace.completion_tokens
+
+
+async def ask_agent(question: str, entry: DatasetEntry, trace: RequestTrace,
+                    priority: int = PRIORITY_INTERACTIVE, context: str = "") -> QueryResponse:
+    """
+    Answer one question with the dataset's agent. Raises busy_error() when the queue is full.
+    Answers given with conversation context depend on the session, so they are not cached.
+    """
+    recorder = step_recorder() if not context else None
+    try:
+        # Run the agent off the event loop; the timeout cancels the await.
+        # Identical questions already in flight attach to that run instead.
+        with trace.stage("agent"):
+            dataset_agent = await ensure_agent(entry)
+            flight_key = agent_flight_key(question, entry, context)
+            trace.coalesced = agent_flights.is_in_flight(flight_key)
+            run_agent = partial(agent_runner.run, dataset_agent, build_agent_prompt(question, context=context),
+                                config={"callbacks": trace_callbacks(trace) + ([recorder] if recorder else [])})
+            response = await agent_flights.do(
+                flight_key,
+                partial(llm_scheduler.run, run_agent, priority=priority, usage=run_usage(trace))
+            )
+        record_prompt_savings(trace, entry)
+        answer, cacheable = parse_agent_output(response)
+    except BudgetExhaustedError as e:
+        return degraded_response(question, entry, e.retry_after)
+    except AgentQueueFullError:
+        raise busy_error()
+    except asyncio.TimeoutError:
+        return QueryResponse(answer=TIMEOUT_ANSWER, visualization=None)
+    except Exception as agent_error:
+        answer = recover_answer(agent_error)
+        if answer is None:
+            return agent_error_response(agent_error)
+        cacheable = True
+    
+    return finish_agent_answer(question, answer, cacheable and not context, entry, trace,
+                               steps=recorder.steps if recorder else None)
+
+
+async def run_query(question: str, entry: DatasetEntry, trace: RequestTrace,
+                    session: Optional[ConversationSession] = None) -> QueryResponse:
+    """Answer one question against a dataset, calling its agent only if needed"""
+    try:
+        response, context = answer_in_session(question, entry, trace, session)
+        if response is None:
+            response = await ask_agent(question, entry, trace, context=context)
+        remember_turn(session, question, response)
+        return response
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        return unexpected_error_response(e)
+
+
+async def run_traced_query(request: QueryRequest, entry: DatasetEntry, endpoint: str) -> QueryResponse:
+    """Run a query, record its metrics and attach the trace if the client asked for it"""
+    trace = RequestTrace(endpoint)
+    session = session_store.get(request.session_id, entry.id) if request.session_id else None
+    try:
+        response = await run_query(request.question.strip(), entry, trace, session)
+    except HTTPException:
+        trace.source = "busy"
+        query_metrics.observe(trace)
+        raise
+    trace.source = response.source
+    query_metrics.observe(trace)
+    if request.trace:
+        response.trace = trace.to_dict()
+    return response
+
+
 @app.post("/query", response_model=QueryResponse)
 async def query_dataset(request: QueryRequest):
     """
     Process natural language queries about the Titanic dataset
     """
+    return await run_traced_query(request, default_dataset(), "/query")
+
+
+@app.post("/datasets/{dataset_id}/query", response_model=QueryResponse)
+async def query_named_dataset(dataset_id: str, request: QueryRequest):
+    """Process a natural language query against a registered dataset"""
+    async with leased_dataset_or_404(dataset_id) as entry:
+        return await run_traced_query(request, entry, "/datasets/{id}/query")
+
+
+async def stream_query_events(question: str, include_trace: bool = False, session_id: Optional[str] = None):
+    """
+    Yield SSE messages for one question: "step" and "observation" events while
+    the agent works, "token" events for the answer text, then a final "done"
+    event carrying the complete QueryResponse.
+    """
+    from streaming import StreamingAnswerHandler, format_sse, split_tokens
+    
+    trace = RequestTrace("/query/stream")
+    
+    session = None
+    
+    def done_event(final: QueryResponse) -> str:
+        remember_turn(session, question, final)
+        trace.source = final.source
+        query_metrics.observe(trace)
+        if include_trace:
+            final.trace = trace.to_dict()
+        return format_sse("done", final.model_dump())
+    
     try:
-        question = request.question.strip()
-        question_lower = question.lower()
-        
-        # Comprehensive list of unrelated topics
-        unrelated_keywords = [
-            "weather", "news", "joke", "recipe", "movie", "song", "game", "sports", 
-            "politics", "celebrity", "stock", "crypto", "bitcoin", "programming",
-            "hello", "hi", "who are you", "what is your name", "how are you",
-            "president", "country", "capital", "football", "basketball", 
-            "restaurant", "food", "travel", "hotel", "car", "phone", "computer"
-        ]
-        
-        # Check if question is about Titanic dataset
-        titanic_keywords = ["titanic", "passenger", "survival", "survived", "age", "fare", "class", "embarked", "sex", "male", "female", "dataset"]
-        is_titanic_related = any(keyword in question_lower for keyword in titanic_keywords)
-        
-        # If unrelated keywords found and no Titanic keywords, reject
-        if any(keyword in question_lower for keyword in unrelated_keywords) and not is_titanic_related:
-            return QueryResponse(
-                answer="I can only answer questions related to the Titanic dataset.",
-                visualization=None
-            )
-        
-        # Additional check for very short or generic questions
-        if len(question.split()) <= 2 and not is_titanic_related:
-            return QueryResponse(
-                answer="I can only answer questions related to the Titanic dataset.",
-                visualization=None
-            )
+        entry = default_dataset()
+        session = session_store.get(session_id, entry.id) if session_id else None
+        early_response, context = answer_in_session(question, entry, trace, session)
+        if early_response is not None:
+            for token in split_tokens(early_response.answer):
+                yield format_sse("token", {"text": token})
+            yield done_event(early_response)
+            return
         
-        # Check if the user is asking for a visualization
-        viz_keywords = ["histogram", "chart", "graph", "plot", "show me", "visualize", "distribution", "bar chart"]
-        needs_viz = any(keyword in question_lower for keyword in viz_keywords)
-        
-        # Get the answer from the agent with enhanced prompt
-        enhanced_question = f"{question}\n\nRemember to format numbers properly: percentages with %, currency with $, and use emojis appropriately."
+        # Streaming callbacks are delivered on the event loop only in async mode
+        handler = StreamingAnswerHandler(clean=clean_agent_answer)
+        recorder = step_recorder() if not context else None
+        callbacks = trace_callbacks(trace) + ([handler] if agent_runner.mode == "async" else []) + ([recorder] if recorder else [])
+        steps = recorder.steps if recorder else None
+        agent_start = time.perf_counter()
+        run_agent = partial(agent_runner.run, await ensure_agent(entry), build_agent_prompt(question, context=context),
+                            config={"callbacks": callbacks})
+        # Identical questions already in flight (streamed or not) attach to that run;
+        # an attached stream gets no agent events, only the answer once it is done
+        flight_key = agent_flight_key(question, entry, context)
+        trace.coalesced = agent_flights.is_in_flight(flight_key)
+        task = asyncio.ensure_future(agent_flights.do(
+            flight_key, partial(llm_scheduler.run, run_agent, usage=run_usage(trace))
+        ))
+        async for event, data in handler.events(task):
+            yield format_sse(event, data)
+        trace.add_time("agent", time.perf_counter() - agent_start)
+        record_prompt_savings(trace, entry)
         
         try:
-            # Call agent with timeout protection via concurrent.futures
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(agent.invoke, enhanced_question)
-                try:
-                    response = future.result(timeout=30)  # 30 second timeout
-                    # Handle different response formats
-                    if isinstance(response, dict):
-                        answer = response.get("output", response.get("result", str(response)))
-                    else:
-                        answer = str(response)
-                    
-                    # Check if answer is empty
-                    if not answer or answer.strip() == "":
-                        answer = "I apologize, but I couldn't generate a response. Please try rephrasing your question."
-                except concurrent.futures.TimeoutError:
-                    return QueryResponse(
-                        answer="⏱️ The query is taking too long. Please try asking a simpler question about the Titanic dataset.",
-                        visualization=None
-                    )
+            answer, cacheable = parse_agent_output(task.result())
+            final = finish_agent_answer(question, answer, cacheable and not context, entry, trace, steps=steps)
+        except BudgetExhaustedError as e:
+            final = degraded_response(question, entry, e.retry_after)
+        except AgentQueueFullError:
+            final = QueryResponse(answer="⏳ The server is busy answering other questions. Please try again in a few seconds.", visualization=None)
+        except asyncio.TimeoutError:
+            final = QueryResponse(answer=TIMEOUT_ANSWER, visualization=None)
         except Exception as agent_error:
-            # Check for Groq rate limit error
-            if GroqRateLimitError and isinstance(agent_error, GroqRateLimitError):
-                return QueryResponse(
-                    answer="⚠️ **Daily Groq API limit reached!**\n\nThe free tier allows 100,000 tokens/day. You've used today's quota.\n\n**Options:**\n• Wait ~10 minutes for daily reset\n• Upgrade at https://console.groq.com/settings/billing",
-                    visualization=None
-                )
-            
-            # Also check by error message
-            error_str = str(agent_error)
-            if "rate_limit" in error_str.lower() or "rate limit" in error_str.lower():
-                return QueryResponse(
-                    answer="⚠️ **API Rate Limit Reached**\n\nYou've exceeded your daily API usage limit.\n\nPlease wait for the reset or check your API provider's dashboard.",
-                    visualization=None
-                )
-            
-            if "Could not parse LLM output:" in error_str:
-                # Extract the actual output between backticks
-                import re
-                match = re.search(r'`([^`]+)`', error_str)
-                if match:
-                    answer = match.group(1).strip()
-                else:
-                    # Return user-friendly message instead of technical error
-                    return QueryResponse(
-                        answer="I apologize, but I'm having trouble processing that question. Please try rephrasing it or ask about specific Titanic dataset statistics.",
-                        visualization=None
-                    )
-            else:
-                # Return user-friendly message for any other error
-                return QueryResponse(
-                    answer="I apologize, but I encountered an issue processing your question. Please try asking about Titanic passenger statistics, survival rates, or demographics.",
-                    visualization=None
-                )
-        
-        # Clean up the answer and remove any technical artifacts
-        answer = answer.strip()
-        
-        # Remove technical phrases that might leak through
-        technical_phrases = [
-            "handle_parsing_errors=True",
-            "agent_type=",
-            "AgentExecutor",
-            "LLM output",
-            "parsing error",
-            "For troubleshooting"
-        ]
-        for phrase in technical_phrases:
-            if phrase in answer:
-                answer = answer.replace(phrase, "")
+            answer = recover_answer(agent_error)
+            final = agent_error_response(agent_error) if answer is None else finish_agent_answer(question, answer, not context, entry, trace, steps=steps)
         
-        # If answer contains technical jargon, provide generic response
-        if any(word in answer.lower() for word in ["traceback", "error:", "exception", "failed to"]):
-            answer = "I can only answer questions related to the Titanic dataset."
-        
-        # Prepare visualization data if needed
-        visualization = None
-        if needs_viz:
-            visualization = generate_visualization_config(question_lower, df)
-        
-        return QueryResponse(answer=answer, visualization=visualization)
-    
+        # Send whatever the cleaned tokens have not covered yet; if the final
+        # answer was replaced, the "done" event carries it
+        sent = handler.streamed_text
+        if final.answer.startswith(sent):
+            for token in split_tokens(final.answer[len(sent):]):
+                yield format_sse("token", {"text": token})
+        yield done_event(final)
     except Exception as e:
-        # Check if it's a Groq API rate limit error
-        if GroqRateLimitError and isinstance(e, GroqRateLimitError):
-            return QueryResponse(
-                answer="⚠️ **Daily Groq API limit reached!**\n\nFree tier: 100,000 tokens/day\n\n**Options:**\n• Wait for daily reset\n• Upgrade at https://console.groq.com/settings/billing",
-                visualization=None
-            )
-        
-        error_message = str(e)
-        if "rate_limit" in error_message.lower():
-            return QueryResponse(
-                answer="⚠️ **API Rate Limit Reached**\n\nDaily usage limit exceeded. Please wait for reset.",
-                visualization=None
-            )
-        
-        # Never expose technical errors to users
-        return QueryResponse(
-            answer="I apologize, but I'm currently unable to process that request. Please try asking a different question about the Titanic dataset.",
-            visualization=None
-        )
+        yield done_event(unexpected_error_response(e))
+
+
+@app.post("/query/stream")
+async def query_dataset_stream(request: QueryRequest):
+    """
+    Stream agent steps and answer tokens as Server-Sent Events.
+    The final "done" event carries the same payload as POST /query.
+    """
+    if not agent_runner.has_capacity():
+        raise busy_error()
+    return StreamingResponse(
+        stream_query_events(request.question.strip(), request.trace, request.session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def batch_query_results(questions: list, entry: DatasetEntry, include_trace: bool, max_parallel: int):
+    """
+    Yield one result dict per input question, in completion order. Duplicate
+    questions (same normalized key) are answered once; fast-path, cached and
+    guarded questions are yielded before any agent run starts.
+    """
+    groups = {}  # question key -> input indices, in first-seen order
+    for index, question in enumerate(questions):
+        question = question.strip()
+        groups.setdefault(normalize_question(question) or question, []).append(index)
+    
+    def results(indices: list, response: QueryResponse, status: str, trace: RequestTrace) -> list:
+        trace.source = response.source if status == "ok" else status
+        query_metrics.observe(trace)
+        item = response.model_dump()
+        item.update(status=status, elapsed_ms=round(trace.elapsed * 1000, 3),
+                    trace=trace.to_dict() if include_trace else None)
+        return [dict(item, index=index, question=questions[index], duplicate_of=None if index == indices[0] else indices[0])
+                for index in indices]
+    
+    pending = []
+    for indices in groups.values():
+        trace = RequestTrace("/query/batch")
+        try:
+            response = answer_without_agent(questions[indices[0]].strip(), entry, trace)
+        except Exception as e:
+            for item in results(indices, unexpected_error_response(e), "error", trace):
+                yield item
+            continue
+        if response is None:
+            pending.append((indices, trace))
+            continue
+        for item in results(indices, response, "ok", trace):
+            yield item
+    
+    semaphore = asyncio.Semaphore(max_parallel)
+    
+    async def answer(indices: list, trace: RequestTrace) -> list:
+        with trace.stage("batch_queue"):
+            await semaphore.acquire()
+        try:
+            response = await ask_agent(questions[indices[0]].strip(), entry, trace, priority=PRIORITY_BATCH)
+            return results(indices, response, "ok", trace)
+        except HTTPException:
+            busy = QueryResponse(answer="⏳ The server is busy answering other questions. Please try again in a few seconds.",
+                                 visualization=None, source="busy")
+            return results(indices, busy, "busy", trace)
+        except Exception as e:
+            return results(indices, unexpected_error_response(e), "error", trace)
+        finally:
+            semaphore.release()
+    
+    tasks = {asyncio.create_task(answer(indices, trace)) for indices, trace in pending}
+    try:
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for item in task.result():
+                    yield item
+    finally:
+        # The client went away mid-stream: stop the remaining agent runs
+        for task in tasks:
+            task.cancel()
 
 
-def generate_visualization_config(question: str, df: pd.DataFrame) -> dict:
+@app.post("/query/batch")
+async def query_dataset_batch(request: BatchQueryRequest):
     """
-    Generate visualization configuration based on the question
+    Answer many questions in one call. Duplicates are answered once and agent
+    runs are fanned out with bounded parallelism. Returns results in input
+    order, or NDJSON lines in completion order followed by a summary line
+    when stream is true.
     """
-    question = question.lower()
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_MAX_QUESTIONS} questions")
+    entry = default_dataset()
+    max_parallel = max(1, min(request.max_parallel or BATCH_MAX_PARALLEL, BATCH_MAX_PARALLEL))
+    start = time.perf_counter()
+    items = batch_query_results(request.questions, entry, request.trace, max_parallel)
+    
+    def summary(results: list) -> dict:
+        return {
+            "total": len(request.questions),
+            "unique": sum(item["duplicate_of"] is None for item in results),
+            "by_status": {status: sum(item["status"] == status for item in results)
+                          for status in sorted({item["status"] for item in results})},
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)
+        }
+    
+    if request.stream:
+        async def lines():
+            finished = []
+            async for item in items:
+                finished.append(item)
+                yield json.dumps(item) + "\n"
+            yield json.dumps({"summary": summary(finished)}) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    
+    results = [item async for item in items]
+    return {"results": sorted(results, key=lambda item: item["index"]), "summary": summary(results)}
+
+
+def generate_visualization_config(question: str, df: pd.DataFrame, stats: Optional[StatsIndex] = None,
+                                  intent: Optional[Intent] = None) -> dict:
+    """
+    Generate visualization configuration based on the question.
+    Counts are served from the precomputed statistics index when one is given;
+    otherwise out-of-core datasets count and bin chunk by chunk.
+    """
+    intent = intent or route(question)
+    columns = intent.columns
+    wants_histogram = intent.chart == "histogram" or any(term.startswith("distribution") for term in intent.terms)
+    
+    def value_counts(column: str) -> dict:
+        if stats is not None and stats.value_counts(column):
+            return dict(stats.value_counts(column))
+        if not isinstance(df, pd.DataFrame):
+            return df.value_counts(column).to_dict()
+        return df[column].value_counts().to_dict()
+    
+    def histogram(column: str) -> dict:
+        # Pre-binned {"edges", "counts"} instead of one value per passenger
+        column_stats = stats.column(column) if stats is not None else None
+        if column_stats and "histogram" in column_stats:
+            return column_stats["histogram"]
+        if not isinstance(df, pd.DataFrame):
+            return df.histogram(column, HISTOGRAM_BINS)
+        return histogram_payload(df[column], HISTOGRAM_BINS)
     
     # Age histogram
-    if "age" in question and ("histogram" in question or "distribution" in question):
+    if "age" in columns and wants_histogram:
         return {
             "type": "histogram",
-            "data": df["age"].dropna().tolist(),
+            "data": histogram("age"),
             "title": "Age Distribution of Titanic Passengers",
             "xlabel": "Age",
             "ylabel": "Count"
         }
     
     # Gender distribution
-    if "gender" in question or "sex" in question or "male" in question or "female" in question:
-        sex_counts = df["sex"].value_counts().to_dict()
+    if "sex" in columns:
+        sex_counts = value_counts("sex")
         return {
             "type": "bar",
             "data": sex_counts,
@@ -322,8 +1308,8 @@ def generate_visualization_config(question: str, df: pd.DataFrame) -> dict:
         }
     
     # Survival rate
-    if "surviv" in question:
-        survival_counts = df["survived"].value_counts().to_dict()
+    if "survived" in columns:
+        survival_counts = value_counts("survived")
         return {
             "type": "pie",
             "data": {
@@ -334,8 +1320,8 @@ def generate_visualization_config(question: str, df: pd.DataFrame) -> dict:
         }
     
     # Embarkation ports
-    if "embark" in question or "port" in question:
-        embark_counts = df["embarked"].value_counts().to_dict()
+    if "embarked" in columns:
+        embark_counts = value_counts("embarked")
         return {
             "type": "bar",
             "data": embark_counts,
@@ -345,18 +1331,18 @@ def generate_visualization_config(question: str, df: pd.DataFrame) -> dict:
         }
     
     # Fare distribution
-    if "fare" in question and ("histogram" in question or "distribution" in question):
+    if "fare" in columns and wants_histogram:
         return {
             "type": "histogram",
-            "data": df["fare"].dropna().tolist(),
+            "data": histogram("fare"),
             "title": "Fare Distribution",
             "xlabel": "Fare",
             "ylabel": "Count"
         }
     
     # Class distribution
-    if "class" in question:
-        class_counts = df["pclass"].value_counts().sort_index().to_dict()
+    if "pclass" in columns:
+        class_counts = dict(sorted(value_counts("pclass").items()))
         return {
             "type": "bar",
             "data": class_counts,
@@ -0,0 +1,207 @@
+"""
+Per-request instrumentation and Prometheus text exposition.
+
+Every query gets a RequestTrace that times its stages (guard, fast path,
+cache, agent, cleanup, visualization) and collects LLM token and tool-call
+counts from the agent callbacks, including the prompt size of each call and
+the prompt tokens saved by the compact prompt or provider prefix caching.
+QueryMetrics aggregates finished traces into counters and latency
+histograms and renders them in the Prometheus text format for GET /metrics.
+No prometheus_client dependency is needed.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000)
+METRIC_PREFIX = "titanic_"
+
+
+class RequestTrace:
+    """Stage timings and LLM/tool counters for one request."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.source = None
+        self.stages = {}  # stage -> seconds
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.tokens_estimated = False
+        self.call_prompt_tokens = []  # Prompt size of each LLM call
+        self.cached_prompt_tokens = 0  # Served from the provider's prompt prefix cache
+        self.prompt_tokens_saved = 0  # Saved by the compact prompt variant
+        self.tool_calls = 0
+        self.coalesced = False
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_llm_call(self, prompt_tokens: int, completion_tokens: int, estimated: bool = False,
+                     cached_tokens: int = 0):
+        with self._lock:
+            self.llm_calls += 1
+            self.call_prompt_tokens.append(prompt_tokens)
+            self.cached_prompt_tokens += cached_tokens
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.tokens_estimated = self.tokens_estimated or estimated
+
+    def add_tool_call(self):
+        with self._lock:
+            self.tool_calls += 1
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def to_dict(self) -> dict:
+        return {
+            "source": self.source,
+            "total_ms": round(self.elapsed * 1000, 3),
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "tokens_estimated": self.tokens_estimated,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "prompt_tokens_saved": self.prompt_tokens_saved,
+            "tool_calls": self.tool_calls,
+            "coalesced": self.coalesced,
+        }
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help = name, help_text
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self.values.items()]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.buckets = name, help_text, buckets
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self.series.items():
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class QueryMetrics:
+    """Aggregates finished request traces into Prometheus metrics."""
+
+    def __init__(self, prefix: str = METRIC_PREFIX):
+        self.prefix = prefix
+        self.requests = Counter(f"{prefix}requests_total", "Requests by endpoint and answer source")
+        self.latency = Histogram(f"{prefix}request_latency_seconds", "End-to-end request latency")
+        self.stage_latency = Histogram(f"{prefix}stage_latency_seconds", "Time spent per request stage")
+        self.llm_calls = Counter(f"{prefix}llm_calls_total", "LLM calls made by the agent")
+        self.llm_tokens = Counter(f"{prefix}llm_tokens_total", "LLM tokens by kind (prompt or completion)")
+        self.prompt_size = Histogram(f"{prefix}prompt_tokens_per_call", "Prompt tokens sent per LLM call", TOKEN_BUCKETS)
+        self.tokens_saved = Counter(f"{prefix}prompt_tokens_saved_total",
+                                    "Prompt tokens saved, by the compact prompt or the provider's prefix cache")
+        self.tool_calls = Counter(f"{prefix}tool_calls_total", "Pandas tool executions by the agent")
+        self._lock = threading.Lock()
+
+    def observe(self, trace: RequestTrace):
+        with self._lock:
+            source = trace.source or "error"
+            self.requests.inc(endpoint=trace.endpoint, source=source)
+            self.latency.observe(trace.elapsed, endpoint=trace.endpoint)
+            for stage, seconds in trace.stages.items():
+                self.stage_latency.observe(seconds, stage=stage)
+            if trace.llm_calls:
+                self.llm_calls.inc(trace.llm_calls)
+                self.llm_tokens.inc(trace.prompt_tokens, kind="prompt")
+                self.llm_tokens.inc(trace.completion_tokens, kind="completion")
+                for tokens in trace.call_prompt_tokens:
+                    self.prompt_size.observe(tokens)
+            if trace.prompt_tokens_saved:
+                self.tokens_saved.inc(trace.prompt_tokens_saved, reason="compact_prompt")
+            if trace.cached_prompt_tokens:
+                self.tokens_saved.inc(trace.cached_prompt_tokens, reason="prefix_cache")
+            if trace.tool_calls:
+                self.tool_calls.inc(trace.tool_calls)
+
+    def source_share(self, source: str) -> Optional[float]:
+        """Share of query requests answered by one source (e.g. "fast_path")."""
+        with self._lock:
+            total = sum(self.requests.values.values())
+            if not total:
+                return None
+            hits = sum(value for key, value in self.requests.values.items() if ("source", source) in key)
+            return hits / total
+
+    def render(self, gauges: Optional[dict] = None) -> str:
+        """
+        Prometheus text format. ``gauges`` maps extra metric names (without the
+        prefix) to current values; names ending in _total are exposed as counters.
+        """
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.latency, self.stage_latency,
+                           self.llm_calls, self.llm_tokens, self.prompt_size, self.tokens_saved, self.tool_calls):
+                lines += metric.render()
+        for name, value in (gauges or {}).items():
+            if value is None:
+                continue
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines += [f"# TYPE {self.prefix}{name} {kind}", f"{self.prefix}{name} {_format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) for providers that report no usage."""
+    return (len(text) + 3) // 4 if text else 0
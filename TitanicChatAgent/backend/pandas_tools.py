@@ -0,0 +1,295 @@
+"""
+Typed pandas tools for the agent.
+
+Instead of writing free-form Python for a REPL, the agent calls one of a
+few operations bound to the DataFrame: group_by_aggregate, filter_count,
+describe_column, crosstab, top_n and correlation. Each takes a JSON object
+validated against a pydantic schema and runs as a single vectorized pandas
+call, so most questions need one tool call and no code to be parsed.
+On an out-of-core dataset the same tools stream over chunks instead
+(chunked_dataset.CHUNKED_TOOLS).
+
+build_agent_with_tools() wires them into a ReAct (zero-shot) agent. The
+LangChain imports happen inside it so importing this module stays cheap.
+"""
+import json
+from typing import Any, List, Literal, Optional, Union
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+
+MAX_RESULT_ROWS = 50
+RESULT_DECIMALS = 4
+ComparisonOp = Literal["==", "!=", "<", "<=", ">", ">=", "in", "not in", "isnull", "notnull"]
+
+
+class ToolInputError(ValueError):
+    """Raised for tool input the agent can fix (unknown column, wrong dtype)."""
+
+
+class Condition(BaseModel):
+    column: str
+    op: ComparisonOp = "=="
+    value: Any = None
+
+
+class FilteredArgs(BaseModel):
+    filters: List[Condition] = Field(default_factory=list)
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else value
+
+
+class GroupByAggregateArgs(FilteredArgs):
+    group_by: List[str]
+    column: Optional[str] = None  # None counts rows per group
+    agg: Literal["mean", "sum", "count", "median", "min", "max", "std", "nunique"] = "mean"
+    sort: Optional[Literal["asc", "desc"]] = None
+
+    _group_by_list = field_validator("group_by", mode="before")(_as_list)
+
+
+class FilterCountArgs(FilteredArgs):
+    pass
+
+
+class DescribeColumnArgs(FilteredArgs):
+    column: str
+
+
+class CrosstabArgs(FilteredArgs):
+    index: str
+    columns: str
+    normalize: Literal["none", "index", "columns", "all"] = "none"
+
+
+class TopNArgs(FilteredArgs):
+    column: str
+    n: int = Field(5, ge=1, le=MAX_RESULT_ROWS)
+    ascending: bool = False
+    show: List[str] = Field(default_factory=list)
+
+    _show_list = field_validator("show", mode="before")(_as_list)
+
+
+class CorrelationArgs(FilteredArgs):
+    columns: List[str] = Field(default_factory=list)  # Empty means every numeric column
+    target: Optional[str] = None  # Only report correlations with this column
+    method: Literal["pearson", "spearman", "kendall"] = "pearson"
+
+    _columns_list = field_validator("columns", mode="before")(_as_list)
+
+
+def _check_columns(df: pd.DataFrame, columns: list):
+    unknown = [c for c in columns if c not in df.columns]
+    if unknown:
+        raise ToolInputError(f"Unknown column(s) {unknown}. Available columns: {', '.join(df.columns)}")
+
+
+def _condition_mask(series: pd.Series, condition: Condition) -> pd.Series:
+    op, value = condition.op, condition.value
+    if op == "isnull":
+        return series.isna()
+    if op == "notnull":
+        return series.notna()
+    if op in ("in", "not in"):
+        mask = series.isin(value if isinstance(value, list) else [value])
+        return ~mask if op == "not in" else mask
+    if op in ("==", "!="):
+        mask = series == value
+        return ~mask if op == "!=" else mask
+    if not pd.api.types.is_numeric_dtype(series):
+        raise ToolInputError(f"'{op}' needs a numeric column, '{series.name}' is {series.dtype}")
+    return {"<": series.lt, "<=": series.le, ">": series.gt, ">=": series.ge}[op](value)
+
+
+def apply_filters(df: pd.DataFrame, filters: List[Condition]) -> pd.DataFrame:
+    """Combine all conditions into one boolean mask and select once."""
+    if not filters:
+        return df
+    _check_columns(df, [f.column for f in filters])
+    mask = np.logical_and.reduce([_condition_mask(df[f.column], f).to_numpy(dtype=bool) for f in filters])
+    return df[mask]
+
+
+def _format(result: Union[pd.Series, pd.DataFrame]) -> str:
+    if isinstance(result, pd.Series):
+        result = result.to_frame()
+    # float32 columns print every stored digit; widen them so rounding shows
+    result = result.astype({c: "float64" for c in result.columns if pd.api.types.is_float_dtype(result[c])})
+    truncated = len(result) > MAX_RESULT_ROWS
+    text = result.head(MAX_RESULT_ROWS).round(RESULT_DECIMALS).to_string()
+    return f"{text}\n... ({len(result)} rows, showing {MAX_RESULT_ROWS})" if truncated else text
+
+
+def group_by_aggregate(df: pd.DataFrame, args: GroupByAggregateArgs) -> str:
+    _check_columns(df, args.group_by + ([args.column] if args.column else []))
+    data = apply_filters(df, args.filters)
+    grouped = data.groupby(args.group_by, observed=True)
+    if args.column is None:
+        result = grouped.size().rename("count")
+    else:
+        result = grouped[args.column].agg(args.agg).rename(f"{args.agg}_{args.column}")
+    if args.sort:
+        result = result.sort_values(ascending=args.sort == "asc")
+    return _format(result)
+
+
+def filter_count(df: pd.DataFrame, args: FilterCountArgs) -> str:
+    matched = len(apply_filters(df, args.filters))
+    share = matched / len(df) * 100 if len(df) else 0.0
+    return f"{matched} of {len(df)} rows match ({share:.2f}%)"
+
+
+def describe_column(df: pd.DataFrame, args: DescribeColumnArgs) -> str:
+    _check_columns(df, [args.column])
+    series = apply_filters(df, args.filters)[args.column]
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        summary = series.describe()
+        summary["missing"] = series.isna().sum()
+        return _format(summary.rename(args.column))
+    counts = series.value_counts(dropna=False)
+    return _format(pd.DataFrame({"count": counts, "percent": counts / counts.sum() * 100}))
+
+
+def crosstab(df: pd.DataFrame, args: CrosstabArgs) -> str:
+    _check_columns(df, [args.index, args.columns])
+    data = apply_filters(df, args.filters)
+    normalize = False if args.normalize == "none" else args.normalize
+    return _format(pd.crosstab(data[args.index], data[args.columns], normalize=normalize))
+
+
+def top_n(df: pd.DataFrame, args: TopNArgs) -> str:
+    _check_columns(df, [args.column] + args.show)
+    data = apply_filters(df, args.filters)
+    if not pd.api.types.is_numeric_dtype(data[args.column]):
+        return _format(data[args.column].value_counts().head(args.n))
+    pick = data.nsmallest if args.ascending else data.nlargest
+    return _format(pick(args.n, args.column)[[args.column] + [c for c in args.show if c != args.column]])
+
+
+def correlation(df: pd.DataFrame, args: CorrelationArgs) -> str:
+    columns = args.columns or df.select_dtypes(include="number").columns.tolist()
+    if args.target and args.target not in columns:
+        columns = columns + [args.target]
+    _check_columns(df, columns)
+    data = apply_filters(df, args.filters)[columns]
+    matrix = data.apply(pd.to_numeric, errors="coerce").corr(method=args.method)
+    if args.target:
+        return _format(matrix[args.target].drop(args.target).sort_values(key=abs, ascending=False))
+    return _format(matrix)
+
+
+# name -> (function, argument schema, description with an example input)
+TOOLS = {
+    "group_by_aggregate": (
+        group_by_aggregate, GroupByAggregateArgs,
+        "Aggregate a column per group (mean of 'survived' is the survival rate). "
+        'Example: {"group_by": ["sex"], "column": "survived", "agg": "mean"}',
+    ),
+    "filter_count": (
+        filter_count, FilterCountArgs,
+        "Count the rows matching all filters and their share of the dataset. "
+        'Example: {"filters": [{"column": "age", "op": "<", "value": 12}, {"column": "survived", "op": "==", "value": 1}]}',
+    ),
+    "describe_column": (
+        describe_column, DescribeColumnArgs,
+        "Summary statistics of a numeric column, or value counts and percentages of a categorical one. "
+        'Example: {"column": "fare", "filters": [{"column": "pclass", "op": "==", "value": 1}]}',
+    ),
+    "crosstab": (
+        crosstab, CrosstabArgs,
+        "Cross-tabulate two columns; normalize is none, index, columns or all. "
+        'Example: {"index": "pclass", "columns": "survived", "normalize": "index"}',
+    ),
+    "top_n": (
+        top_n, TopNArgs,
+        "Rows with the largest (or smallest, ascending=true) values of a column, or the most common values of a categorical one. "
+        'Example: {"column": "fare", "n": 5, "show": ["pclass", "sex"]}',
+    ),
+    "correlation": (
+        correlation, CorrelationArgs,
+        "Correlation matrix of numeric columns, or correlations with one target column. "
+        'Example: {"target": "survived", "method": "pearson"}',
+    ),
+}
+FILTER_HELP = ("Every tool input is a JSON object and accepts optional filters: a list of "
+               "{column, op, value} with op one of ==, !=, <, <=, >, >=, in, not in, isnull, notnull.")
+
+
+def _escape_template(text: str) -> str:
+    """Tool descriptions and the prefix end up inside a prompt template."""
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def _parse_input(tool_input: str) -> dict:
+    """Parse the Action Input, tolerating code fences and surrounding quotes."""
+    text = tool_input.strip().strip("`").strip()
+    if text.startswith("json"):
+        text = text[4:].strip()
+    if len(text) > 1 and text[0] == text[-1] and text[0] in "'\"":
+        text = text[1:-1]
+    return json.loads(text)
+
+
+def run_tool(df: pd.DataFrame, name: str, tool_input: Union[str, dict]) -> str:
+    """Validate the input and run one tool; errors are returned as text the agent can act on."""
+    function, schema, _ = TOOLS[name]
+    if not isinstance(df, pd.DataFrame):
+        from chunked_dataset import CHUNKED_TOOLS
+        function = CHUNKED_TOOLS[name]
+    try:
+        raw = _parse_input(tool_input) if isinstance(tool_input, str) else tool_input
+        return function(df, schema.model_validate(raw))
+    except json.JSONDecodeError as e:
+        return f"Error: Action Input must be a JSON object ({e.msg})"
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        return f"Error: invalid input for {name}: {problems}"
+    except (ToolInputError, TypeError, ValueError) as e:
+        return f"Error: {e}"
+
+
+def build_tools(df: pd.DataFrame) -> list:
+    """Single-input LangChain tools (JSON in, text out) for a ReAct agent."""
+    from langchain_core.tools import Tool
+
+    return [
+        Tool(name=name, func=lambda tool_input, name=name: run_tool(df, name, tool_input),
+             description=_escape_template(description))
+        for name, (_, _, description) in TOOLS.items()
+    ]
+
+
+def tools_prompt_hint() -> str:
+    """Usage notes shared by all tools, for the agent prefix (stated once, not per tool)."""
+    return _escape_template(FILTER_HELP)
+
+
+# Suffix for the compact prompt: a couple of CSV rows instead of a markdown df.head()
+COMPACT_SUFFIX = "\nSample rows (CSV):\n{df_head}\n\nBegin!\nQuestion: {input}\n{agent_scratchpad}"
+
+
+def react_prompt(tools: list, prefix: str, df_head: str, suffix: Optional[str] = None):
+    """ReAct prompt template with the DataFrame preview filled in; only input and scratchpad vary."""
+    from langchain.agents import ZeroShotAgent
+    from langchain_experimental.agents.agent_toolkits.pandas.prompt import SUFFIX_WITH_DF
+
+    return ZeroShotAgent.create_prompt(
+        tools, prefix=prefix, suffix=suffix or SUFFIX_WITH_DF,
+        input_variables=["input", "agent_scratchpad", "df_head"],
+    ).partial(df_head=df_head)
+
+
+def build_agent_with_tools(llm, df: pd.DataFrame, prefix: str, tools: list, df_head: Optional[str] = None,
+                           suffix: Optional[str] = None, **executor_kwargs):
+    """ReAct agent over the given tools, with the DataFrame head (or the given preview) in the prompt."""
+    from langchain.agents import AgentExecutor, ZeroShotAgent
+    from langchain.chains import LLMChain
+
+    prompt = react_prompt(tools, prefix, str(df.head().to_markdown()) if df_head is None else df_head, suffix)
+    agent = ZeroShotAgent(llm_chain=LLMChain(llm=llm, prompt=prompt), allowed_tools=[t.name for t in tools])
+    return AgentExecutor.from_agent_and_tools(agent=agent, tools=tools, **executor_kwargs)
@@ -0,0 +1,598 @@
+"""
+Deterministic fast-path query engine for common Titanic questions.
+
+Parses simple question shapes (aggregate X, group by Y, filter Z) into pandas
+operations so the most frequent questions are answered in milliseconds
+without calling the LangChain agent. Anything the parser does not fully
+understand returns None and falls through to the agent.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+import pandas as pd
+
+
+# Human-readable labels for the categorical columns we group and filter on
+VALUE_LABELS = {
+    "sex": {"male": "Male", "female": "Female"},
+    "pclass": {1: "First Class", 2: "Second Class", 3: "Third Class"},
+    "embarked": {"S": "Southampton", "C": "Cherbourg", "Q": "Queenstown"},
+    "survived": {1: "Survived", 0: "Did Not Survive"},
+    "who": {"man": "Men", "woman": "Women", "child": "Children"},
+    "alone": {True: "Travelling Alone", False: "With Family"},
+}
+
+DIMENSION_LABELS = {
+    "sex": "Gender",
+    "pclass": "Class",
+    "embarked": "Embarkation Port",
+    "survived": "Survival",
+    "who": "Passenger Type",
+    "deck": "Deck",
+    "alone": "Travelling Alone",
+}
+
+# Phrases naming a column we can group by, longest first so they win the match
+GROUP_ALIASES = [
+    ("embarkation ports?", "embarked"),
+    ("ports? of embarkation", "embarked"),
+    ("embarkation", "embarked"),
+    ("ports?", "embarked"),
+    ("passenger class(?:es)?", "pclass"),
+    ("ticket class(?:es)?", "pclass"),
+    ("class(?:es)?", "pclass"),
+    ("pclass", "pclass"),
+    ("genders?", "sex"),
+    ("sex(?:es)?", "sex"),
+    ("decks?", "deck"),
+    ("passenger types?", "who"),
+    ("survival status", "survived"),
+    ("survival", "survived"),
+]
+
+# Filters recognised in the question: (pattern, column, value, label)
+FILTERS = [
+    (r"\b(?:first|1st|upper)[- ]class\b", "pclass", 1, "First Class"),
+    (r"\b(?:second|2nd|middle)[- ]class\b", "pclass", 2, "Second Class"),
+    (r"\b(?:third|3rd|lower)[- ]class\b", "pclass", 3, "Third Class"),
+    (r"\bnon[- ]?survivors?\b|\b(?:did not|didn't) survive\b|\bperished\b|\bdied\b", "survived", 0, "Non-Survivors"),
+    (r"\bsurvivors\b", "survived", 1, "Survivors"),
+    (r"\bfemales?\b|\bwomen\b|\bwoman\b", "sex", "female", "Female"),
+    (r"\bmales?\b|\bmen\b|\bman\b", "sex", "male", "Male"),
+    (r"\bchild(?:ren)?\b|\bkids?\b", "who", "child", "Children"),
+    (r"\bsouthampton\b", "embarked", "S", "Southampton"),
+    (r"\bcherbourg\b", "embarked", "C", "Cherbourg"),
+    (r"\bqueenstown\b", "embarked", "Q", "Queenstown"),
+    (r"\b(?:travel+(?:ing|ed)|were|was) alone\b", "alone", True, "Travelling Alone"),
+]
+
+# Aggregation keywords, checked in order
+AGGREGATIONS = [
+    (r"\bmost expensive\b|\bhighest\b|\bmaximum\b|\bmax\b|\blargest\b|\boldest\b|\bmost\b", "max"),
+    (r"\bcheapest\b|\blowest\b|\bminimum\b|\bmin\b|\bsmallest\b|\byoungest\b|\bleast\b", "min"),
+    (r"\baverage\b|\bmean\b|\bavg\b", "mean"),
+    (r"\bmedian\b", "median"),
+    (r"\bpercentage\b|\bpercent\b|\bproportion\b|\bshare\b|\bfraction\b|%", "share"),
+    (r"\bhow many\b|\bnumber of\b|\bcount\b|\btotal\b", "count"),
+    (r"\bdistribution\b|\bhistogram\b|\bbreakdown\b|\bspread\b", "distribution"),
+    (r"\brates?\b", "rate"),
+]
+
+# Numeric columns the engine can aggregate, with the words that name them
+METRICS = [
+    (r"\bages?\b|\bold\b|\boldest\b|\byoungest\b", "age"),
+    (r"\bfares?\b|\bticket prices?\b|\bprices?\b|\bcost\b|\bpaid\b|\bexpensive\b|\bcheapest\b|\btickets?\b", "fare"),
+    (r"\bsiblings?\b|\bspouses?\b|\bsibsp\b", "sibsp"),
+    (r"\bparents?\b|\bparch\b", "parch"),
+    (r"\bsurviv\w*\b", "survived"),
+]
+
+# A filter naming the population a share is taken of ("share of survivors
+# were women", "among survivors"), rather than the passengers counted in it
+SHARE_BASE_PATTERN = (r"(?:\b(?:percentage|percent|proportion|share|fraction)|%)\s+of\s+(?:the\s+)?(?:{filter})"
+                      r"(?:\s+passengers?)?\s+(?:were|was|are|is|who|that)\b|\bamong\s+(?:the\s+)?(?:{filter})")
+
+OVERVIEW_PATTERN = re.compile(r"\boverview\b|\bsummary\b|\bsummar\w+\b|\bgeneral statistics\b")
+
+# Words that carry no meaning for the parser; anything else left over means
+# the question has a shape we do not understand and must go to the agent.
+FILLER_WORDS = {
+    "a", "an", "the", "of", "on", "in", "at", "to", "for", "from", "and", "or",
+    "with", "what", "was", "were", "is", "are", "be", "been", "did", "do",
+    "does", "how", "much", "me", "show", "give", "tell", "please", "can",
+    "could", "you", "i", "want", "know", "passengers", "passenger", "people",
+    "persons", "titanic", "dataset", "data", "board", "aboard", "onboard",
+    "overall", "which", "who", "whom", "had", "has", "have", "their", "all",
+    "whole", "entire", "compare", "comparison", "compared", "vs", "versus",
+    "between", "across", "among", "each", "every", "per", "by", "group",
+    "grouped", "chart", "plot", "graph", "visualize", "visualise", "bar",
+    "pie", "there", "it", "s", "statistics", "stats", "pay", "paid",
+    "embarked", "travelled", "traveled", "sailed", "ship", "rate", "rates",
+    "get", "got", "let", "see", "some", "about", "this",
+    "that", "these", "those", "ticket", "tickets", "different", "various",
+}
+
+UNSUPPORTED_PATTERN = re.compile(
+    r"\d|\bwhy\b|\bcorrelat\w*|\bpredict\w*|\brelationship\b|\blikel\w*|\bnames?\b"
+    r"|\bcabin\b|\bolder than\b|\byounger than\b|\bmore than\b|\bless than\b"
+    r"|\bgreater\b|\babove\b|\bbelow\b|\bunder\b|\bover\b"
+)
+
+
+@dataclass
+class ParsedQuery:
+    """Structured form of a question the fast path can answer."""
+    aggregation: str
+    metric: Optional[str] = None
+    group_by: Optional[str] = None
+    filters: list = field(default_factory=list)
+    wants_rows: bool = False
+    lowest_first: bool = False
+    base: list = field(default_factory=list)  # Filters a share is taken of; empty means all passengers
+
+
+def _strip_ordinals(text: str) -> str:
+    """Replace 1st/2nd/3rd class ordinals so the digit check does not reject them."""
+    return re.sub(r"\b1st\b", "first", re.sub(r"\b2nd\b", "second", re.sub(r"\b3rd\b", "third", text)))
+
+
+def _consume(pattern: str, text: str):
+    """Return (match, text with the match blanked out) for the first match of pattern."""
+    match = re.search(pattern, text)
+    if not match:
+        return None, text
+    return match, text[:match.start()] + " " + text[match.end():]
+
+
+def parse_question(question: str) -> Optional[ParsedQuery]:
+    """
+    Parse a question into a ParsedQuery, or return None if any part of it
+    is outside the supported shapes.
+    """
+    text = _strip_ordinals(question.lower().strip())
+    text = re.sub(r"[?!.,;:]", " ", text)
+
+    if UNSUPPORTED_PATTERN.search(text):
+        return None
+
+    if OVERVIEW_PATTERN.search(text):
+        text = OVERVIEW_PATTERN.sub(" ", text)
+        tokens = re.findall(r"[a-z']+", text.replace("'", " "))
+        if all(token in FILLER_WORDS for token in tokens):
+            return ParsedQuery(aggregation="overview")
+        return None
+
+    # Explicit group-by phrases ("by gender", "each class", "which port")
+    group_by = None
+    for alias, column in GROUP_ALIASES:
+        pattern = rf"\b(?:by|per|each|every|across|among|between|which|for each|in each)\s+(?:the\s+)?(?:passenger\s+)?(?:{alias})\b"
+        match, text = _consume(pattern, text)
+        if match:
+            group_by = column
+            break
+
+    # Filters; two values of the same column turn into a group-by on it
+    filters, base = [], []
+    for pattern, column, value, label in FILTERS:
+        if re.search(SHARE_BASE_PATTERN.format(filter=pattern), text):
+            base.append((column, value, label))
+        match, text = _consume(pattern, text)
+        while match:
+            if (column, value, label) not in filters:
+                filters.append((column, value, label))
+            match, text = _consume(pattern, text)
+    filter_columns = [column for column, _, _ in filters]
+    for column in set(filter_columns):
+        if filter_columns.count(column) > 1 or column == group_by:
+            filters = [f for f in filters if f[0] != column]
+            group_by = group_by or column
+
+    aggregation = None
+    for pattern, name in AGGREGATIONS:
+        if re.search(pattern, text):
+            aggregation = name
+            break
+
+    # More than one metric ("fare and age") is not a supported shape
+    metrics = [column for pattern, column in METRICS if re.search(pattern, text)]
+    if len(metrics) > 1:
+        return None
+    metric = metrics[0] if metrics else None
+
+    # "distribution of ports", "breakdown by class" without a "by" prefix
+    if group_by is None and metric is None:
+        for alias, column in GROUP_ALIASES:
+            match, text = _consume(rf"\b(?:{alias})\b", text)
+            if match:
+                group_by = column
+                break
+
+    wants_rows = bool(re.search(r"\bwho\b", text)) and aggregation in ("max", "min") and group_by is None
+
+    # Blank out every recognised word and make sure nothing unknown remains
+    for pattern, _ in AGGREGATIONS + METRICS:
+        text = re.sub(pattern, " ", text)
+    leftovers = [token for token in re.findall(r"[a-z]+", text) if token not in FILLER_WORDS]
+    if leftovers:
+        return None
+
+    return finalize_query(aggregation, metric, group_by, filters, wants_rows, base)
+
+
+def finalize_query(aggregation: Optional[str], metric: Optional[str], group_by: Optional[str],
+                   filters: list, wants_rows: bool = False, base: Optional[list] = None) -> Optional[ParsedQuery]:
+    """Resolve the aggregation for a metric, or return None if the combination is not supported."""
+    lowest_first = aggregation == "min"
+    base = [f for f in base or [] if f in filters]
+    if metric == "survived":
+        if aggregation in ("max", "min") and group_by is None:
+            return None
+        if aggregation in (None, "share", "count", "rate", "distribution", "max", "min"):
+            aggregation = "rate"
+    elif metric is not None:
+        if aggregation in (None, "distribution"):
+            aggregation = "describe"
+        elif aggregation in ("share", "count", "rate"):
+            return None
+    else:
+        if aggregation in ("distribution", None) and group_by is not None:
+            aggregation = "count"
+        elif aggregation in ("max", "min") and group_by is not None:
+            aggregation = "count"
+        elif aggregation not in ("count", "share"):
+            return None
+        if group_by is None and not filters and aggregation == "share":
+            return None
+        # With several filters a share needs to know which of them is the population
+        if group_by is None and aggregation == "share":
+            if (not base and len(filters) > 1) or len(base) == len(filters):
+                return None
+    if aggregation != "share" or group_by is not None:
+        base = []
+
+    if aggregation is None:
+        return None
+
+    return ParsedQuery(
+        aggregation=aggregation,
+        metric=metric,
+        group_by=group_by,
+        filters=filters,
+        wants_rows=wants_rows,
+        lowest_first=lowest_first,
+        base=base,
+    )
+
+
+# Words that only mark a question as a follow-up ("and for women only?")
+FOLLOW_UP_WORDS = {"only", "just", "now", "instead", "same", "but", "then", "also", "them", "they",
+                   "ones", "if", "again", "too", "case", "about", "look", "looking", "split", "break", "down"}
+
+
+@dataclass
+class Refinement:
+    """The parts of a follow-up question that change the previous query."""
+    filters: list = field(default_factory=list)
+    group_by: Optional[str] = None
+    aggregation: Optional[str] = None
+    metric: Optional[str] = None
+
+
+def parse_refinement(question: str) -> Optional[Refinement]:
+    """
+    Parse a follow-up such as "and for first class only?" or "what about by
+    gender?" into the filters, grouping, aggregation and metric it names.
+    Returns None if it mentions anything else or nothing at all.
+    """
+    text = _strip_ordinals(question.lower().strip())
+    text = re.sub(r"[?!.,;:]", " ", text)
+    if UNSUPPORTED_PATTERN.search(text) or OVERVIEW_PATTERN.search(text):
+        return None
+
+    refinement = Refinement()
+    for alias, column in GROUP_ALIASES:
+        match, text = _consume(rf"\b(?:by|per|each|every|across|among|in each|for each)\s+(?:the\s+)?(?:passenger\s+)?(?:{alias})\b", text)
+        if match:
+            refinement.group_by = column
+            break
+    for pattern, column, value, label in FILTERS:
+        match, text = _consume(pattern, text)
+        while match:
+            if (column, value, label) not in refinement.filters:
+                refinement.filters.append((column, value, label))
+            match, text = _consume(pattern, text)
+    filter_columns = [column for column, _, _ in refinement.filters]
+    for column in set(filter_columns):
+        if filter_columns.count(column) > 1:
+            refinement.filters = [f for f in refinement.filters if f[0] != column]
+            refinement.group_by = refinement.group_by or column
+
+    for pattern, name in AGGREGATIONS:
+        if re.search(pattern, text):
+            refinement.aggregation = name
+            break
+    metrics = [column for pattern, column in METRICS if re.search(pattern, text)]
+    if len(metrics) > 1:
+        return None
+    refinement.metric = metrics[0] if metrics else None
+
+    for pattern, _ in AGGREGATIONS + METRICS:
+        text = re.sub(pattern, " ", text)
+    if any(token not in FILLER_WORDS and token not in FOLLOW_UP_WORDS for token in re.findall(r"[a-z]+", text)):
+        return None
+    if not (refinement.filters or refinement.group_by or refinement.aggregation or refinement.metric):
+        return None
+    return refinement
+
+
+def refine_query(previous: ParsedQuery, refinement: Refinement) -> Optional[ParsedQuery]:
+    """Apply a follow-up to the previous query, e.g. add a filter or change the grouping."""
+    if previous.aggregation == "overview":
+        return None
+    # A new value for a column replaces the old filter on it
+    replaced = {column for column, _, _ in refinement.filters}
+    filters = [f for f in previous.filters if f[0] not in replaced] + refinement.filters
+    group_by = refinement.group_by or previous.group_by
+    if group_by in replaced:
+        if refinement.group_by:
+            filters = [f for f in filters if f[0] != group_by]
+        else:
+            group_by = None  # "by class" narrowed down to "first class only"
+
+    metric = refinement.metric or previous.metric
+    aggregation = refinement.aggregation
+    if aggregation is None and (refinement.metric is None or previous.aggregation in AGGREGATION_TITLES):
+        aggregation = "min" if previous.lowest_first else previous.aggregation
+        if aggregation in ("rate", "describe") and metric != previous.metric:
+            aggregation = None
+    if aggregation in ("count", "share") and refinement.metric is None and metric != "survived":
+        metric = None
+    return finalize_query(aggregation, metric, group_by, filters, previous.wants_rows and group_by is None, previous.base)
+
+
+def _label(column: str, value) -> str:
+    """Return a display label for a categorical value."""
+    labels = VALUE_LABELS.get(column, {})
+    if value in labels:
+        return labels[value]
+    if column == "deck":
+        return f"Deck {value}"
+    return str(value).title()
+
+
+def _format_value(column: str, value: float) -> str:
+    """Format a numeric statistic following the SYSTEM_PROMPT formatting rules."""
+    if column == "fare":
+        return f"${value:,.2f}"
+    if column == "age":
+        return f"{value:.2f} years"
+    return f"{value:.2f}"
+
+
+def _heading(title: str, filters: list, emoji: str = "📊") -> str:
+    """Build a bold heading, suffixed with the active filters."""
+    if filters:
+        title = f"{title} — {', '.join(label for _, _, label in filters)}"
+    return f"{emoji} **{title}**"
+
+
+METRIC_TITLES = {"age": "Age", "fare": "Fare", "sibsp": "Siblings/Spouses Aboard", "parch": "Parents/Children Aboard"}
+
+AGGREGATION_TITLES = {"mean": "Average", "median": "Median", "max": "Highest", "min": "Lowest"}
+
+
+def apply_filters(df: pd.DataFrame, filters: list) -> pd.DataFrame:
+    """Rows of df matching every (column, value, label) filter."""
+    subset = df
+    for column, value, _ in filters:
+        subset = subset[subset[column] == value]
+    return subset
+
+
+class FrameSource:
+    """
+    The aggregates execute_query needs, over rows already in memory.
+    Out-of-core datasets supply the same methods (chunked_dataset.ChunkedQuery).
+    """
+
+    def __init__(self, subset: pd.DataFrame):
+        self.subset = subset
+
+    def __len__(self) -> int:
+        return len(self.subset)
+
+    def group_stats(self, group_by: str, column: str, aggs: list) -> pd.DataFrame:
+        return self.subset.groupby(group_by, observed=True)[column].agg(aggs)
+
+    def value_counts(self, column: str) -> pd.Series:
+        return self.subset[column].value_counts()
+
+    def stats(self, column: str, aggs: list) -> pd.Series:
+        return self.subset[column].dropna().agg(aggs)
+
+    def rows_where(self, column: str, value, n: int) -> tuple:
+        """(first n rows where column equals value, number of such rows)"""
+        matches = self.subset[self.subset[column] == value]
+        return matches.head(n), len(matches)
+
+
+def query_source(df, filters: list, subset: Optional[pd.DataFrame] = None):
+    """Rows matching filters: the given subset, a filtered DataFrame or a streamed out-of-core query."""
+    if subset is not None:
+        return FrameSource(subset)
+    if isinstance(df, pd.DataFrame):
+        return FrameSource(apply_filters(df, filters))
+    return df.query_source(filters)
+
+
+def execute_query(parsed: ParsedQuery, df: pd.DataFrame, subset: Optional[pd.DataFrame] = None) -> Optional[str]:
+    """
+    Run a ParsedQuery against df and return a formatted markdown answer.
+    subset, if given, is df with the query's filters already applied.
+    """
+    needed = [c for c in (parsed.metric, parsed.group_by) if c] + [c for c, _, _ in parsed.filters]
+    if parsed.aggregation == "overview":
+        needed = ["survived", "age", "fare"]
+    if any(column not in df.columns for column in needed):
+        return None
+
+    if parsed.aggregation == "overview":
+        everyone = query_source(df, [])
+        return "\n".join([
+            "🚢 **Titanic Dataset Overview**",
+            "",
+            f"- **Total passengers:** {len(df):,}",
+            f"- **Survival rate:** {everyone.stats('survived', ['mean'])['mean'] * 100:.2f}%",
+            f"- **Average age:** {everyone.stats('age', ['mean'])['mean']:.2f} years",
+            f"- **Average fare:** ${everyone.stats('fare', ['mean'])['mean']:,.2f}",
+        ])
+
+    source = query_source(df, parsed.filters, subset)
+    if len(source) == 0:
+        return None
+
+    if parsed.aggregation == "rate":
+        return _answer_rate(parsed, source)
+    if parsed.aggregation in ("count", "share"):
+        return _answer_count(parsed, source, len(query_source(df, parsed.base)) if parsed.base else len(df))
+    if parsed.aggregation == "describe":
+        return _answer_describe(parsed, source)
+    return _answer_statistic(parsed, source)
+
+
+def _answer_rate(parsed: ParsedQuery, source: FrameSource) -> str:
+    if parsed.group_by is None:
+        totals = source.stats("survived", ["sum", "count"])
+        survived, passengers = int(totals["sum"]), int(totals["count"])
+        return "\n".join([
+            _heading("Survival Rate", parsed.filters, "🚢"),
+            "",
+            f"- **Survival rate:** {survived / passengers * 100:.2f}%",
+            f"- **Survived:** {survived:,} of {passengers:,} passengers",
+        ])
+
+    grouped = source.group_stats(parsed.group_by, "survived", ["sum", "count"])
+    grouped["rate"] = grouped["sum"] / grouped["count"] * 100
+    lines = [_heading(f"Survival Rate by {DIMENSION_LABELS[parsed.group_by]}", parsed.filters), ""]
+    for value, row in grouped.iterrows():
+        lines.append(
+            f"- **{_label(parsed.group_by, value)}:** {row['rate']:.2f}% "
+            f"({int(row['sum']):,} of {int(row['count']):,})"
+        )
+    best = grouped["rate"].idxmin() if parsed.lowest_first else grouped["rate"].idxmax()
+    word = "lowest" if parsed.lowest_first else "highest"
+    lines += ["", f"**{_label(parsed.group_by, best)}** had the {word} survival rate at {grouped.loc[best, 'rate']:.2f}%."]
+    return "\n".join(lines)
+
+
+def _answer_count(parsed: ParsedQuery, source: FrameSource, total: int) -> str:
+    matched = len(source)
+    if parsed.base:
+        population = ", ".join(label for _, _, label in parsed.base)
+        return "\n".join([
+            _heading(f"Percentage of {population}", [f for f in parsed.filters if f not in parsed.base], "👥"),
+            "",
+            f"- **Count:** {matched:,} passengers",
+            f"- **Share of {population}:** {matched / total * 100:.2f}% ({matched:,} of {total:,})",
+        ])
+    if parsed.group_by is None:
+        title = "Percentage of Passengers" if parsed.aggregation == "share" else "Passenger Count"
+        return "\n".join([
+            _heading(title, parsed.filters, "👥"),
+            "",
+            f"- **Count:** {matched:,} passengers",
+            f"- **Share of all passengers:** {matched / total * 100:.2f}%",
+        ])
+
+    counts = source.value_counts(parsed.group_by)
+    counts = counts[counts > 0]  # Categorical columns also list unused categories
+    if parsed.group_by == "pclass":
+        counts = counts.sort_index()
+    lines = [_heading(f"Passengers by {DIMENSION_LABELS[parsed.group_by]}", parsed.filters, "👥"), ""]
+    for value, count in counts.items():
+        lines.append(f"- **{_label(parsed.group_by, value)}:** {count:,} ({count / matched * 100:.2f}%)")
+    best = counts.idxmin() if parsed.lowest_first else counts.idxmax()
+    word = "fewest" if parsed.lowest_first else "most"
+    lines += ["", f"**{_label(parsed.group_by, best)}** had the {word} passengers at {counts[best]:,}."]
+    return "\n".join(lines)
+
+
+def _answer_describe(parsed: ParsedQuery, source: FrameSource) -> str:
+    if parsed.group_by is not None:
+        return _answer_statistic(ParsedQuery("mean", parsed.metric, parsed.group_by, parsed.filters), source)
+    summary = source.stats(parsed.metric, ["count", "mean", "median", "min", "max"])
+    if summary["count"] == 0:
+        return None
+    return "\n".join([
+        _heading(f"{METRIC_TITLES[parsed.metric]} Distribution", parsed.filters),
+        "",
+        f"- **Passengers with recorded {parsed.metric}:** {int(summary['count']):,}",
+        f"- **Average:** {_format_value(parsed.metric, summary['mean'])}",
+        f"- **Median:** {_format_value(parsed.metric, summary['median'])}",
+        f"- **Range:** {_format_value(parsed.metric, summary['min'])} – {_format_value(parsed.metric, summary['max'])}",
+    ])
+
+
+def _answer_statistic(parsed: ParsedQuery, source: FrameSource) -> Optional[str]:
+    metric, aggregation = parsed.metric, parsed.aggregation
+    if metric is None or aggregation not in AGGREGATION_TITLES:
+        return None
+    title = f"{AGGREGATION_TITLES[aggregation]} {METRIC_TITLES[metric]}"
+    emoji = "💰" if metric == "fare" else "📊"
+
+    if parsed.group_by is not None:
+        grouped = source.group_stats(parsed.group_by, metric, [aggregation])[aggregation].dropna()
+        if grouped.empty:
+            return None
+        lines = [_heading(f"{title} by {DIMENSION_LABELS[parsed.group_by]}", parsed.filters, emoji), ""]
+        for value, stat in grouped.items():
+            lines.append(f"- **{_label(parsed.group_by, value)}:** {_format_value(metric, stat)}")
+        return "\n".join(lines)
+
+    summary = source.stats(metric, [aggregation, "count"])
+    if summary["count"] == 0:
+        return None
+    stat = summary[aggregation]
+    lines = [
+        _heading(title, parsed.filters, emoji),
+        "",
+        f"- **{title}:** {_format_value(metric, stat)}",
+        f"- Based on {int(summary['count']):,} passengers with a recorded {metric}",
+    ]
+    if parsed.wants_rows and aggregation in ("max", "min"):
+        matches, matched = source.rows_where(metric, stat, 5)
+        lines += ["", f"**Paid by {matched} passenger(s):**" if metric == "fare" else f"**{matched} passenger(s):**"]
+        for _, row in matches.iterrows():
+            lines.append(f"- {_describe_passenger(row)}")
+    return "\n".join(lines)
+
+
+def _describe_passenger(row: pd.Series) -> str:
+    """One-line description of a passenger row, using whichever columns exist."""
+    parts = []
+    if "sex" in row and pd.notna(row["sex"]):
+        parts.append(_label("sex", row["sex"]))
+    if "age" in row and pd.notna(row["age"]):
+        parts.append(f"age {row['age']:g}")
+    if "pclass" in row and pd.notna(row["pclass"]):
+        parts.append(_label("pclass", row["pclass"]))
+    if "embark_town" in row and pd.notna(row["embark_town"]):
+        parts.append(f"embarked at {row['embark_town']}")
+    if "survived" in row and pd.notna(row["survived"]):
+        parts.append("survived" if row["survived"] == 1 else "did not survive")
+    return ", ".join(parts)
+
+
+def answer_question(question: str, df: pd.DataFrame) -> Optional[str]:
+    """
+    Answer a question directly from the DataFrame when it matches a supported
+    shape. Returns None so the caller can fall back to the LLM agent.
+    """
+    parsed = parse_question(question)
+    if parsed is None:
+        return None
+    try:
+        return execute_query(parsed, df)
+    except (KeyError, TypeError, ValueError):
+        return None
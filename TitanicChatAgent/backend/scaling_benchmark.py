@@ -0,0 +1,136 @@
+"""
+Throughput of the multi-worker server as the worker count grows.
+
+For each worker count, starts `serve.py --workers N` on a local port with
+the replayed LLM (LLM_PROVIDER=replay, no network or API key), drives it
+over HTTP with benchmark.run_scenario and stops it again. The replayed
+agent path is CPU-bound (LangChain, the ReAct parser and the pandas
+tools), so a single process tops out at one core and throughput should
+grow with workers up to the number of cores:
+
+    python scaling_benchmark.py
+    python scaling_benchmark.py --workers 1,2,4,8 --concurrency 64 --requests 800
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmark import BENCH_DIR, DEFAULT_TRACES, git_commit, run_scenario, scenario_requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "scaling.json")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, port: int, store_dir: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        LLM_PROVIDER="replay",
+        GROQ_API_KEY="offline-benchmark",
+        AGENT_STARTUP="eager",
+        LLM_TOKENS_PER_MINUTE="0",
+        LLM_TOKENS_PER_DAY="0",
+        # Every request has to reach the agent
+        ANSWER_CACHE_SIZE="0",
+        CODE_CACHE_ENABLED="false",
+        ANSWER_SNAPSHOT_PATH="",
+        ANSWER_CACHE_PATH=os.path.join(store_dir, f"answers-{workers}.sqlite"),
+        SESSION_STORE_PATH=os.path.join(store_dir, f"sessions-{workers}.sqlite"),
+    )
+    return subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "serve.py"), "--workers", str(workers),
+         "--host", "127.0.0.1", "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+async def wait_ready(client, process: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if (await client.get("/startup")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.25)
+    raise TimeoutError("Server did not start in time")
+
+
+async def measure(workers: int, args, requests: list, store_dir: str) -> dict:
+    import httpx
+
+    port = free_port()
+    process = start_server(workers, port, store_dir)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+            await wait_ready(client, process)
+            # Warm-up reaches every worker so each has built its agent
+            await run_scenario(client, requests, len(requests) * workers * 2, args.concurrency)
+            result = await run_scenario(client, requests, args.requests, args.concurrency)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    result.pop("memory", None)  # Client-side numbers, not the server's
+    result["workers"] = workers
+    return result
+
+
+async def run_scaling(args) -> dict:
+    from fake_llm import load_traces
+
+    requests = scenario_requests(args.scenario, load_traces(args.traces))
+    results = []
+    with tempfile.TemporaryDirectory() as store_dir:
+        for workers in args.workers:
+            result = await measure(workers, args, requests, store_dir)
+            result["speedup"] = round(result["throughput_rps"] / results[0]["throughput_rps"], 2) if results else 1.0
+            results.append(result)
+            print(f"workers={workers:<3} {result['throughput_rps']:>9} rps  x{result['speedup']:<5} "
+                  f"p50 {result['latency_ms']['p50']:>9} ms  p95 {result['latency_ms']['p95']:>9} ms  "
+                  f"errors {result['errors']}")
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "cpu_count": os.cpu_count(),
+        "config": {"scenario": args.scenario, "requests": args.requests, "concurrency": args.concurrency},
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput versus worker processes")
+    parser.add_argument("--workers", default="1,2,4", type=lambda value: [int(w) for w in value.split(",")])
+    parser.add_argument("--scenario", default="agent", choices=["info", "fast_path", "viz", "agent"])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=400, help="Measured requests per worker count")
+    parser.add_argument("--traces", default=DEFAULT_TRACES)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if (os.cpu_count() or 1) < max(args.workers):
+        print(f"⚠️ Only {os.cpu_count()} CPU core(s): throughput cannot scale past that many workers")
+    report = asyncio.run(run_scaling(args))
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Results written to {args.output}")
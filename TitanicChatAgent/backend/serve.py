@@ -0,0 +1,83 @@
+"""
+Multi-process entry point for the backend.
+
+    python serve.py --workers 4 --port 8000
+
+The parent process prepares what the workers share before starting them:
+
+- the dataset's Arrow copy (dataset_loader writes it next to the CSV), so
+  every worker reads that file instead of parsing the CSV; each still holds
+  its own DataFrame
+- SQLite files for the answer cache, the code cache and conversation
+  sessions, so an answer computed by one worker is a cache hit for all of
+  them and follow-ups can land on any worker
+
+Large Parquet datasets are opened out-of-core (see chunked_dataset), so the
+parent only reads their footer.
+
+Each worker still builds its own LLM client and agent, and takes
+1/workers of the provider's token quota. Metrics and the other counters
+are per worker. The worker count defaults to $WEB_CONCURRENCY, or 1.
+"""
+import argparse
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BACKEND_DIR, "..", "data")
+SHARED_STORES = {
+    "ANSWER_CACHE_PATH": "answer_cache.sqlite",
+    "CODE_CACHE_PATH": "code_cache.sqlite",
+    "SESSION_STORE_PATH": "sessions.sqlite",
+}
+
+
+def prepare_shared_state(workers: int) -> dict:
+    """Write the Arrow copy of the dataset and point the workers at shared stores."""
+    sys.path.insert(0, BACKEND_DIR)
+    from dataset_loader import load_dataset
+
+    dataset_path = os.getenv("DATASET_PATH", os.path.join(DATA_DIR, "titanic.csv"))
+    _, report = load_dataset(
+        dataset_path,
+        fmt=os.getenv("DATASET_FORMAT", "auto"),
+        compact=os.getenv("DATASET_COMPACT_DTYPES", "true").lower() == "true",
+        use_cache=os.getenv("DATASET_CACHE", "true").lower() == "true",
+        out_of_core=os.getenv("DATASET_OUT_OF_CORE", "auto").lower(),
+        out_of_core_rows=int(os.getenv("DATASET_OUT_OF_CORE_ROWS", "2000000"))
+    )
+    if report.format == "parquet-chunked":
+        storage = "out-of-core, scanned in chunks"
+    else:
+        storage = "Arrow cache" if report.from_cache or report.format != "csv" else "CSV, no cache"
+    print(f"📦 Dataset ready for {workers} worker(s): {report.rows} rows, {report.format} ({storage})")
+    if workers > 1:
+        for variable, name in SHARED_STORES.items():
+            os.environ.setdefault(variable, os.path.join(DATA_DIR, name))
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    return {variable: os.environ.get(variable) for variable in SHARED_STORES}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the backend with several worker processes")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import uvicorn
+
+    args = parse_args(argv)
+    workers = max(1, args.workers)
+    stores = prepare_shared_state(workers)
+    for variable, path in stores.items():
+        if path:
+            print(f"🗄️ {variable}={path}")
+    # An import string, so uvicorn can start the app in each worker process
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=workers, app_dir=BACKEND_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Server-side conversation sessions for follow-up questions.
+
+A client sends the same session_id with every question of a conversation.
+The session stores a short record of each turn: the question, its parsed
+intent and filters, and a one-line summary of the answer. It never keeps
+full answers.
+
+Follow-ups the fast-path parser understands ("and for first class only?",
+"what about by gender?") are merged into the previous query. They are then
+answered from the session's cached subsets. A cached subset whose filters
+are a subset of the new ones is narrowed further instead of re-filtering
+the full table. Other follow-ups go to the agent with a bounded summary of
+the recent turns, so prompt size does not grow with the conversation.
+
+With several worker processes, give SessionStore a SQLite path. The turn
+records are then shared, so a follow-up can land on any worker. Cached
+subsets stay per process and are rebuilt on first use.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+import pandas as pd
+
+from query_engine import ParsedQuery, apply_filters, parse_question, parse_refinement, refine_query
+
+
+# Questions that lean on the previous turn ("and ...", "what about ...", "only", "those")
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(?:and|but|what about|how about|what if|same|now|then|also|only|just)\b"
+    r"|\b(?:only|instead|them|those|they|same for)\b"
+)
+ANSWER_SUMMARY_CHARS = 160
+
+
+def summarize_answer(answer: str) -> str:
+    """First two non-empty lines of an answer, without markdown, as one short line."""
+    lines = [re.sub(r"[*#`]", "", line).strip(" -") for line in answer.splitlines()]
+    summary = " | ".join([line for line in lines if line][:2])
+    return summary if len(summary) <= ANSWER_SUMMARY_CHARS else summary[:ANSWER_SUMMARY_CHARS - 1] + "…"
+
+
+def _query_state(parsed: Optional[ParsedQuery]) -> Optional[dict]:
+    return asdict(parsed) if parsed is not None else None
+
+
+def _query_from_state(state: Optional[dict]) -> Optional[ParsedQuery]:
+    if state is None:
+        return None
+    return ParsedQuery(**dict(state, filters=[tuple(f) for f in state["filters"]],
+                              base=[tuple(f) for f in state.get("base", [])]))
+
+
+def _filter_key(filters: list) -> frozenset:
+    return frozenset((column, value) for column, value, _ in filters)
+
+
+@dataclass
+class Turn:
+    question: str
+    summary: str
+    parsed: Optional[ParsedQuery] = None
+
+
+@dataclass
+class ConversationSession:
+    """Compact history and cached row subsets of one conversation."""
+    id: str
+    dataset_id: str
+    max_turns: int = 8
+    max_subsets: int = 4
+    turns: deque = field(default_factory=deque)
+    last_query: Optional[ParsedQuery] = None  # Latest structured query, the base for refinements
+    subsets: OrderedDict = field(default_factory=OrderedDict)  # filter key -> DataFrame, LRU
+    checksum: Optional[str] = None  # Dataset the subsets were cut from
+    version: float = 0.0  # When the shared record was last written or read
+    follow_ups: int = 0
+    refined: int = 0
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+
+    def is_follow_up(self, question: str) -> bool:
+        """True if the question only makes sense after the previous turn."""
+        if not self.turns:
+            return False
+        text = question.lower()
+        if FOLLOW_UP_PATTERN.search(text):
+            return True
+        # A bare refinement like "women?" or "by port?" narrows the previous question
+        refinement = parse_refinement(question)
+        if refinement is None:
+            return False
+        return parse_question(question) is None or not (refinement.aggregation or refinement.metric)
+
+    def refine(self, question: str) -> Optional[ParsedQuery]:
+        """The previous structured query with this follow-up applied, if both parse."""
+        if self.last_query is None:
+            return None
+        refinement = parse_refinement(question)
+        return refine_query(self.last_query, refinement) if refinement else None
+
+    def subset_for(self, df: pd.DataFrame, filters: list, checksum: str) -> pd.DataFrame:
+        """
+        Rows of df matching filters. Starts from the most specific cached
+        subset whose filters are all included, so only the new filters run.
+        """
+        if checksum != self.checksum:
+            self.subsets.clear()
+            self.checksum = checksum
+        key = _filter_key(filters)
+        if key in self.subsets:
+            self.subsets.move_to_end(key)
+            return self.subsets[key]
+        base_key = max((cached for cached in self.subsets if cached <= key), key=len, default=frozenset())
+        base = self.subsets[base_key] if base_key else df
+        if base_key:
+            self.refined += 1
+        subset = apply_filters(base, [f for f in filters if (f[0], f[1]) not in base_key])
+        self.subsets[key] = subset
+        while len(self.subsets) > self.max_subsets:
+            self.subsets.popitem(last=False)
+        return subset
+
+    def record(self, question: str, answer: str, parsed: Optional[ParsedQuery] = None):
+        """Remember a turn; standalone questions are parsed so later follow-ups can refine them."""
+        parsed = parsed or parse_question(question)
+        if parsed is not None and parsed.aggregation != "overview":
+            self.last_query = parsed
+        self.turns.append(Turn(question, summarize_answer(answer), parsed))
+        while len(self.turns) > self.max_turns:
+            self.turns.popleft()
+        self.last_used = time.time()
+
+    def context(self, max_chars: int = 600) -> str:
+        """Summary of the recent turns for the agent prompt, at most max_chars long."""
+        lines = [f"- Q: {turn.question} A: {turn.summary}" for turn in self.turns]
+        if self.last_query and self.last_query.filters:
+            focus = f"Current filters: {', '.join(label for _, _, label in self.last_query.filters)}"
+        else:
+            focus = ""
+        # Oldest turns are dropped first
+        while lines and len("\n".join(["Conversation so far:", *lines, focus])) > max_chars:
+            lines.pop(0)
+        if not lines:
+            return focus[:max_chars]
+        return "\n".join(["Conversation so far:", *lines] + ([focus] if focus else []))
+
+    def to_state(self) -> dict:
+        """The shareable part of the session (no DataFrames)."""
+        return {
+            "turns": [[t.question, t.summary, _query_state(t.parsed)] for t in self.turns],
+            "last_query": _query_state(self.last_query),
+            "follow_ups": self.follow_ups,
+        }
+
+    def load_state(self, state: dict, version: float):
+        self.turns = deque(Turn(q, summary, _query_from_state(parsed)) for q, summary, parsed in state["turns"])
+        self.last_query = _query_from_state(state["last_query"])
+        self.follow_ups = state["follow_ups"]
+        self.version = version
+
+    def describe(self) -> dict:
+        return {
+            "session_id": self.id,
+            "dataset_id": self.dataset_id,
+            "turns": [{"question": t.question, "summary": t.summary} for t in self.turns],
+            "filters": [label for _, _, label in self.last_query.filters] if self.last_query else [],
+            "cached_subsets": len(self.subsets),
+            "follow_ups": self.follow_ups,
+            "refined_from_cache": self.refined,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+        }
+
+
+class SessionStore:
+    """
+    Sessions keyed by (dataset, session id); the least recently used go first,
+    idle ones expire. With a path, turn records are shared through SQLite.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 1800, max_turns: int = 8,
+                 max_subsets: int = 4, path: Optional[str] = None):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self.max_subsets = max_subsets
+        self.created = 0
+        self.expired = 0
+        self._retired = {"follow_ups": 0, "refined_from_cache": 0}  # Counters of sessions already gone
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.path = path
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " dataset_id TEXT NOT NULL, session_id TEXT NOT NULL, updated_at REAL NOT NULL,"
+                " state TEXT NOT NULL, PRIMARY KEY (dataset_id, session_id))"
+            )
+            self._db.commit()
+
+    def _shared(self, key: tuple) -> tuple:
+        """(updated_at, state) of the shared record, or (None, None)."""
+        if self._db is None:
+            return None, None
+        row = self._db.execute("SELECT updated_at, state FROM sessions WHERE dataset_id = ? AND session_id = ?",
+                               key).fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, None)
+
+    def get(self, session_id: str, dataset_id: str, create: bool = True) -> Optional[ConversationSession]:
+        key = (dataset_id, session_id)
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(key)
+            updated_at, state = self._shared(key)
+            if session is not None and session.version and updated_at is None:
+                # Deleted by another worker
+                self._retire(self._sessions.pop(key))
+                session = None
+            last_active = max(session.last_used if session else 0.0, updated_at or 0.0)
+            if last_active and now - last_active > self.ttl_seconds:
+                if session is not None:
+                    self._retire(self._sessions.pop(key))
+                if updated_at is not None:
+                    self._db.execute("DELETE FROM sessions WHERE dataset_id = ? AND session_id = ?", key)
+                    self._db.commit()
+                self.expired += 1
+                session, state = None, None
+            if session is None:
+                if state is None and not create:
+                    return None
+                session = ConversationSession(session_id, dataset_id, self.max_turns, self.max_subsets)
+                self._sessions[key] = session
+                self.created += state is None
+                while len(self._sessions) > self.max_sessions:
+                    self._retire(self._sessions.popitem(last=False)[1])
+            if state is not None and updated_at > session.version:
+                session.load_state(state, updated_at)
+            self._sessions.move_to_end(key)
+            session.last_used = now
+            return session
+
+    def save(self, session: ConversationSession):
+        """Publish the session's turns to the other workers (no-op without a shared path)."""
+        if self._db is None:
+            return
+        with self._lock:
+            session.version = time.time()
+            self._db.execute("INSERT OR REPLACE INTO sessions (dataset_id, session_id, updated_at, state) VALUES (?, ?, ?, ?)",
+                             (session.dataset_id, session.id, session.version, json.dumps(session.to_state())))
+            self._db.commit()
+
+    def delete(self, session_id: str, dataset_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop((dataset_id, session_id), None)
+            if session is not None:
+                self._retire(session)
+            shared = 0
+            if self._db is not None:
+                shared = self._db.execute("DELETE FROM sessions WHERE dataset_id = ? AND session_id = ?",
+                                          (dataset_id, session_id)).rowcount
+                self._db.commit()
+            return session is not None or shared > 0
+
+    def _retire(self, session: ConversationSession):
+        self._retired["follow_ups"] += session.follow_ups
+        self._retired["refined_from_cache"] += session.refined
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            active = len(sessions)
+            if self._db is not None:
+                active = self._db.execute("SELECT COUNT(*) FROM sessions WHERE updated_at > ?",
+                                          (time.time() - self.ttl_seconds,)).fetchone()[0]
+        return {
+            "active": active,
+            "shared_path": self.path,
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "created": self.created,
+            "expired": self.expired,
+            "follow_ups": self._retired["follow_ups"] + sum(s.follow_ups for s in sessions),
+            "refined_from_cache": self._retired["refined_from_cache"] + sum(s.refined for s in sessions),
+            "cached_subsets": sum(len(s.subsets) for s in sessions),
+        }
@@ -0,0 +1,316 @@
+"""
+SQL tools for the agent, over an embedded copy of the dataset.
+
+With AGENT_TOOLS=sql the agent answers with one read-only SELECT per step
+(sql_query) instead of pandas code or typed-tool JSON, and can look up
+column types and values first (sql_schema). The DataFrame is copied once per
+dataset into an in-memory database: DuckDB when it is installed (vectorized,
+multi-threaded execution), otherwise the standard library's SQLite.
+
+Agents ask the same few query shapes with different values, so string
+literals and compared numbers are lifted out of each query into parameters
+(query_shape): "... WHERE age < 12" and "... WHERE age < 30" are one shape.
+Shapes are kept in an LRU plan cache. With SQLite the connection's
+statement cache is sized to match, so a repeated shape reuses its prepared
+statement and skips parsing and planning; DuckDB's Python API keeps no
+statement cache, so there the plan cache only saves the shape check. Shapes
+that cannot run with parameters (e.g. a quoted alias) run with their
+literals in place.
+"""
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Union
+
+import pandas as pd
+
+from pandas_tools import MAX_RESULT_ROWS, ToolInputError, _escape_template, _format
+
+
+TABLE_NAME = "titanic"
+PLAN_CACHE_SIZE = 128
+QUERY_TIMEOUT = 5.0  # Seconds a SQLite query may run before it is interrupted
+SCHEMA_VALUES = 12  # Columns with at most this many distinct values list them in the schema
+
+TOKEN = re.compile(r"""
+    (?P<string>'(?:[^']|'')*')
+  | (?P<identifier>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<number>(?<![\w.])(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w.]))
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<operator><=|>=|<>|!=|==|[=<>])
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+# A number after one of these is a value; elsewhere it may be an ordinal
+# (ORDER BY 2) or a precision (ROUND(x, 2)) and stays in the SQL
+VALUE_CONTEXT = {"=", "==", "!=", "<>", "<", "<=", ">", ">=", "BETWEEN", "AND", "LIMIT", "OFFSET"}
+READ_ONLY_START = {"SELECT", "WITH"}
+WRITE_KEYWORDS = {"INSERT", "UPDATE", "DELETE", "CREATE", "DROP", "ALTER", "ATTACH", "DETACH",
+                  "COPY", "PRAGMA", "INSTALL", "LOAD", "EXPORT", "IMPORT", "SET", "CALL", "VACUUM"}
+# SQLite authorizer actions a read-only query needs
+SQLITE_READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION,
+                       getattr(sqlite3, "SQLITE_RECURSIVE", 33)}
+
+
+def query_shape(sql: str) -> tuple:
+    """
+    (shape, params): the query with value literals replaced by ? and their
+    values, comments dropped and whitespace collapsed. Raises ToolInputError
+    unless the query is a single read-only SELECT.
+    """
+    parts, params, previous, words = [], [], "", []
+    for match in TOKEN.finditer(sql):
+        kind, text = match.lastgroup, match.group()
+        if kind in ("space", "comment"):
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+            continue
+        token = text.upper() if kind in ("word", "operator") else text
+        if kind == "string" and previous != "AS":
+            params.append(text[1:-1].replace("''", "'"))
+            text = "?"
+        elif kind == "number" and previous in VALUE_CONTEXT:
+            params.append(float(text) if any(c in text for c in ".eE") else int(text))
+            text = "?"
+        elif kind == "word":
+            words.append(token)
+        parts.append(text)
+        previous = token
+    shape = "".join(parts).strip().rstrip(";").strip()
+    if not words or words[0] not in READ_ONLY_START:
+        raise ToolInputError("only a single SELECT (or WITH ... SELECT) query is allowed")
+    if ";" in shape or WRITE_KEYWORDS.intersection(words):
+        raise ToolInputError("the query must be one read-only SELECT statement")
+    return shape, tuple(params)
+
+
+def _clean_input(tool_input: str) -> str:
+    """SQL from the Action Input, tolerating code fences and surrounding quotes."""
+    text = tool_input.strip().strip("`").strip()
+    if text[:3].lower() == "sql":
+        text = text[3:].strip()
+    if len(text) > 1 and text[0] == text[-1] and text[0] == '"':
+        text = text[1:-1]
+    return text
+
+
+def resolve_engine(engine: str = "auto") -> str:
+    """"duckdb" when asked for (or on auto when installed), otherwise "sqlite"."""
+    if engine in ("auto", "duckdb"):
+        try:
+            import duckdb  # noqa: F401
+            return "duckdb"
+        except ImportError:
+            if engine == "duckdb":
+                raise ImportError("SQL_ENGINE=duckdb needs duckdb: pip install duckdb")
+    return "sqlite"
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Categories as plain values and float32 as the decimals they were parsed from."""
+    columns = {}
+    for column, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            columns[column] = df[column].astype(object)
+        elif dtype == "float32":
+            columns[column] = df[column].astype(str).astype("float64")
+    return df.assign(**columns) if columns else df
+
+
+@dataclass
+class QueryPlan:
+    """A cached query shape: whether it runs with parameters, and how often it was reused."""
+    parameterized: bool = True
+    hits: int = 0
+
+
+class SQLDatabase:
+    """One DataFrame in an in-memory DuckDB or SQLite database, queried read-only."""
+
+    def __init__(self, df: pd.DataFrame, engine: str = "auto", table: str = TABLE_NAME,
+                 plan_cache_size: int = PLAN_CACHE_SIZE):
+        self.engine = resolve_engine(engine)
+        self.table = table
+        self.rows = len(df)
+        self.plan_cache_size = plan_cache_size
+        self.plans = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._deadline = float("inf")
+        self._lock = threading.Lock()
+        start = time.perf_counter()
+        if self.engine == "duckdb":
+            import duckdb
+            self.errors = (duckdb.Error,)
+            self.connection = duckdb.connect(":memory:")
+            self.connection.register("source_frame", _sql_frame(df))
+            self.connection.execute(f"CREATE TABLE {_quote(table)} AS SELECT * FROM source_frame")
+            self.connection.unregister("source_frame")
+            self._schema = self._describe(
+                "SELECT column_name, data_type FROM information_schema.columns "
+                "WHERE table_name = ? ORDER BY ordinal_position")
+            self.connection.execute("SET enable_external_access = false")
+        else:
+            self.errors = (sqlite3.Error,)
+            # The statement cache holds the prepared statement of every cached shape
+            self.connection = sqlite3.connect(":memory:", check_same_thread=False,
+                                              cached_statements=plan_cache_size)
+            _sql_frame(df).to_sql(table, self.connection, index=False)
+            self._schema = self._describe("SELECT name, type FROM pragma_table_info(?)")
+            self.connection.execute("PRAGMA query_only = ON")
+            self.connection.set_authorizer(
+                lambda action, *_: sqlite3.SQLITE_OK if action in SQLITE_READ_ACTIONS else sqlite3.SQLITE_DENY)
+            self.connection.set_progress_handler(lambda: time.monotonic() > self._deadline, 10_000)
+        print(f"🗃️ SQL table {table} ready in {self.engine} ({self.rows} rows, "
+              f"{(time.perf_counter() - start) * 1000:.0f} ms)")
+
+    def _describe(self, columns_query: str) -> str:
+        """Schema text for sql_schema: types, null counts and the values of low-cardinality columns."""
+        columns = self.connection.execute(columns_query, (self.table,)).fetchall()
+        counts = ", ".join(f"COUNT({_quote(name)}), COUNT(DISTINCT {_quote(name)})" for name, _ in columns)
+        totals = self.connection.execute(f"SELECT {counts} FROM {_quote(self.table)}").fetchone()
+        lines = [f"Table {self.table} ({self.rows} rows):"]
+        for i, (name, sql_type) in enumerate(columns):
+            non_null, distinct = totals[2 * i], totals[2 * i + 1]
+            line = f"- {name} {sql_type}"
+            if non_null < self.rows:
+                line += f", {self.rows - non_null} nulls"
+            if 0 < distinct <= SCHEMA_VALUES:
+                values = self.connection.execute(
+                    f"SELECT DISTINCT {_quote(name)} FROM {_quote(self.table)} "
+                    f"WHERE {_quote(name)} IS NOT NULL ORDER BY 1").fetchall()
+                line += ", values: " + ", ".join(repr(value) for value, in values)
+            lines.append(line)
+        return "\n".join(lines)
+
+    def schema(self) -> str:
+        return self._schema
+
+    def dialect(self) -> str:
+        return "DuckDB" if self.engine == "duckdb" else "SQLite"
+
+    def _fetch(self, sql: str, params: tuple) -> pd.DataFrame:
+        self._deadline = time.monotonic() + QUERY_TIMEOUT
+        try:
+            cursor = self.connection.execute(sql, params)
+            columns = [description[0] for description in cursor.description]
+            return pd.DataFrame(cursor.fetchmany(MAX_RESULT_ROWS + 1), columns=columns)
+        except sqlite3.OperationalError as e:
+            if str(e) == "interrupted":
+                raise ToolInputError(f"the query ran longer than {QUERY_TIMEOUT:g} s; aggregate or add a LIMIT")
+            raise
+        finally:
+            self._deadline = float("inf")
+
+    def execute(self, sql: str) -> pd.DataFrame:
+        """Result of one read-only query (at most MAX_RESULT_ROWS + 1 rows), through the plan cache."""
+        shape, params = query_shape(sql)
+        with self._lock:
+            plan = self.plans.get(shape)
+            if plan is not None:
+                self.hits += 1
+                plan.hits += 1
+                self.plans.move_to_end(shape)
+                return self._fetch(shape, params) if plan.parameterized else self._fetch(sql, ())
+            self.misses += 1
+            try:
+                result, plan = self._fetch(shape, params), QueryPlan()
+            except self.errors:
+                # Literals in place; a query that fails this way too is not cached
+                result, plan = self._fetch(sql, ()), QueryPlan(parameterized=False)
+            self.plans[shape] = plan
+            if len(self.plans) > self.plan_cache_size:
+                self.plans.popitem(last=False)
+            return result
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "engine": self.engine,
+            "plans": len(self.plans),
+            "plan_hits": self.hits,
+            "plan_misses": self.misses,
+            "plan_hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+# The database of each loaded DataFrame; dropped when the frame is
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def database_for(df: pd.DataFrame, engine: str = "auto") -> SQLDatabase:
+    """The embedded database holding `df`, built on first use."""
+    key = id(df)
+    with _databases_lock:
+        database = _databases.get(key)
+        if database is None:
+            database = _databases[key] = SQLDatabase(df, engine)
+            weakref.finalize(df, _databases.pop, key, None)
+    return database
+
+
+def existing_database(df) -> Union[SQLDatabase, None]:
+    return _databases.get(id(df))
+
+
+def sql_query(database: SQLDatabase, tool_input: str) -> str:
+    result = database.execute(_clean_input(tool_input))
+    if len(result) > MAX_RESULT_ROWS:
+        return (f"{_format(result.head(MAX_RESULT_ROWS))}\n... (more than {MAX_RESULT_ROWS} rows, "
+                f"showing {MAX_RESULT_ROWS}; aggregate or add a LIMIT)")
+    return _format(result) if len(result) else "(no rows)"
+
+
+# name -> (function, description with an example input)
+SQL_TOOLS = {
+    "sql_query": (
+        sql_query,
+        f"Run one read-only SQL SELECT on the table and return the result (at most {MAX_RESULT_ROWS} rows). "
+        "Example: SELECT sex, AVG(survived) AS survival_rate FROM titanic GROUP BY sex",
+    ),
+    "sql_schema": (
+        lambda database, _: database.schema(),
+        "Column names and SQL types of the table, with null counts and the values of low-cardinality columns. "
+        "Input is ignored.",
+    ),
+}
+
+
+def run_sql_tool(database: SQLDatabase, name: str, tool_input: str) -> str:
+    """Run one SQL tool; errors are returned as text the agent can act on."""
+    function, _ = SQL_TOOLS[name]
+    try:
+        return function(database, tool_input)
+    except ToolInputError as e:
+        return f"Error: {e}"
+    except database.errors as e:
+        return f"Error: {e}"
+
+
+def build_sql_tools(database: SQLDatabase) -> list:
+    """Single-input LangChain tools (SQL in, text out) for a ReAct agent."""
+    from langchain_core.tools import Tool
+
+    return [
+        Tool(name=name, func=lambda tool_input, name=name: run_sql_tool(database, name, tool_input),
+             description=_escape_template(description))
+        for name, (_, description) in SQL_TOOLS.items()
+    ]
+
+
+def sql_prompt_hint(database: SQLDatabase) -> str:
+    """Usage notes for the agent prefix."""
+    return _escape_template(
+        f"Answer with sql_query: one {database.dialect()} SELECT per call on the table {database.table}, "
+        "computing the final numbers in SQL. Booleans are stored as 0/1; sql_schema lists column values."
+    )
@@ -0,0 +1,79 @@
+"""
+Startup profiling report for the backend.
+
+Imports main.py in a fresh interpreter with ``python -X importtime`` and
+breaks the import time down by top-level package, then prints the startup
+phase timings main.py records itself (dataset load, statistics, agent).
+
+    python startup_profile.py                       # default AGENT_STARTUP
+    AGENT_STARTUP=eager python startup_profile.py   # include agent construction
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+PHASES_MARKER = "STARTUP_TIMINGS="
+
+
+def parse_importtime(output: str) -> list:
+    """Parse ``-X importtime`` output into (module, depth, self_us, cumulative_us) rows."""
+    rows = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, len(indent) // 2, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def by_package(rows: list, root: str = "main") -> list:
+    """
+    Sum the cumulative time of each import made while loading ``root``,
+    grouped by top-level package. Returns (package, seconds) sorted slowest first.
+    """
+    totals = defaultdict(int)
+    root_depth = next((depth for module, depth, _, _ in rows if module == root), 0)
+    for module, depth, self_us, cumulative_us in rows:
+        if module == root:
+            totals[root] += self_us
+        elif depth == root_depth + 1:
+            totals[module.split(".")[0]] += cumulative_us
+    return sorted(((pkg, us / 1e6) for pkg, us in totals.items()), key=lambda item: -item[1])
+
+
+def profile_startup(module: str = "main") -> dict:
+    """Import a module in a subprocess and collect import and phase timings."""
+    env = dict(os.environ)
+    code = f"import json, {module}; print({PHASES_MARKER!r} + json.dumps(getattr({module}, 'startup_timings', {{}})))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "import failed")
+    rows = parse_importtime(result.stderr)
+    phases = {}
+    for line in result.stdout.splitlines():
+        if line.startswith(PHASES_MARKER):
+            phases = json.loads(line[len(PHASES_MARKER):])
+    total = next((cumulative / 1e6 for name, _, _, cumulative in rows if name == module), 0.0)
+    return {"total": total, "packages": by_package(rows, module), "phases": phases}
+
+
+if __name__ == "__main__":
+    report = profile_startup()
+    print(f"⏱️ import main: {report['total'] * 1000:.0f} ms (AGENT_STARTUP={os.getenv('AGENT_STARTUP', 'background')})\n")
+    print(f"{'package':<28} {'ms':>9} {'share':>7}")
+    for package, seconds in report["packages"][:20]:
+        share = seconds / report["total"] * 100 if report["total"] else 0
+        print(f"{package:<28} {seconds * 1000:>9.1f} {share:>6.1f}%")
+    if report["phases"]:
+        print(f"\n{'phase':<28} {'ms':>9}")
+        for phase, seconds in report["phases"].items():
+            print(f"{phase:<28} {seconds * 1000:>9.1f}")
@@ -0,0 +1,264 @@
+"""
+Precomputed statistics index for the Titanic DataFrame.
+
+Built once when the dataset is loaded so endpoints and the visualization
+generator can serve counts, means, quantiles and survival rates without
+recomputing them on every request. Rebuilding after a reload only
+recomputes the columns whose contents changed. Out-of-core datasets
+(chunked_dataset.ChunkedDataset) are profiled in streaming passes instead.
+"""
+from itertools import combinations
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+CATEGORICAL_COLUMNS = ["sex", "pclass", "embarked", "who", "deck", "alone"]
+TARGET_COLUMN = "survived"
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+HISTOGRAM_BINS = "fd"  # Freedman–Diaconis; any numpy bin strategy name or a fixed count
+MAX_HISTOGRAM_BINS = 200
+
+
+def _to_builtin(value):
+    """Convert numpy/pandas scalars (and NaN) into JSON-friendly Python values."""
+    if isinstance(value, dict):
+        return {_to_builtin(k): _to_builtin(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_builtin(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def parse_bins(value) -> object:
+    """Accept a bin count ("30") or a numpy strategy name ("fd", "sturges", "auto")."""
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return value
+
+
+def histogram_payload(values, bins=HISTOGRAM_BINS) -> dict:
+    """
+    Bin values server-side and return compact {"edges", "counts"} lists,
+    so clients never receive one entry per row.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return {"edges": [], "counts": []}
+    edges = np.histogram_bin_edges(values, bins=bins)
+    if len(edges) - 1 > MAX_HISTOGRAM_BINS:
+        edges = np.histogram_bin_edges(values, bins=MAX_HISTOGRAM_BINS)
+    counts, edges = np.histogram(values, bins=edges)
+    return {"edges": np.round(edges, 4).tolist(), "counts": counts.tolist()}
+
+
+def bin_edges_from_summary(count: int, low: float, high: float, bins=HISTOGRAM_BINS,
+                           iqr: float = 0.0, std: float = 0.0) -> np.ndarray:
+    """
+    numpy's bin edges for a strategy name or count, from summary statistics
+    instead of the values (for data that is only ever seen in chunks).
+    Unsupported strategies fall back to Sturges.
+    """
+    if high <= low:
+        return np.array([low - 0.5, high + 0.5])
+    if not isinstance(bins, str):
+        return np.linspace(low, high, min(int(bins), MAX_HISTOGRAM_BINS) + 1)
+    span = high - low
+    sturges = span / (np.log2(count) + 1.0)
+    widths = {
+        "fd": 2.0 * iqr * count ** (-1 / 3),
+        "scott": (24.0 * np.pi ** 0.5 / count) ** (1 / 3) * std,
+        "rice": span / (2.0 * count ** (1 / 3)),
+        "sqrt": span / np.sqrt(count),
+        "sturges": sturges,
+    }
+    width = widths.get(bins, sturges)
+    if bins == "auto":
+        width = min(widths["fd"], sturges) if widths["fd"] else sturges
+    count_bins = int(np.ceil(span / width)) if width else 1
+    return np.linspace(low, high, min(count_bins, MAX_HISTOGRAM_BINS) + 1)
+
+
+def _fingerprint(series: pd.Series) -> int:
+    """Cheap content hash used to detect which columns changed on reload."""
+    return int(pd.util.hash_pandas_object(series, index=False).sum()) ^ len(series)
+
+
+class StatsIndex:
+    """Per-column statistics and pairwise survival rates for a DataFrame."""
+
+    def __init__(self, categorical_columns=None, target: str = TARGET_COLUMN, bins=HISTOGRAM_BINS):
+        self.categorical_columns = categorical_columns or CATEGORICAL_COLUMNS
+        self.target = target
+        self.bins = bins
+        self.rows = 0
+        self.columns = {}
+        self.survival_rates = {}
+        self._fingerprints = {}
+
+    def build(self, df: pd.DataFrame) -> list:
+        """
+        Build or incrementally refresh the index from df.
+        Returns the list of columns whose statistics were recomputed.
+        """
+        if not isinstance(df, pd.DataFrame):
+            return self._build_chunked(df)
+        self.rows = len(df)
+        fingerprints = {column: _fingerprint(df[column]) for column in df.columns}
+        changed = [c for c in df.columns if self._fingerprints.get(c) != fingerprints[c]]
+
+        for column in list(self.columns):
+            if column not in df.columns:
+                del self.columns[column]
+        for column in changed:
+            self.columns[column] = self._column_stats(df[column])
+
+        self._build_survival_rates(df, changed)
+        self._fingerprints = fingerprints
+        return changed
+
+    def _column_stats(self, series: pd.Series) -> dict:
+        """Counts, nulls and either value counts or numeric summaries for one column."""
+        stats = {
+            "dtype": str(series.dtype),
+            "count": int(series.count()),
+            "nulls": int(series.isna().sum()),
+            "unique": int(series.nunique()),
+        }
+        is_numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        if series.name in self.categorical_columns or series.name == self.target or not is_numeric:
+            stats["value_counts"] = _to_builtin(series.value_counts().to_dict())
+        if is_numeric:
+            values = series.dropna().to_numpy(dtype=float)
+            if len(values):
+                stats.update({
+                    "mean": float(values.mean()),
+                    "std": float(values.std(ddof=1)) if len(values) > 1 else 0.0,
+                    "min": float(values.min()),
+                    "max": float(values.max()),
+                    "quantiles": {str(q): float(v) for q, v in zip(QUANTILES, np.quantile(values, QUANTILES))},
+                    "histogram": histogram_payload(values, self.bins),
+                })
+        return stats
+
+    def _build_survival_rates(self, df: pd.DataFrame, changed: list):
+        """Survival rate for every categorical column and every pair of them."""
+        if self.target not in df.columns:
+            self.survival_rates = {}
+            return
+        columns = [c for c in self.categorical_columns if c in df.columns]
+        keys = [(c,) for c in columns] + list(combinations(columns, 2))
+        target_changed = self.target in changed
+        rates = {}
+        for key in keys:
+            name = "|".join(key)
+            if name in self.survival_rates and not target_changed and not any(c in changed for c in key):
+                rates[name] = self.survival_rates[name]
+                continue
+            grouped = df.groupby(list(key), observed=True)[self.target].agg(["mean", "sum", "count"]).reset_index()
+            rates[name] = [
+                _to_builtin({
+                    **{column: row[column] for column in key},
+                    "survival_rate": row["mean"] * 100,
+                    "survived": row["sum"],
+                    "count": row["count"],
+                })
+                for _, row in grouped.iterrows()
+            ]
+        self.survival_rates = rates
+
+    def _build_chunked(self, data) -> list:
+        """
+        Profile an out-of-core dataset. One pass counts passengers and
+        survivors per combination of the categorical columns, from which
+        their value counts and every survival rate are derived; numeric
+        columns come from ChunkedDataset.numeric_summary. Without per-column
+        fingerprints every rebuild recomputes everything.
+        """
+        from chunked_dataset import GroupMoments, ValueCounts
+
+        self.rows = len(data)
+        numeric = data.numeric_columns()
+        categorical = [c for c in self.categorical_columns if c in data.columns]
+        target = self.target if self.target in data.columns else None
+        combinations_table = GroupMoments(categorical, target, dropna=False)
+        counters = {c: ValueCounts([c], dropna=False) for c in data.columns
+                    if c not in categorical and (c == self.target or c not in numeric)}
+        data.run([combinations_table] + list(counters.values()))
+        table = combinations_table.result()
+        summaries = data.numeric_summary(numeric, self.bins)
+
+        value_counts = {c: counter.result() for c, counter in counters.items()}
+        for column in categorical:
+            value_counts[column] = table.groupby(level=column, dropna=False)["size"].sum()
+        dtypes = data.dtypes
+        self.columns = {}
+        for column in data.columns:
+            stats = {"dtype": str(dtypes[column])}
+            counts = value_counts.get(column)
+            if counts is not None:
+                nulls = int(counts[counts.index.isna()].sum())
+                counts = counts[counts.index.notna() & (counts > 0)].sort_values(ascending=False, kind="stable")
+                stats.update({"count": self.rows - nulls, "nulls": nulls, "unique": len(counts),
+                              "value_counts": _to_builtin(counts.to_dict())})
+            summary = summaries.get(column)
+            if summary is not None:
+                stats.setdefault("count", summary["count"])
+                stats.setdefault("nulls", self.rows - summary["count"])
+                stats.setdefault("unique", summary["unique"])
+                stats.update({
+                    "mean": summary["mean"],
+                    "std": summary["std"] if summary["count"] > 1 else 0.0,
+                    "min": summary["min"],
+                    "max": summary["max"],
+                    "quantiles": {str(q): v for q, v in summary["quantiles"].items()},
+                    "histogram": summary["histogram"],
+                })
+            elif counts is None:
+                stats.update({"count": 0, "nulls": self.rows, "unique": 0})
+            self.columns[column] = stats
+
+        self.survival_rates = {}
+        if target is not None:
+            for key in [(c,) for c in categorical] + list(combinations(categorical, 2)):
+                grouped = table.groupby(level=list(key))[["sum", "count"]].sum()
+                grouped = grouped[grouped["count"] > 0]
+                self.survival_rates["|".join(key)] = [
+                    _to_builtin({
+                        **dict(zip(key, values if isinstance(values, tuple) else (values,))),
+                        "survival_rate": row["sum"] / row["count"] * 100,
+                        "survived": int(row["sum"]),
+                        "count": int(row["count"]),
+                    })
+                    for values, row in grouped.iterrows()
+                ]
+        self._fingerprints = {}
+        return list(self.columns)
+
+    def column(self, name: str) -> Optional[dict]:
+        """Statistics for a single column, or None if it is not indexed."""
+        return self.columns.get(name)
+
+    def value_counts(self, name: str) -> dict:
+        """Cached value counts for a categorical column."""
+        return (self.columns.get(name) or {}).get("value_counts", {})
+
+    def survival_rate(self, *columns: str) -> Optional[list]:
+        """Survival rate records grouped by one or two categorical columns."""
+        for key in (columns, tuple(reversed(columns))):
+            name = "|".join(key)
+            if name in self.survival_rates:
+                return self.survival_rates[name]
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "columns": self.columns,
+            "survival_rates": self.survival_rates,
+        }
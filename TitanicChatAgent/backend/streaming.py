@@ -0,0 +1,101 @@
+"""
+Server-Sent Events helpers for streaming agent progress to the client.
+
+StreamingAnswerHandler is a LangChain callback handler that turns agent
+actions, tool results and final-answer tokens into events on an asyncio
+queue, which the /query/stream endpoint relays as SSE messages. Answer
+tokens go through the same cleanup as the final answer before they are
+sent, so the client never shows text the "done" event would take back.
+"""
+import asyncio
+import json
+import re
+from typing import Any, AsyncIterator, Callable, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+OBSERVATION_PREVIEW_CHARS = 300
+# The last characters of the cleaned answer are held back until more text
+# arrives; longer than any phrase the cleanup removes, so a phrase split
+# across tokens is never sent half-way
+CLEANUP_HOLDBACK_CHARS = 32
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def split_tokens(text: str) -> list:
+    """Split an answer into word-sized chunks, keeping whitespace attached."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class StreamingAnswerHandler(AsyncCallbackHandler):
+    """
+    Collects agent steps and final-answer tokens as (event, data) pairs.
+    `clean` maps the raw answer so far to the text the client may see, or
+    None if the whole answer will be replaced; nothing more is sent then.
+    """
+
+    def __init__(self, clean: Optional[Callable[[str], Optional[str]]] = None):
+        self.queue = asyncio.Queue()
+        self.clean = clean or str.strip
+        self.streamed_text = ""  # Cleaned answer text sent so far
+        self._buffer = ""
+        self._answer = ""  # Raw final-answer text of the current LLM call
+        self._in_final_answer = False
+        self._suppressed = False
+
+    @property
+    def streamed_answer(self) -> bool:
+        return bool(self.streamed_text)
+
+    async def on_llm_start(self, serialized, prompts, **kwargs: Any) -> None:
+        self._buffer = ""
+        self._answer = ""
+        self._in_final_answer = False
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs: Any) -> None:
+        await self.on_llm_start(serialized, [], **kwargs)
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        """Forward cleaned text once the ReAct output reaches its "Final Answer:" section."""
+        if not self._in_final_answer:
+            self._buffer += token
+            if FINAL_ANSWER_MARKER not in self._buffer:
+                return
+            self._in_final_answer = True
+            token = self._buffer.split(FINAL_ANSWER_MARKER, 1)[1]
+        self._answer += token
+        if self._suppressed:
+            return
+        cleaned = self.clean(self._answer)
+        if cleaned is None:
+            self._suppressed = True
+            return
+        stable = cleaned[:max(0, len(cleaned) - CLEANUP_HOLDBACK_CHARS)]
+        if len(stable) > len(self.streamed_text) and stable.startswith(self.streamed_text):
+            chunk, self.streamed_text = stable[len(self.streamed_text):], stable
+            await self.queue.put(("token", {"text": chunk}))
+
+    async def on_agent_action(self, action, **kwargs: Any) -> None:
+        await self.queue.put(("step", {"tool": action.tool, "input": str(action.tool_input)}))
+
+    async def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        await self.queue.put(("observation", {"output": str(output)[:OBSERVATION_PREVIEW_CHARS]}))
+
+    async def events(self, task: "asyncio.Task") -> AsyncIterator[tuple]:
+        """Yield queued events until the agent task finishes and the queue drains."""
+        while True:
+            getter = asyncio.ensure_future(self.queue.get())
+            done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+                continue
+            getter.cancel()
+            while not self.queue.empty():
+                yield self.queue.get_nowait()
+            return
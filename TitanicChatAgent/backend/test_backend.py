@@ -29,11 +29,764 @@ def test_dataset():
         df = pd.read_csv("../data/titanic.csv")
         print(f"✅ Dataset loaded: {len(df)} passengers")
         print(f"✅ Columns: {df.columns.tolist()[:5]}...")
+        from dataset_loader import compact_dtypes
+        compact = compact_dtypes(df)
+        # Compact dtypes must not change values the API shows
+        assert compact["fare"].iloc[1] == 71.2833 and compact["age"].min() == 0.42
+        assert compact["pclass"].dtype == "int8"
         return True
     except Exception as e:
         print(f"❌ Dataset load failed: {e}")
         return False
 
+def test_fast_path():
+    """Test that common questions are answered without the LLM"""
+    print("\nTesting fast-path query engine...")
+    try:
+        import pandas as pd
+        from query_engine import answer_question
+        df = pd.read_csv("../data/titanic.csv")
+        answer = answer_question("What was the overall survival rate?", df)
+        assert answer is not None and "38.38%" in answer
+        assert answer_question("Were families more likely to survive?", df) is None
+        # A share "of survivors" is taken of the survivors, not of every passenger
+        assert "68.13% (233 of 342)" in answer_question("What share of survivors were women?", df)
+        assert answer_question("What percentage of female survivors?", df) is None
+        assert "**First Class** had the most passengers" in answer_question("Which class had the most survivors?", df)
+        print("✅ Fast path answers supported questions and defers the rest")
+        return True
+    except Exception as e:
+        print(f"❌ Fast path failed: {e}")
+        return False
+
+def test_stats_index():
+    """Test that rebuilding the statistics index only recomputes the columns that changed"""
+    print("\nTesting statistics index...")
+    try:
+        import pandas as pd
+        from stats_index import StatsIndex
+        df = pd.read_csv("../data/titanic.csv")
+        index = StatsIndex()
+        assert index.build(df) == df.columns.tolist()
+        assert index.build(df.copy()) == []
+        sex_rates, age_stats = index.survival_rates["sex"], index.column("age")
+        doubled = df.assign(fare=df["fare"] * 2)
+        assert index.build(doubled) == ["fare"]
+        assert index.column("fare")["max"] == df["fare"].max() * 2
+        assert index.column("age") is age_stats and index.survival_rates["sex"] is sex_rates
+        assert index.build(doubled.assign(survived=0)) == ["survived"]
+        assert index.survival_rates["sex"] is not sex_rates
+        print("✅ Rebuilds recompute only the changed columns")
+        return True
+    except Exception as e:
+        print(f"❌ Statistics index failed: {e}")
+        return False
+
+def test_histograms():
+    """Test that histograms are binned server-side and capped at MAX_HISTOGRAM_BINS"""
+    print("\nTesting histogram binning...")
+    try:
+        import numpy as np
+        from stats_index import MAX_HISTOGRAM_BINS, bin_edges_from_summary, histogram_payload
+        # One far outlier makes Freedman–Diaconis ask for ~100,000 bins
+        values = np.append(np.linspace(0, 1, 1000), [1e4, np.nan])
+        for bins in ("fd", 5000):
+            payload = histogram_payload(values, bins)
+            assert len(payload["counts"]) == MAX_HISTOGRAM_BINS and len(payload["edges"]) == MAX_HISTOGRAM_BINS + 1
+            assert sum(payload["counts"]) == 1001 and payload["edges"][-1] == 1e4
+        assert len(histogram_payload(values, 10)["counts"]) == 10
+        assert histogram_payload([np.nan]) == {"edges": [], "counts": []}
+        assert len(bin_edges_from_summary(1001, 0, 1e4, "fd", iqr=0.5)) == MAX_HISTOGRAM_BINS + 1
+        print(f"✅ Histograms stay within {MAX_HISTOGRAM_BINS} bins")
+        return True
+    except Exception as e:
+        print(f"❌ Histogram binning failed: {e}")
+        return False
+
+def test_dataset_registry():
+    """Test that registered datasets load on first use and the least recently used is evicted"""
+    print("\nTesting dataset registry...")
+    try:
+        import tempfile
+        import pandas as pd
+        from dataset_registry import DatasetRegistry
+        df = pd.read_csv("../data/titanic.csv")
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ("pinned", "a", "b", "c"):
+                df.to_csv(os.path.join(tmp, f"{name}.csv"), index=False)
+            probe = DatasetRegistry(agent_factory=object)
+            probe.register("a", os.path.join(tmp, "a.csv"))
+            size = probe.get("a").memory_bytes
+            # Room for the pinned table and two more
+            registry = DatasetRegistry(agent_factory=len, memory_budget_bytes=size * 3 + size // 2)
+            registry.register("pinned", os.path.join(tmp, "pinned.csv"), pinned=True)
+            assert sorted(registry.discover(tmp)) == ["a", "b", "c"]
+            assert not registry.is_loaded("a")
+            for dataset_id in ("pinned", "a", "b", "a", "c"):
+                registry.get(dataset_id)
+            assert [registry.is_loaded(i) for i in ("pinned", "a", "b", "c")] == [True, True, False, True]
+            assert registry.evictions == 1 and registry.loaded_bytes() <= registry.memory_budget_bytes
+            assert registry.get("b").loaded and not registry.is_loaded("a")
+            # A leased dataset stays loaded until released; an evicted one reloads for its agent
+            leased = registry.acquire("b")
+            registry.get("a")
+            assert leased.loaded and not registry.is_loaded("c")
+            registry.release(leased)
+            registry.get("c")
+            assert not leased.loaded and registry.get_agent(leased) == len(df) and leased.loaded
+        print("✅ Datasets load lazily and the least recently used one is evicted")
+        return True
+    except Exception as e:
+        print(f"❌ Dataset registry failed: {e}")
+        return False
+
+def test_sessions():
+    """Test that follow-ups refine the previous question from the session's cached subset"""
+    print("\nTesting conversation sessions...")
+    try:
+        import pandas as pd
+        from query_engine import execute_query
+        from sessions import SessionStore
+        df = pd.read_csv("../data/titanic.csv")
+        session = SessionStore(max_turns=3).get("demo", "titanic")
+        session.record("What was the survival rate by class?", "📊 **Survival Rate by Class**")
+        answers = []
+        for follow_up in ["and for first class only?", "what about women?"]:
+            assert session.is_follow_up(follow_up)
+            parsed = session.refine(follow_up)
+            answers.append(execute_query(parsed, df, session.subset_for(df, parsed.filters, "v1")))
+            session.record(follow_up, answers[-1], parsed)
+        assert "62.96%" in answers[0] and "96.81%" in answers[1]
+        assert session.refined == 1  # Women were filtered from the cached first-class rows
+        session.record("Why?", "x" * 1000)
+        assert len(session.turns) == 3 and len(session.context(300)) <= 300
+        print("✅ Follow-ups reuse cached subsets and history stays bounded")
+        return True
+    except Exception as e:
+        print(f"❌ Sessions failed: {e}")
+        return False
+
+def test_session_follow_ups():
+    """Test that off-topic follow-ups are refused and session answers keep their chart"""
+    print("\nTesting session follow-ups...")
+    try:
+        from fastapi.testclient import TestClient
+        import main
+        client = TestClient(main.app)
+        
+        def ask(question, session_id=None):
+            return client.post("/query", json={"question": question, "session_id": session_id}).json()
+        
+        assert ask("Show me a chart of survival rate by class", "guarded")["source"] == "fast_path"
+        follow_up = ask("and for women?", "guarded")
+        assert follow_up["source"] == "session"
+        assert follow_up["visualization"]["data"] == {"Survived": 233, "Did Not Survive": 81}
+        assert ask("what about the weather?", "guarded")["source"] == "guard"
+        assert ask("what about the weather?")["source"] == "guard"
+        print("✅ Off-topic follow-ups hit the guard and session answers are charted")
+        return True
+    except Exception as e:
+        print(f"❌ Session follow-ups failed: {e}")
+        return False
+
+def test_answer_cache():
+    """Test LRU eviction, TTL expiry and reloading the answer cache from its JSON-lines file"""
+    print("\nTesting answer cache...")
+    try:
+        import tempfile
+        from answer_cache import AnswerCache
+        now = [1000.0]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "answers.json")
+            cache = AnswerCache(max_size=2, ttl_seconds=60, path=path, clock=lambda: now[0])
+            cache.set("How many men?", {"answer": "577"})
+            cache.set("How many women?", {"answer": "314"})
+            assert cache.get("Male count?") == {"answer": "577"}  # Women are now least recently used
+            cache.set("Average fare?", {"answer": "32.20"})
+            assert cache.get("How many women?") is None and cache.evictions == 1
+            assert cache.get("How many men?") and cache.get("Average fare?")
+            with open(path, encoding="utf-8") as f:
+                assert len(f.readlines()) == 3  # One appended line per set(), no rewrites
+            for _ in range(2):
+                cache.set("Average fare?", {"answer": "32.20"})
+            with open(path, encoding="utf-8") as f:
+                assert len(f.readlines()) == 2  # Compacted once it reached twice max_size
+            reloaded = AnswerCache(max_size=2, ttl_seconds=60, path=path, clock=lambda: now[0])
+            assert reloaded.get("How many men?") == {"answer": "577"} and reloaded.get("How many women?") is None
+            now[0] += 61
+            assert cache.get("How many men?") is None and cache.get_stale("How many men?") == {"answer": "577"}
+            assert AnswerCache(max_size=2, ttl_seconds=60, path=path, clock=lambda: now[0]).stats()["size"] == 0
+        print("✅ Least recently used and expired answers drop out, the rest survive a restart")
+        return True
+    except Exception as e:
+        print(f"❌ Answer cache failed: {e}")
+        return False
+
+def test_shared_stores():
+    """Test that worker processes sharing SQLite files see each other's answers and sessions"""
+    print("\nTesting shared worker stores...")
+    try:
+        import tempfile
+        from answer_cache import open_answer_cache
+        from sessions import SessionStore
+        # Open SQLite handles keep the files locked on Windows
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmp:
+            cache_path, session_path = os.path.join(tmp, "answers.sqlite"), os.path.join(tmp, "sessions.sqlite")
+            open_answer_cache(cache_path).set("How many men?", {"answer": "577"})
+            assert open_answer_cache(cache_path).get("Male count?") == {"answer": "577"}
+            worker_a, worker_b = SessionStore(path=session_path), SessionStore(path=session_path)
+            session = worker_a.get("chat", "titanic")
+            session.record("What was the survival rate by class?", "📊 **Survival Rate by Class**")
+            worker_a.save(session)
+            assert worker_b.get("chat", "titanic").refine("and for women?") is not None
+        print("✅ Answers and session turns are shared between workers")
+        return True
+    except Exception as e:
+        print(f"❌ Shared stores failed: {e}")
+        return False
+
+def test_pandas_tools():
+    """Test that the agent's typed pandas tools validate input and compute results"""
+    print("\nTesting typed pandas tools...")
+    try:
+        import pandas as pd
+        from pandas_tools import run_tool
+        df = pd.read_csv("../data/titanic.csv")
+        rates = run_tool(df, "group_by_aggregate", '{"group_by": "sex", "column": "survived", "agg": "mean"}')
+        assert "0.742" in rates and "0.1889" in rates
+        count = run_tool(df, "filter_count", {"filters": [{"column": "age", "op": "<", "value": 12},
+                                                          {"column": "survived", "op": "==", "value": 1}]})
+        assert count.startswith("39 of 891")
+        assert run_tool(df, "describe_column", '{"column": "cabin"}').startswith("Error: Unknown column")
+        assert run_tool(df, "top_n", "not json").startswith("Error:")
+        print("✅ Typed tools answer in one vectorized call")
+        return True
+    except Exception as e:
+        print(f"❌ Typed tools failed: {e}")
+        return False
+
+def test_sql_engine():
+    """Test that the SQL tools answer read-only queries and reuse cached query shapes"""
+    print("\nTesting SQL tools...")
+    try:
+        import pandas as pd
+        from sql_engine import SQLDatabase, query_shape, run_sql_tool
+        database = SQLDatabase(pd.read_csv("../data/titanic.csv"), engine="sqlite")
+        assert query_shape("SELECT COUNT(*) FROM titanic WHERE age < 12 AND sex = 'female' ORDER BY 1") == \
+            ("SELECT COUNT(*) FROM titanic WHERE age < ? AND sex = ? ORDER BY 1", (12, "female"))
+        rates = run_sql_tool(database, "sql_query", "SELECT sex, AVG(survived) FROM titanic GROUP BY sex")
+        assert "0.742" in rates and "0.1889" in rates
+        for age in (12, 30):
+            run_sql_tool(database, "sql_query", f"SELECT COUNT(*) FROM titanic WHERE age < {age}")
+        assert database.stats()["plan_hits"] == 1
+        assert run_sql_tool(database, "sql_query", "DELETE FROM titanic").startswith("Error:")
+        assert run_sql_tool(database, "sql_query", "SELECT cabin FROM titanic").startswith("Error:")
+        assert "sex TEXT, values: 'female', 'male'" in run_sql_tool(database, "sql_schema", "")
+        print("✅ SQL tools answer and reuse prepared query shapes")
+        return True
+    except Exception as e:
+        print(f"❌ SQL tools failed: {e}")
+        return False
+
+def test_out_of_core():
+    """Test that a chunked Parquet dataset answers like the same data loaded in memory"""
+    print("\nTesting out-of-core dataset...")
+    try:
+        import tempfile
+        from dataset_loader import load_dataset
+        from generate_dataset import generate
+        from pandas_tools import run_tool
+        from query_engine import answer_question
+        from stats_index import StatsIndex
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "passengers.parquet")
+            generate(path, rows=2000, chunk_rows=500, jitter=False)
+            df, _ = load_dataset(path, compact=False)
+            chunked, report = load_dataset(path, out_of_core="true", chunk_rows=300)
+            assert report.format == "parquet-chunked" and len(chunked) == 2000
+            for question in ["What was the survival rate by gender?", "What is the median age of women?",
+                             "Who paid the highest fare?", "How many passengers were in each class?"]:
+                assert answer_question(question, chunked) == answer_question(question, df), question
+            tool_input = {"group_by": ["pclass"], "column": "fare", "agg": "median"}
+            assert run_tool(chunked, "group_by_aggregate", tool_input) == run_tool(df, "group_by_aggregate", tool_input)
+            in_memory, streamed = StatsIndex(), StatsIndex()
+            in_memory.build(df)
+            streamed.build(chunked)
+            assert streamed.survival_rates == in_memory.survival_rates
+            assert streamed.column("age")["histogram"] == in_memory.column("age")["histogram"]
+        print("✅ Chunked scans match the in-memory answers")
+        return True
+    except Exception as e:
+        print(f"❌ Out-of-core dataset failed: {e}")
+        return False
+
+def test_code_cache():
+    """Test that cached agent steps replay on the same data and are dropped when it changes"""
+    print("\nTesting code cache...")
+    try:
+        import pandas as pd
+        from code_cache import CodeCache, validate_expression
+        from dataset_loader import dataset_checksum
+        df = pd.read_csv("../data/titanic.csv")
+        cache = CodeCache()
+        steps = [("group_by_aggregate", '{"group_by": "sex", "column": "survived", "agg": "mean"}'),
+                 ("python_repl_ast", "df['age'].mean()")]
+        assert cache.set("survival sex", steps, "74.20% of women survived", df, dataset_checksum(df))
+        assert cache.get("survival sex", df, dataset_checksum(df)) == "74.20% of women survived"
+        assert not cache.set("unsafe", [("python_repl_ast", "__import__('os').remove('x')")], "x", df, dataset_checksum(df))
+        # File and network I/O is not on the allowlist, whatever the module
+        for code in ["df.to_csv('out.csv')", "np.save('/tmp/x', df.values)", "df.to_string('/tmp/x')",
+                     "df.to_markdown('/tmp/x')", "pd.read_table('/etc/passwd')", "np.fromfile('/etc/passwd')",
+                     "pd.read_html('http://example.com')", "df.eval('age * 2')", "df.__class__"]:
+            assert validate_expression(code, df.columns) is None, code
+        assert validate_expression("df.age.median()", df.columns) is not None
+        changed = df.assign(survived=0)
+        assert cache.get("survival sex", changed, dataset_checksum(changed)) is None
+        assert cache.stats()["size"] == 0
+        print("✅ Code cache replays safe steps and invalidates on data changes")
+        return True
+    except Exception as e:
+        print(f"❌ Code cache failed: {e}")
+        return False
+
+def test_answer_snapshot():
+    """Test that a saved answer snapshot loads only for the dataset it was computed on"""
+    print("\nTesting answer snapshot...")
+    try:
+        import tempfile
+        from answer_snapshot import AnswerSnapshot
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "answer_snapshot.json")
+            snapshot = AnswerSnapshot("checksum-a")
+            snapshot.add("What was the overall survival rate?", "**38.38%**", None, "fast_path")
+            snapshot.save(path)
+            loaded = AnswerSnapshot.load(path, "checksum-a")
+            assert loaded.get("what was the overall survival rate")["answer"] == "**38.38%**"
+            assert loaded.load_seconds < 0.1
+            assert AnswerSnapshot.load(path, "checksum-b") is None
+            assert AnswerSnapshot.load(os.path.join(tmp, "missing.json"), "checksum-a") is None
+        print("✅ Snapshot answers load for their own dataset only")
+        return True
+    except Exception as e:
+        print(f"❌ Answer snapshot failed: {e}")
+        return False
+
+def test_agent_runner():
+    """Test that a full agent queue answers 503 and slow agent calls time out"""
+    print("\nTesting agent runner...")
+    try:
+        import asyncio
+        from fastapi.testclient import TestClient
+        from agent_runner import AgentQueueFullError, AgentRunner
+        
+        class SlowAgent:
+            def __init__(self, delay):
+                self.delay = delay
+            
+            async def ainvoke(self, question, config=None):
+                await asyncio.sleep(self.delay)
+                return {"output": f"Final Answer: {question}"}
+        
+        async def ask_three(runner):
+            return await asyncio.gather(*(runner.run(SlowAgent(0.05), f"q{i}") for i in range(3)),
+                                        return_exceptions=True)
+        
+        # One call runs, one waits in the queue, the third is turned away
+        runner = AgentRunner(max_concurrency=1, max_queue=1, timeout=5)
+        results = asyncio.run(ask_three(runner))
+        assert [isinstance(result, AgentQueueFullError) for result in results] == [False, False, True], results
+        assert runner.stats()["rejected"] == 1
+        
+        runner = AgentRunner(timeout=0.05)
+        try:
+            asyncio.run(runner.run(SlowAgent(5), "q"))
+            raise AssertionError("expected the slow agent to time out")
+        except asyncio.TimeoutError:
+            pass
+        assert runner.stats()["timed_out"] == 1 and runner.stats()["running"] == 0
+        
+        import main
+        entry = main.default_dataset()
+        busy = AgentRunner(max_concurrency=1, max_queue=0)
+        busy.running = 1  # Its only slot is taken
+        saved = main.agent_runner, entry.agent
+        main.agent_runner, entry.agent = busy, SlowAgent(0)
+        try:
+            response = TestClient(main.app).post("/query", json={"question": "Were families more likely to survive?"})
+        finally:
+            main.agent_runner, entry.agent = saved
+        assert response.status_code == 503 and response.headers["Retry-After"] == "5", response.text
+        assert busy.rejected == 1
+        print("✅ Full queues are rejected with 503 and slow calls time out")
+        return True
+    except Exception as e:
+        print(f"❌ Agent runner failed: {e}")
+        return False
+
+def test_coalescing():
+    """Test that identical in-flight questions share one run that outlives a cancelled caller"""
+    print("\nTesting request coalescing...")
+    try:
+        import asyncio
+        from coalescing import SingleFlight
+        
+        async def ask_concurrently():
+            flights, runs = SingleFlight(), []
+            
+            async def run_agent():
+                runs.append(1)
+                await asyncio.sleep(0.05)
+                return "42"
+            
+            callers = [asyncio.ensure_future(flights.do("how many survived", run_agent)) for _ in range(5)]
+            await asyncio.sleep(0)
+            callers[0].cancel()  # The first caller disconnects
+            results = await asyncio.gather(*callers, return_exceptions=True)
+            return flights, runs, results
+        
+        flights, runs, results = asyncio.run(ask_concurrently())
+        assert len(runs) == 1 and flights.coalesced == 4 and flights.leaders == 1
+        assert isinstance(results[0], asyncio.CancelledError) and results[1:] == ["42"] * 4, results
+        assert flights.stats()["in_flight"] == 0
+        print("✅ 5 concurrent questions shared 1 run, which survived a cancelled caller")
+        return True
+    except Exception as e:
+        print(f"❌ Request coalescing failed: {e}")
+        return False
+
+def test_batch_queries():
+    """Test that a batch answers duplicate questions once and streams every index exactly once"""
+    print("\nTesting batch queries...")
+    try:
+        import asyncio
+        import json
+        from fastapi.testclient import TestClient
+        import main
+        
+        class CountingAgent:
+            def __init__(self):
+                self.questions = []
+            
+            async def ainvoke(self, question, config=None):
+                self.questions.append(question)
+                await asyncio.sleep(0.01)
+                return {"output": "Families with children survived more often."}
+        
+        questions = ["What was the overall survival rate?", "what was the overall survival rate",
+                     "Were families with children more likely to survive?",
+                     "Were families with children more likely to survive?",
+                     "How many passengers were in each class?"]
+        entry, agent = main.default_dataset(), CountingAgent()
+        saved = entry.agent
+        entry.agent = agent
+        try:
+            client = TestClient(main.app)
+            body = client.post("/query/batch", json={"questions": questions}).json()
+            streamed = client.post("/query/batch", json={"questions": questions, "stream": True})
+        finally:
+            entry.agent = saved
+        assert len(agent.questions) == 1 and body["summary"]["unique"] == 3
+        assert [item["duplicate_of"] for item in body["results"]] == [None, 0, None, 2, None]
+        assert body["results"][3]["answer"] == body["results"][2]["answer"]
+        lines = [json.loads(line) for line in streamed.text.splitlines()]
+        assert sorted(line["index"] for line in lines[:-1]) == list(range(len(questions)))
+        assert lines[-1]["summary"]["total"] == len(questions)
+        print("✅ Duplicates answered once and every question streamed once")
+        return True
+    except Exception as e:
+        print(f"❌ Batch queries failed: {e}")
+        return False
+
+def test_query_stream():
+    """Test that streamed answers are cleaned before they are sent and identical streams share one run"""
+    print("\nTesting streamed queries...")
+    try:
+        import asyncio
+        import json
+        from fastapi.testclient import TestClient
+        import main
+        from streaming import StreamingAnswerHandler
+        
+        class StreamingAgent:
+            def __init__(self):
+                self.calls = 0
+            
+            async def ainvoke(self, question, config=None):
+                self.calls += 1
+                text = ("Thought: I now know the final answer\nFinal Answer: The AgentExecutor shows that "
+                        "families with children survived more often than passengers travelling alone.")
+                for callback in config["callbacks"]:
+                    if isinstance(callback, StreamingAnswerHandler):
+                        await callback.on_llm_start({}, [])
+                        for token in text.split(" "):
+                            await callback.on_llm_new_token(token + " ")
+                await asyncio.sleep(0.05)
+                return {"output": text.split("Final Answer:", 1)[1]}
+        
+        def parse(body):
+            events = []
+            for message in body.strip().split("\n\n"):
+                event, data = message.split("\n", 1)
+                events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+            return events
+        
+        async def stream_twice(question):
+            async def collect():
+                return "".join([message async for message in main.stream_query_events(question)])
+            return await asyncio.gather(collect(), collect())
+        
+        entry, agent = main.default_dataset(), StreamingAgent()
+        saved = entry.agent
+        entry.agent = agent
+        try:
+            body = TestClient(main.app).post("/query/stream", json={"question": "Did travelling with family improve survival odds?"}).text
+            first_agent_calls = agent.calls
+            bodies = asyncio.run(stream_twice("Did travelling with family improve the odds?"))
+        finally:
+            entry.agent = saved
+        events = parse(body)
+        kinds = [event for event, _ in events]
+        assert kinds[-1] == "done" and set(kinds[:-1]) == {"token"} and len(kinds) > 5, kinds
+        tokens = "".join(data["text"] for _, data in events[:-1])
+        done = events[-1][1]
+        assert done["source"] == "agent" and "AgentExecutor" not in tokens and "AgentExecutor" not in done["answer"]
+        assert tokens == done["answer"] and done["answer"].startswith("The  shows that families"), (tokens, done)
+        assert first_agent_calls == 1 and agent.calls == 2
+        assert parse(bodies[0])[-1] == parse(bodies[1])[-1]
+        print("✅ Streamed tokens match the cleaned answer and identical streams share one run")
+        return True
+    except Exception as e:
+        print(f"❌ Streamed queries failed: {e}")
+        return False
+
+def test_agent_startup():
+    """Test that lazy startup defers the agent and background startup builds it without blocking requests"""
+    print("\nTesting agent startup modes...")
+    try:
+        import asyncio
+        import time
+        import main
+        entry = main.default_dataset()
+        if main.AGENT_STARTUP != "lazy" or entry.agent is not None:
+            print("⏭️ Skipped: run with AGENT_STARTUP=lazy")
+            return True
+        assert main.schedule_agent_warmup() is None
+        
+        def slow_factory(data):
+            time.sleep(0.5)
+            return "agent"
+        
+        async def warm_up():
+            task = main.schedule_agent_warmup()
+            await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            info = await main.get_dataset_info()
+            info_seconds = time.perf_counter() - start
+            return info, info_seconds, await task
+        
+        saved_factory = main.dataset_registry.agent_factory
+        main.AGENT_STARTUP, main.dataset_registry.agent_factory = "background", slow_factory
+        try:
+            info, info_seconds, agent = asyncio.run(warm_up())
+        finally:
+            main.AGENT_STARTUP, main.dataset_registry.agent_factory = "lazy", saved_factory
+            built, entry.agent = entry.agent, None
+        assert agent == "agent" and built == "agent"
+        assert info["total_passengers"] == 891 and info_seconds < 0.25, info_seconds
+        print(f"✅ Lazy startup defers the agent; background builds it while requests are served ({info_seconds * 1000:.1f} ms)")
+        return True
+    except Exception as e:
+        print(f"❌ Agent startup failed: {e}")
+        return False
+
+def test_llm_batching():
+    """Test that concurrent local LLM calls are grouped into batched backend requests"""
+    print("\nTesting local LLM batching...")
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+        from llm_providers import BatchingLLM, PromptBatcher
+        
+        class EchoBackend:
+            def __init__(self):
+                self.batch_sizes = []
+            
+            def complete(self, prompts, stop=None):
+                self.batch_sizes.append(len(prompts))
+                return [f"echo {prompt}\nObservation: ignored" for prompt in prompts]
+        
+        backend = EchoBackend()
+        llm = BatchingLLM(batcher=PromptBatcher(backend, max_batch=8, window=0.05))
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            answers = list(pool.map(lambda i: llm.invoke(f"q{i}", stop=["\nObservation:"]), range(8)))
+        assert answers == [f"echo q{i}" for i in range(8)]
+        assert sum(backend.batch_sizes) == 8 and len(backend.batch_sizes) < 8, backend.batch_sizes
+        print(f"✅ 8 concurrent calls sent as {len(backend.batch_sizes)} batched request(s)")
+        return True
+    except Exception as e:
+        print(f"❌ Local LLM batching failed: {e}")
+        return False
+
+def test_llm_scheduler():
+    """Test token budgeting, 429 retries and degrading once the daily budget is used"""
+    print("\nTesting LLM scheduler...")
+    try:
+        import asyncio
+        from llm_scheduler import BudgetExhaustedError, LLMScheduler, TokenBudget
+        now = [0.0]
+        budget = TokenBudget(tokens_per_minute=1000, tokens_per_day=5000, clock=lambda: now[0])
+        budget.settle(0, 800)
+        now[0] = 30.0
+        assert budget.wait_time(100) == 0 and budget.wait_time(500) == 30.0
+        
+        attempts = []
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RuntimeError("Error code: 429 - rate_limit_exceeded")
+            return "ok"
+        
+        scheduler = LLMScheduler(TokenBudget(tokens_per_day=10000), lambda e: "429" in str(e),
+                                 tokens_per_run=1000, backoff_base=0.01)
+        assert asyncio.run(scheduler.run(flaky, usage=lambda: 9200)) == "ok"
+        assert scheduler.retries == 2 and scheduler.should_degrade()
+        try:
+            asyncio.run(scheduler.run(flaky))
+            raise AssertionError("expected the budget to be exhausted")
+        except BudgetExhaustedError:
+            pass
+        
+        # Runs turned away before reaching the LLM cost nothing and leave the estimate alone
+        async def queue_full():
+            raise RuntimeError("Agent queue is full")
+        
+        scheduler = LLMScheduler(TokenBudget(tokens_per_day=10000), lambda e: False, tokens_per_run=3000)
+        for _ in range(3):
+            try:
+                asyncio.run(scheduler.run(queue_full, usage=lambda: 0))
+            except RuntimeError:
+                pass
+        stats = scheduler.stats()
+        assert stats["day_used"] == 0 and stats["reserved"] == 0 and stats["tokens_per_run_estimate"] == 3000, stats
+        
+        # A run held back only by reservations of runs in flight waits for one to settle
+        async def answer():
+            await asyncio.sleep(0.05)
+            return "ok"
+        
+        async def five_at_once(scheduler):
+            return await asyncio.gather(*(scheduler.run(answer, usage=lambda: 0) for _ in range(5)),
+                                        return_exceptions=True)
+        
+        scheduler = LLMScheduler(TokenBudget(tokens_per_minute=12000), lambda e: False, tokens_per_run=3000)
+        assert asyncio.run(five_at_once(scheduler)) == ["ok"] * 5
+        assert scheduler.delayed == 1 and scheduler.stats()["reserved"] == 0
+        print("✅ Scheduler retries rate limits and degrades near the daily budget")
+        return True
+    except Exception as e:
+        print(f"❌ LLM scheduler failed: {e}")
+        return False
+
+def test_intent_router():
+    """Test the relevance guard's intent router against the labeled question set"""
+    print("\nTesting intent router...")
+    try:
+        import json
+        from intent_router import DEFAULT_TEST_SET, evaluate, route
+        with open(DEFAULT_TEST_SET, "r", encoding="utf-8") as f:
+            report = evaluate(json.load(f))
+        for label in ("off_topic", "visualization", "columns"):
+            assert report[label]["precision"] >= 0.95 and report[label]["recall"] >= 0.95, (label, report[label])
+        assert not route("Did travelling alone help passengers survive?").off_topic
+        assert "age" not in route("What message did survivors send?").columns
+        print(f"✅ Intent router scored {report['examples']} labeled questions")
+        return True
+    except Exception as e:
+        print(f"❌ Intent router failed: {e}")
+        return False
+
+def test_metrics():
+    """Test that request traces are exported in Prometheus format"""
+    print("\nTesting metrics...")
+    try:
+        from metrics import QueryMetrics, RequestTrace
+        metrics = QueryMetrics()
+        trace = RequestTrace("/query")
+        with trace.stage("fast_path"):
+            pass
+        trace.source = "fast_path"
+        metrics.observe(trace)
+        body = metrics.render({"agent_running": 0})
+        assert 'titanic_requests_total{endpoint="/query",source="fast_path"} 1' in body
+        assert 'titanic_stage_latency_seconds_count{stage="fast_path"} 1' in body
+        assert metrics.source_share("fast_path") == 1.0
+        print("✅ Metrics rendered in Prometheus format")
+        return True
+    except Exception as e:
+        print(f"❌ Metrics failed: {e}")
+        return False
+
+def test_replay_llm():
+    """Test that the benchmark's fake LLM replays recorded steps and its percentiles use nearest rank"""
+    print("\nTesting benchmark replay...")
+    try:
+        from benchmark import DEFAULT_TRACES, percentile
+        from fake_llm import FALLBACK_STEP, ReplayLLM, load_traces
+        traces = load_traces(DEFAULT_TRACES)
+        llm = ReplayLLM(traces=traces)
+        trace = traces[0]
+        prompt = f"You are working with a pandas dataframe.\nQuestion: {trace['question'].upper()}\nThought:"
+        assert llm.next_step(prompt) == trace["steps"][0]
+        observed = prompt + " ...\nObservation: 0.30\nThought:"
+        assert llm.next_step(observed) == trace["steps"][1]
+        # Past the recorded steps the last one (the final answer) repeats
+        assert llm.next_step(observed + " ...\nObservation: x" * 3) == trace["steps"][-1]
+        assert llm.next_step("Question: What is the weather on Mars?\nThought:") == FALLBACK_STEP
+        assert llm.invoke("Question: What is the weather on Mars?") == FALLBACK_STEP and llm.calls == 1
+        values = [15, 20, 35, 40, 50]
+        assert [percentile(values, p) for p in (0, 30, 40, 50, 100)] == [15, 20, 20, 35, 50]
+        assert percentile([], 50) == 0.0 and percentile([7], 99) == 7
+        print("✅ Recorded steps replay in order and percentiles match nearest rank")
+        return True
+    except Exception as e:
+        print(f"❌ Benchmark replay failed: {e}")
+        return False
+
+def test_prompt_metrics():
+    """Test that prompt sizes per LLM call and prompt tokens saved are measured"""
+    print("\nTesting prompt metrics...")
+    try:
+        import main
+        from metrics import QueryMetrics, RequestTrace
+        metrics = QueryMetrics()
+        trace = RequestTrace("/query")
+        trace.add_llm_call(1300, 40, cached_tokens=1000)
+        trace.add_llm_call(1400, 60)
+        trace.source = "agent"
+        metrics.observe(trace)
+        body = metrics.render({})
+        assert trace.call_prompt_tokens == [1300, 1400] and trace.prompt_tokens == 2700
+        assert "titanic_prompt_tokens_per_call_count 2" in body
+        assert 'titanic_prompt_tokens_saved_total{reason="prefix_cache"} 1000' in body
+        
+        entry, saved_variant = main.default_dataset(), main.AGENT_PROMPT
+        main.AGENT_PROMPT = "compact"
+        main._prompt_profiles.clear()
+        try:
+            profile = main.prompt_profile(entry)
+            compact = RequestTrace("/query")
+            compact.add_llm_call(700, 40)
+            main.record_prompt_savings(compact, entry)
+        finally:
+            main.AGENT_PROMPT = saved_variant
+            main._prompt_profiles.clear()
+        assert 0 < profile["tokens_per_call"] < profile["full_tokens_per_call"]
+        assert compact.prompt_tokens_saved == profile["saved_per_call"]
+        print(f"✅ Compact prompt saves ~{profile['saved_per_call']} tokens per call")
+        return True
+    except Exception as e:
+        print(f"❌ Prompt metrics failed: {e}")
+        return False
+
 def test_api_key():
     """Test that OpenAI API key is configured"""
     print("\nTesting API key configuration...")
@@ -65,6 +818,30 @@ def main():
     results = []
     results.append(("Imports", test_imports()))
     results.append(("Dataset", test_dataset()))
+    results.append(("Fast Path", test_fast_path()))
+    results.append(("Stats Index", test_stats_index()))
+    results.append(("Histograms", test_histograms()))
+    results.append(("Dataset Registry", test_dataset_registry()))
+    results.append(("Sessions", test_sessions()))
+    results.append(("Session Follow-ups", test_session_follow_ups()))
+    results.append(("Answer Cache", test_answer_cache()))
+    results.append(("Shared Stores", test_shared_stores()))
+    results.append(("Pandas Tools", test_pandas_tools()))
+    results.append(("SQL Tools", test_sql_engine()))
+    results.append(("Out-of-Core", test_out_of_core()))
+    results.append(("Code Cache", test_code_cache()))
+    results.append(("Answer Snapshot", test_answer_snapshot()))
+    results.append(("Agent Runner", test_agent_runner()))
+    results.append(("Coalescing", test_coalescing()))
+    results.append(("Batch Queries", test_batch_queries()))
+    results.append(("Query Stream", test_query_stream()))
+    results.append(("Agent Startup", test_agent_startup()))
+    results.append(("LLM Batching", test_llm_batching()))
+    results.append(("LLM Scheduler", test_llm_scheduler()))
+    results.append(("Intent Router", test_intent_router()))
+    results.append(("Metrics", test_metrics()))
+    results.append(("Benchmark Replay", test_replay_llm()))
+    results.append(("Prompt Metrics", test_prompt_metrics()))
     results.append(("API Key", test_api_key()))
     results.append(("Backend", test_backend_server()))
     
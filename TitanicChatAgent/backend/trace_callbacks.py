@@ -0,0 +1,97 @@
+"""
+LangChain callback handler that feeds a RequestTrace.
+
+Counts LLM calls, prompt/completion tokens and pandas tool executions, and
+times LLM and tool calls, for one agent run. Token counts come from the
+provider's usage report when there is one; streamed responses carry no
+usage, so they fall back to counting streamed chunks and estimating the
+prompt size.
+
+StepRecorder keeps the tool calls of a run so the code cache can replay them.
+"""
+import time
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from metrics import RequestTrace, estimate_tokens
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """Records agent LLM and tool activity into a RequestTrace."""
+
+    # Counters only: safe to call inline from both async and thread mode
+    run_inline = True
+
+    def __init__(self, trace: RequestTrace):
+        self.trace = trace
+        self._started = {}  # run_id -> (start time, estimated prompt tokens)
+        self._streamed = {}  # run_id -> streamed chunk count
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs: Any) -> None:
+        self._started[run_id] = (time.perf_counter(), sum(estimate_tokens(p) for p in prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs: Any) -> None:
+        text = "".join(str(m.content) for batch in messages for m in batch)
+        self._started[run_id] = (time.perf_counter(), estimate_tokens(text))
+
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs: Any) -> None:
+        self._streamed[run_id] = self._streamed.get(run_id, 0) + 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs: Any) -> None:
+        start, prompt_estimate = self._started.pop(run_id, (None, 0))
+        streamed = self._streamed.pop(run_id, 0)
+        if start is not None:
+            self.trace.add_time("llm", time.perf_counter() - start)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage.get("prompt_tokens") is not None:
+            # Providers with prompt caching report the reused prefix separately
+            details = usage.get("prompt_tokens_details")
+            cached = (details.get("cached_tokens") or 0) if isinstance(details, dict) else 0
+            self.trace.add_llm_call(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0),
+                                    cached_tokens=cached)
+        else:
+            text = "".join(g.text for batch in response.generations for g in batch)
+            self.trace.add_llm_call(prompt_estimate, streamed or estimate_tokens(text), estimated=True)
+
+    def on_llm_error(self, error, *, run_id, **kwargs: Any) -> None:
+        self._started.pop(run_id, None)
+        self._streamed.pop(run_id, None)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs: Any) -> None:
+        self._started[run_id] = (time.perf_counter(), 0)
+        self.trace.add_tool_call()
+
+    def on_tool_end(self, output, *, run_id, **kwargs: Any) -> None:
+        start, _ = self._started.pop(run_id, (None, 0))
+        if start is not None:
+            self.trace.add_time("tool", time.perf_counter() - start)
+
+    def on_tool_error(self, error, *, run_id, **kwargs: Any) -> None:
+        self.on_tool_end(None, run_id=run_id)
+
+
+class StepRecorder(BaseCallbackHandler):
+    """Collects the (tool, input) pairs of successful tool calls in one agent run."""
+
+    run_inline = True
+    # Parser retries and unknown tool names carry no data the answer depends on
+    IGNORED_TOOLS = ("_Exception", "invalid_tool")
+
+    def __init__(self):
+        self.steps = []
+        self._pending = {}  # run_id -> (tool, input)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name")
+        if name and name not in self.IGNORED_TOOLS:
+            self._pending[run_id] = (name, input_str)
+
+    def on_tool_end(self, output, *, run_id, **kwargs: Any) -> None:
+        step = self._pending.pop(run_id, None)
+        # Typed tools report bad input as "Error: ..." text; such calls changed nothing
+        if step is not None and not str(output).startswith("Error:"):
+            self.steps.append(step)
+
+    def on_tool_error(self, error, *, run_id, **kwargs: Any) -> None:
+        self._pending.pop(run_id, None)
@@ -4,6 +4,8 @@ import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
 import os
+import json
+import uuid
 
 # Page configuration
 st.set_page_config(
@@ -111,82 +113,154 @@ st.markdown("""
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 
 
-# Define visualization rendering function with improved styling
-def render_visualization(viz_config):
-    """Render visualization based on configuration"""
-    if not viz_config:
-        return
-    
+# Dataset info is refetched at most this often instead of on every rerun
+DATASET_INFO_TTL = int(os.getenv("DATASET_INFO_TTL", "300"))
+FIGURE_CACHE_SIZE = int(os.getenv("FIGURE_CACHE_SIZE", "128"))
+
+CHART_LAYOUT = dict(
+    template="plotly_white",
+    font=dict(size=12),
+    title_font_size=16,
+    title_font_color="#1E40AF",
+    paper_bgcolor='rgba(0,0,0,0)'
+)
+GRID = dict(showgrid=True, gridcolor='rgba(0,0,0,0.1)', gridwidth=1)
+
+
+@st.cache_resource
+def get_http_session():
+    """One pooled HTTP session per server process, reused across reruns and users"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_data(ttl=DATASET_INFO_TTL, show_spinner=False)
+def fetch_dataset_info():
+    """GET /dataset/info; failures raise, so they are retried on the next rerun instead of cached"""
+    response = get_http_session().get(f"{API_URL}/dataset/info", timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+
+def visualization_key(viz_config):
+    """Stable cache key for a visualization config"""
+    return json.dumps(viz_config, sort_keys=True, default=str)
+
+
+@st.cache_resource(max_entries=FIGURE_CACHE_SIZE, show_spinner=False)
+def build_figure(viz_key):
+    """Build the Plotly figure for a visualization config (cached by its JSON)"""
+    viz_config = json.loads(viz_key)
     viz_type = viz_config.get("type")
     data = viz_config.get("data")
     title = viz_config.get("title", "")
     
-    try:
-        if viz_type == "histogram":
-            fig = px.histogram(
-                x=data,
-                nbins=30,
-                title=title,
-                labels={"x": viz_config.get("xlabel", ""), "y": viz_config.get("ylabel", "")}
-            )
-            fig.update_layout(
-                template="plotly_white",
-                font=dict(size=12),
-                title_font_size=16,
-                title_font_color="#1E40AF",
-                xaxis=dict(showgrid=True, gridcolor='rgba(0,0,0,0.1)', gridwidth=1),
-                yaxis=dict(showgrid=True, gridcolor='rgba(0,0,0,0.1)', gridwidth=1),
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)'
-            )
-            st.plotly_chart(fig, use_container_width=True)
-        
-        elif viz_type == "bar":
+    if viz_type == "histogram":
+        if isinstance(data, dict):
+            # Pre-binned by the backend: draw one bar per bin
+            edges = data.get("edges", [])
             fig = go.Figure(data=[
                 go.Bar(
-                    x=list(data.keys()),
-                    y=list(data.values()),
+                    x=[(left + right) / 2 for left, right in zip(edges[:-1], edges[1:])],
+                    y=data.get("counts", []),
+                    width=[right - left for left, right in zip(edges[:-1], edges[1:])],
                     marker_color='#3B82F6',
                     marker_line_color='#1E40AF',
-                    marker_line_width=1.5
+                    marker_line_width=1
                 )
             ])
             fig.update_layout(
                 title=title,
                 xaxis_title=viz_config.get("xlabel", ""),
                 yaxis_title=viz_config.get("ylabel", ""),
-                template="plotly_white",
-                font=dict(size=12),
-                title_font_size=16,
-                title_font_color="#1E40AF",
-                xaxis=dict(showgrid=True, gridcolor='rgba(0,0,0,0.1)', gridwidth=1),
-                yaxis=dict(showgrid=True, gridcolor='rgba(0,0,0,0.1)', gridwidth=1),
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)'
+                bargap=0
             )
-            st.plotly_chart(fig, use_container_width=True)
-        
-        elif viz_type == "pie":
-            fig = go.Figure(data=[
-                go.Pie(
-                    labels=list(data.keys()),
-                    values=list(data.values()),
-                    marker=dict(line=dict(color='#ffffff', width=2))
-                )
-            ])
-            fig.update_layout(
+        else:
+            # Raw values (older responses)
+            fig = px.histogram(
+                x=data,
+                nbins=30,
                 title=title,
-                template="plotly_white",
-                font=dict(size=12),
-                title_font_size=16,
-                title_font_color="#1E40AF",
-                paper_bgcolor='rgba(0,0,0,0)'
+                labels={"x": viz_config.get("xlabel", ""), "y": viz_config.get("ylabel", "")}
+            )
+        fig.update_layout(**CHART_LAYOUT, xaxis=GRID, yaxis=GRID, plot_bgcolor='rgba(0,0,0,0)')
+    
+    elif viz_type == "bar":
+        fig = go.Figure(data=[
+            go.Bar(
+                x=list(data.keys()),
+                y=list(data.values()),
+                marker_color='#3B82F6',
+                marker_line_color='#1E40AF',
+                marker_line_width=1.5
+            )
+        ])
+        fig.update_layout(
+            title=title,
+            xaxis_title=viz_config.get("xlabel", ""),
+            yaxis_title=viz_config.get("ylabel", ""),
+            xaxis=GRID,
+            yaxis=GRID,
+            plot_bgcolor='rgba(0,0,0,0)',
+            **CHART_LAYOUT
+        )
+    
+    elif viz_type == "pie":
+        fig = go.Figure(data=[
+            go.Pie(
+                labels=list(data.keys()),
+                values=list(data.values()),
+                marker=dict(line=dict(color='#ffffff', width=2))
             )
-            st.plotly_chart(fig, use_container_width=True)
+        ])
+        fig.update_layout(title=title, **CHART_LAYOUT)
+    else:
+        return None
+    return fig
+
+
+def render_visualization(viz_config, viz_key=None, chart_key=None):
+    """
+    Render a visualization. Pass the message's stored viz_key so history
+    reruns reuse the cached figure without re-serializing the config, and
+    a stable chart_key so Streamlit keeps the chart element between reruns.
+    """
+    if not viz_config:
+        return
+    
+    try:
+        fig = build_figure(viz_key or visualization_key(viz_config))
+        if fig is not None:
+            st.plotly_chart(fig, use_container_width=True, key=chart_key)
     except Exception as e:
         st.error(f"Error rendering visualization: {str(e)}")
 
 
+def stream_answer_tokens(response, status, result):
+    """
+    Parse Server-Sent Events from /query/stream. Yields answer tokens for
+    st.write_stream, shows agent steps in the status box, and stores the
+    final "done" payload in result.
+    """
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            data = json.loads(line[len("data: "):])
+            if event == "token":
+                yield data["text"]
+            elif event == "step":
+                status.write(f"🛠️ Running `{data['tool']}`: `{data['input']}`")
+            elif event == "observation":
+                status.write(f"📋 {data['output']}")
+            elif event == "done":
+                result.update(data)
+
+
 # ========== SIDEBAR ==========
 with st.sidebar:
     st.markdown("### 📋 **Example Questions**")
@@ -231,16 +305,15 @@ with st.sidebar:
     
     # Dataset info
     try:
-        response = requests.get(f"{API_URL}/dataset/info", timeout=5)
-        if response.status_code == 200:
-            info = response.json()
-            st.markdown("### 📊 **Dataset Info**")
-            st.metric("Total Passengers", info["total_passengers"])
-            st.metric("Features", len(info['columns']))
-            
-            with st.expander("📋 View all columns"):
-                st.write(", ".join(info['columns']))
+        dataset_info = fetch_dataset_info()
+        st.markdown("### 📊 **Dataset Info**")
+        st.metric("Total Passengers", dataset_info["total_passengers"])
+        st.metric("Features", len(dataset_info['columns']))
+        
+        with st.expander("📋 View all columns"):
+            st.write(", ".join(dataset_info['columns']))
     except Exception as e:
+        dataset_info = None
         st.warning("⚠️ Backend not connected")
     
     st.divider()
@@ -249,6 +322,12 @@ with st.sidebar:
     if st.session_state.get("messages", []):
         if st.button("🗑️ Clear Chat History", use_container_width=True, type="secondary"):
             st.session_state.messages = []
+            # Drop the server-side conversation too, so follow-ups start fresh
+            try:
+                get_http_session().delete(f"{API_URL}/sessions/{st.session_state.session_id}", timeout=2)
+            except Exception:
+                pass
+            st.session_state.session_id = uuid.uuid4().hex
             st.rerun()
 
 
@@ -264,6 +343,10 @@ st.divider()
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# The backend keeps a compact history per session id for follow-up questions
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
 if "selected_question" in st.session_state:
     user_input = st.session_state.selected_question
     del st.session_state.selected_question
@@ -282,14 +365,14 @@ if not st.session_state.messages:
     with col1:
         st.metric(
             label="Total Passengers",
-            value="891",
+            value=str(dataset_info["total_passengers"]) if dataset_info else "891",
             delta=None
         )
     
     with col2:
         st.metric(
             label="Number of Features",
-            value="12",
+            value=str(len(dataset_info["columns"])) if dataset_info else "12",
             delta=None
         )
     
@@ -310,11 +393,11 @@ if not st.session_state.messages:
     st.divider()
 
 # Display chat history
-for message in st.session_state.messages:
+for index, message in enumerate(st.session_state.messages):
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
         if message.get("visualization"):
-            render_visualization(message["visualization"])
+            render_visualization(message["visualization"], message.get("viz_key"), chart_key=f"chart_{index}")
 
 # Chat input
 if prompt := (user_input or st.chat_input("💬 Ask a question about the Titanic dataset...")):
@@ -324,61 +407,82 @@ if prompt := (user_input or st.chat_input("💬 Ask a question about the Titanic
     with st.chat_message("user"):
         st.markdown(prompt)
     
-    # Get bot response
+    # Get bot response, streamed token by token from /query/stream
     with st.chat_message("assistant"):
-        with st.spinner("🔍 Analyzing Titanic dataset..."):
-            try:
-                response = requests.post(
-                    f"{API_URL}/query",
-                    json={"question": prompt},
-                    timeout=30
-                )
-                
+        status = st.status("🔍 Analyzing Titanic dataset...", expanded=False)
+        answer_placeholder = st.empty()
+        try:
+            with get_http_session().post(
+                f"{API_URL}/query/stream",
+                json={"question": prompt, "session_id": st.session_state.session_id},
+                stream=True,
+                timeout=(5, 60)  # (connect, max wait between streamed events)
+            ) as response:
                 if response.status_code == 200:
-                    data = response.json()
-                    answer = data["answer"]
+                    data = {}
+                    with answer_placeholder.container():
+                        streamed = st.write_stream(stream_answer_tokens(response, status, data))
+                    status.update(label="✅ Analysis complete", state="complete")
+                    answer = data.get("answer", streamed if isinstance(streamed, str) else "")
                     visualization = data.get("visualization")
                     
-                    st.markdown(answer)
+                    # The final payload is authoritative (the backend cleans the answer)
+                    if answer != streamed:
+                        answer_placeholder.markdown(answer)
                     
+                    viz_key = visualization_key(visualization) if visualization else None
                     if visualization:
-                        render_visualization(visualization)
+                        render_visualization(visualization, viz_key,
+                                             chart_key=f"chart_{len(st.session_state.messages)}")
                     
                     # Save to session state
                     st.session_state.messages.append({
                         "role": "assistant",
                         "content": answer,
-                        "visualization": visualization
+                        "visualization": visualization,
+                        "viz_key": viz_key
+                    })
+                elif response.status_code in (429, 503):
+                    status.update(label="⏳ Server busy", state="error")
+                    error_msg = "⏳ **Server Busy:** Too many questions are being answered right now. Please try again in a few seconds."
+                    st.warning(error_msg)
+                    st.session_state.messages.append({
+                        "role": "assistant",
+                        "content": error_msg
                     })
                 else:
+                    status.update(label="⚠️ Request failed", state="error")
                     error_msg = f"⚠️ Error: Server returned status {response.status_code}"
                     st.error(error_msg)
                     st.session_state.messages.append({
                         "role": "assistant",
                         "content": error_msg
                     })
-            
-            except requests.exceptions.ConnectionError:
-                error_msg = "❌ **Connection Error:** Unable to reach the backend API. Please ensure the backend server is running on port 8000."
-                st.error(error_msg)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": error_msg
-                })
-            except requests.exceptions.Timeout:
-                error_msg = "⏱️ **Timeout Error:** The request took too long. Please try again."
-                st.error(error_msg)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": error_msg
-                })
-            except Exception as e:
-                error_msg = f"❌ **Unexpected Error:** {str(e)}"
-                st.error(error_msg)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": error_msg
-                })
+        
+        except requests.exceptions.ConnectionError:
+            status.update(label="❌ Backend unreachable", state="error")
+            error_msg = "❌ **Connection Error:** Unable to reach the backend API. Please ensure the backend server is running on port 8000."
+            st.error(error_msg)
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": error_msg
+            })
+        except requests.exceptions.Timeout:
+            status.update(label="⏱️ Timed out", state="error")
+            error_msg = "⏱️ **Timeout Error:** The request took too long. Please try again."
+            st.error(error_msg)
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": error_msg
+            })
+        except Exception as e:
+            status.update(label="❌ Something went wrong", state="error")
+            error_msg = f"❌ **Unexpected Error:** {str(e)}"
+            st.error(error_msg)
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": error_msg
+            })
 
 # Footer
 st.markdown("<br><br>", unsafe_allow_html=True)
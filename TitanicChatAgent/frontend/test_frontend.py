@@ -0,0 +1,121 @@
+"""
+Simple test script to verify the frontend caches backend calls across reruns
+"""
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+class StubBackend(BaseHTTPRequestHandler):
+    """Answers GET /dataset/info and records (path, client port) per request"""
+    protocol_version = "HTTP/1.1"  # Keep-alive, so pooled connections are reused
+    requests_seen = []
+
+    def do_GET(self):
+        StubBackend.requests_seen.append((self.path, self.client_address[1]))
+        body = json.dumps({"total_passengers": 891, "columns": ["survived", "pclass", "sex"]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_backend():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubBackend)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["API_URL"] = f"http://127.0.0.1:{server.server_port}"
+    return server
+
+def test_dataset_info_cache():
+    """Test that reruns reuse the cached dataset info and refetches reuse the pooled connection"""
+    print("\nTesting dataset info cache...")
+    try:
+        import streamlit as st
+        from streamlit.testing.v1 import AppTest
+        StubBackend.requests_seen.clear()
+        app = AppTest.from_file(APP_PATH, default_timeout=30)
+        for _ in range(3):
+            app.run()
+        assert not app.exception and [metric.value for metric in app.metric][:2] == ["891", "3"]
+        assert [path for path, _ in StubBackend.requests_seen] == ["/dataset/info"]
+        st.cache_data.clear()  # As if the TTL had expired
+        app.run()
+        ports = {port for _, port in StubBackend.requests_seen}
+        assert len(StubBackend.requests_seen) == 2 and len(ports) == 1, StubBackend.requests_seen
+        print("✅ 4 reruns fetched dataset info twice, over one connection")
+        return True
+    except Exception as e:
+        print(f"❌ Dataset info cache failed: {e}")
+        return False
+
+def test_chart_history():
+    """Test that history charts render on every rerun but their figures are built only once"""
+    print("\nTesting chart history...")
+    try:
+        from unittest import mock
+        import plotly.graph_objects as go
+        from streamlit.testing.v1 import AppTest
+        app = AppTest.from_file(APP_PATH, default_timeout=30)
+        app.run()
+        visualization = {"type": "bar", "data": {"male": 577, "female": 314}, "title": "Gender Distribution"}
+        app.session_state["messages"] = [
+            {"role": "user", "content": "How many men and women?"},
+            {"role": "assistant", "content": "577 men and 314 women", "visualization": visualization}
+        ]
+        charts, builds = [], []
+        for _ in range(2):
+            # build_figure constructs one go.Figure per bar chart it builds
+            with mock.patch.object(go, "Figure", wraps=go.Figure) as figure:
+                app.run()
+            assert not app.exception
+            charts.append([chart.proto.spec for chart in app.get("plotly_chart")])
+            builds.append(figure.call_count)
+        assert len(charts[0]) == 1 and charts[0] == charts[1]
+        assert json.loads(charts[0][0])["layout"]["title"]["text"] == "Gender Distribution"
+        assert builds == [1, 0], builds
+        print("✅ History charts render identically across reruns, from a figure built once")
+        return True
+    except Exception as e:
+        print(f"❌ Chart history failed: {e}")
+        return False
+
+def main():
+    print("=" * 50)
+    print("Titanic Chat Agent - Frontend Tests")
+    print("=" * 50)
+
+    server = start_stub_backend()
+    results = []
+    results.append(("Dataset Info Cache", test_dataset_info_cache()))
+    results.append(("Chart History", test_chart_history()))
+    server.shutdown()
+
+    print("\n" + "=" * 50)
+    print("Test Results Summary")
+    print("=" * 50)
+
+    for test_name, passed in results:
+        status = "✅ PASS" if passed else "❌ FAIL"
+        print(f"{test_name:20} {status}")
+
+    all_passed = all(result[1] for result in results)
+
+    print("\n" + "=" * 50)
+    if all_passed:
+        print("🎉 All tests passed! Frontend is ready.")
+    else:
+        print("⚠️  Some tests failed. Please fix the issues above.")
+    print("=" * 50)
+
+    return 0 if all_passed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())